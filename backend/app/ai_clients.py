@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import openai
+
+
+# 客户端缓存配置
+CLIENT_CACHE_MAX_SIZE = 64
+CLIENT_IDLE_TIMEOUT_SECONDS = 600  # 10分钟未使用则关闭连接池
+
+
+class _PooledClient:
+    __slots__ = ("client", "last_used", "in_use", "evicted")
+
+    def __init__(self, client: openai.AsyncOpenAI):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.evicted = False
+
+
+# (base_url, api_key 的哈希) -> _PooledClient，按最近使用排序
+_clients: "OrderedDict[tuple[str, str], _PooledClient]" = OrderedDict()
+
+
+def _cache_key(url: str, api_key: str) -> tuple[str, str]:
+    # 只保存密钥哈希；密钥轮换后哈希不同，会自然得到新的客户端
+    return (url or "", hashlib.sha256(api_key.encode()).hexdigest())
+
+
+def _close_later(entry: _PooledClient) -> None:
+    """淘汰客户端；仍有请求在使用时推迟到最后一个请求结束再关闭"""
+    entry.evicted = True
+    if entry.in_use == 0:
+        asyncio.ensure_future(entry.client.close())
+
+
+def _evict(now: float) -> None:
+    for key, entry in list(_clients.items()):
+        if entry.in_use == 0 and now - entry.last_used > CLIENT_IDLE_TIMEOUT_SECONDS:
+            del _clients[key]
+            _close_later(entry)
+    while len(_clients) > CLIENT_CACHE_MAX_SIZE:
+        _, entry = _clients.popitem(last=False)
+        _close_later(entry)
+
+
+@asynccontextmanager
+async def pooled_client(url: str, api_key: str):
+    """
+    获取复用的 AsyncOpenAI 客户端
+
+    同一 (url, key) 的请求共享一个客户端及其 keep-alive 连接池，
+    避免每步都重新建连和握手。
+    """
+    now = time.monotonic()
+    key = _cache_key(url, api_key)
+    entry = _clients.get(key)
+    if entry is None:
+        client = openai.AsyncOpenAI(api_key=api_key, base_url=url if url else None, max_retries=0)
+        entry = _PooledClient(client)
+        _clients[key] = entry
+    else:
+        _clients.move_to_end(key)
+    entry.last_used = now
+    entry.in_use += 1
+    _evict(now)
+    try:
+        yield entry.client
+    except openai.AuthenticationError:
+        # 密钥失效或已轮换，丢弃该客户端，下次请求重新创建
+        if _clients.get(key) is entry:
+            del _clients[key]
+        entry.evicted = True
+        raise
+    finally:
+        entry.in_use -= 1
+        entry.last_used = time.monotonic()
+        if entry.evicted and entry.in_use == 0:
+            await entry.client.close()
+
+
+async def close_all_clients() -> None:
+    entries = list(_clients.values())
+    _clients.clear()
+    for entry in entries:
+        await entry.client.close()
+
+
+def client_cache_stats() -> dict:
+    return {
+        "clients": len(_clients),
+        "in_use": sum(entry.in_use for entry in _clients.values()),
+        "max_size": CLIENT_CACHE_MAX_SIZE,
+    }
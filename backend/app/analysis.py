@@ -0,0 +1,184 @@
+"""
+棋谱批量分析（需要 numpy）
+
+把一局或多局棋谱的每一步局面叠成 (N, size, size) 的数组，用滑动窗口一次性统计所有局面的棋形：
+- fives：五子连珠的窗口数；
+- fours：四子加一个空位的五格窗口数（冲四、活四都会计入）；
+- open_threes：两端为空、中间四格为三子一空的六格窗口数（活三）；
+- threat_cells：下一手即可成五的不同空位数。
+
+根据 threat_cells 判断必胜方：轮到的一方有成五点即胜；另一方有两个以上成五点且轮到的一方
+无法先成五时也必胜。这只是棋形判断，不做搜索。在此基础上 analyze_games 标记每步的失误：
+放任对手进入必胜（blunder），以及能一步成五却没有下（missed_win）。
+
+numpy 为可选依赖，未安装时 ANALYSIS_AVAILABLE 为 False，调用分析函数会抛出 RuntimeError。
+"""
+try:
+    import numpy as np
+except ImportError:  # 可选依赖
+    np = None
+
+
+ANALYSIS_AVAILABLE = np is not None
+# 每批最多分析的局面数，限制滑动窗口视图展开后的内存
+ANALYSIS_BATCH_SIZE = 4096
+
+PATTERN_NAMES = ("fives", "fours", "open_threes", "threat_cells")
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("Batch analysis requires numpy (pip install numpy)")
+
+
+def replay_positions(moves: list[dict], size: int):
+    """
+    落子记录 -> (len(moves) + 1, size, size) 的 int8 数组
+
+    第 i 个局面是前 i 步之后的棋盘，第 0 个为空棋盘。
+    """
+    _require_numpy()
+    count = len(moves)
+    placed_at = np.full((size, size), count + 1, dtype=np.int32)
+    owner = np.zeros((size, size), dtype=np.int8)
+    for step, move in enumerate(moves, 1):
+        placed_at[move["x"], move["y"]] = step
+        owner[move["x"], move["y"]] = move["player"]
+    steps = np.arange(count + 1, dtype=np.int32)[:, None, None]
+    return np.where(placed_at[None] <= steps, owner[None], 0).astype(np.int8)
+
+
+def _direction_slices(size: int, length: int):
+    """
+    四个方向上长度为 length 的窗口：每个方向返回 length 个 (行切片, 列切片)，
+    第 k 个切片取出所有窗口的第 k 格，结果按窗口起点排列
+    """
+    span = size - length + 1
+    return [
+        [(slice(0, size), slice(k, span + k)) for k in range(length)],                     # 横
+        [(slice(k, span + k), slice(0, size)) for k in range(length)],                     # 竖
+        [(slice(k, span + k), slice(k, span + k)) for k in range(length)],                 # 主对角线
+        [(slice(k, span + k), slice(length - 1 - k, size - k)) for k in range(length)],    # 副对角线
+    ]
+
+
+def _evaluate_chunk(boards) -> dict:
+    batch, size = boards.shape[0], boards.shape[1]
+    empty = boards == 0
+    result = {name: np.zeros((batch, 2), dtype=np.int32) for name in PATTERN_NAMES}
+    threat_maps = [np.zeros(boards.shape, dtype=bool) for _ in range(2)]
+
+    for cells in _direction_slices(size, 5):
+        window_empty = sum(empty[:, rows, cols].astype(np.int8) for rows, cols in cells)
+        for column, player in enumerate((1, 2)):
+            own = sum((boards[:, rows, cols] == player).astype(np.int8) for rows, cols in cells)
+            result["fives"][:, column] += (own == 5).sum(axis=(1, 2))
+            four = (own == 4) & (window_empty == 1)
+            result["fours"][:, column] += four.sum(axis=(1, 2))
+            # 冲四窗口中唯一的空位就是成五点
+            for rows, cols in cells:
+                threat_maps[column][:, rows, cols] |= four & empty[:, rows, cols]
+
+    for cells in _direction_slices(size, 6):
+        ends_empty = empty[:, cells[0][0], cells[0][1]] & empty[:, cells[5][0], cells[5][1]]
+        inner_empty = sum(empty[:, rows, cols].astype(np.int8) for rows, cols in cells[1:5])
+        for column, player in enumerate((1, 2)):
+            inner_own = sum((boards[:, rows, cols] == player).astype(np.int8) for rows, cols in cells[1:5])
+            result["open_threes"][:, column] += (ends_empty & (inner_own == 3) & (inner_empty == 1)).sum(axis=(1, 2))
+
+    for column in range(2):
+        result["threat_cells"][:, column] = threat_maps[column].sum(axis=(1, 2))
+    return result
+
+
+def evaluate_positions(boards) -> dict:
+    """
+    批量评估局面
+
+    参数：
+        boards: (N, size, size) 数组，0 为空，1 为黑，2 为白
+
+    返回：
+        dict: PATTERN_NAMES 中各项为 (N, 2) 数组（第 0 列黑方、第 1 列白方），
+              另有 winner、to_move、forced_winner 三个 (N,) 数组，0 表示无
+    """
+    _require_numpy()
+    boards = np.asarray(boards, dtype=np.int8)
+    if boards.ndim != 3 or boards.shape[1] != boards.shape[2]:
+        raise ValueError("boards must have shape (N, size, size)")
+    chunks = [_evaluate_chunk(boards[start:start + ANALYSIS_BATCH_SIZE])
+              for start in range(0, boards.shape[0], ANALYSIS_BATCH_SIZE)]
+    result = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in PATTERN_NAMES}
+
+    black_count = (boards == 1).sum(axis=(1, 2))
+    white_count = (boards == 2).sum(axis=(1, 2))
+    to_move = np.where(black_count == white_count, 1, 2)
+    winner = np.where(result["fives"][:, 0] > 0, 1, np.where(result["fives"][:, 1] > 0, 2, 0))
+
+    rows = np.arange(boards.shape[0])
+    mover_threats = result["threat_cells"][rows, to_move - 1]
+    other_threats = result["threat_cells"][rows, 2 - to_move]
+    forced = np.where(mover_threats > 0, to_move, np.where(other_threats >= 2, 3 - to_move, 0))
+    result["winner"] = winner
+    result["to_move"] = to_move
+    result["forced_winner"] = np.where(winner > 0, winner, forced)
+    return result
+
+
+def analyze_games(games: list[tuple[list[dict], int]]) -> list[list[dict]]:
+    """
+    批量分析多局棋谱，所有局面合并成同一批评估
+
+    参数：
+        games: [(落子记录, 棋盘大小)]，落子记录为 [{'x', 'y', 'player'}]
+
+    返回：
+        每局一个列表，对应每一步的 {'index', 'player', 'x', 'y', 'fours', 'open_threes',
+        'threat_cells', 'forced_winner', 'blunder', 'missed_win'}，棋形统计为落子方在落子后的数值
+    """
+    _require_numpy()
+    results: list[list[dict]] = [[] for _ in games]
+    by_size: dict[int, list[int]] = {}
+    for index, (_, size) in enumerate(games):
+        by_size.setdefault(size, []).append(index)
+
+    for size, indices in by_size.items():
+        stacks = [replay_positions(games[index][0], size) for index in indices]
+        features = evaluate_positions(np.concatenate(stacks))
+        offset = 0
+        for index, stack in zip(indices, stacks):
+            moves = games[index][0]
+            for step, move in enumerate(moves, 1):
+                before, after = offset + step - 1, offset + step
+                player = move["player"]
+                column = player - 1
+                opponent = 3 - player
+                results[index].append({
+                    "index": step - 1,
+                    "player": player,
+                    "x": move["x"],
+                    "y": move["y"],
+                    "fours": int(features["fours"][after, column]),
+                    "open_threes": int(features["open_threes"][after, column]),
+                    "threat_cells": int(features["threat_cells"][after, column]),
+                    "forced_winner": int(features["forced_winner"][after]),
+                    "blunder": bool(features["forced_winner"][before] != opponent
+                                    and features["forced_winner"][after] == opponent),
+                    "missed_win": bool(features["threat_cells"][before, column] > 0
+                                       and features["winner"][after] != player),
+                })
+            offset += len(stack)
+    return results
+
+
+def summarize_analysis(analysis: list[dict]) -> dict:
+    """单局分析结果按执棋方汇总失误次数"""
+    summary = {}
+    for player in (1, 2):
+        moves = [item for item in analysis if item["player"] == player]
+        summary[player] = {
+            "moves": len(moves),
+            "blunders": sum(item["blunder"] for item in moves),
+            "missed_wins": sum(item["missed_win"] for item in moves),
+        }
+    return summary
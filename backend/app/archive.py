@@ -0,0 +1,338 @@
+"""
+对局归档
+
+结束的对局（房间对局与赛事对局）追加写入紧凑的二进制归档文件，房间被清理后棋谱仍然保留。
+通过环境变量 GOMOKU_ARCHIVE_PATH 指定文件路径后启用，未设置时不归档。
+
+数据文件 <path>：8 字节文件头（b"GKA1" + 版本号）后依次是各局记录：
+- 32 字节记录头：b"GR"、棋盘大小、胜者、标志位、保留、步数、开始/结束时间、元数据长度、CRC32；
+- 每步 2 字节：第一个字节低 7 位为行号 x、最高位为执棋方（0 黑 1 白），第二个字节为列号 y；
+- 元数据：zlib 压缩的 JSON（对局来源、玩家、AI 配置（不含密钥）、日志等）。
+
+索引文件 <path>.idx：每局 16 字节（记录偏移、长度、步数、胜者、棋盘大小），可按局号直接定位。
+两个文件都只追加；索引落后于数据文件时（例如写入中途退出），读取端扫描数据文件补全。
+
+ArchiveReader 通过 mmap 读取，只解码访问到的记录，不会把整个文件读入内存。
+"""
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只支持单进程写入
+    fcntl = None
+
+
+ARCHIVE_VERSION = 1
+FILE_HEADER = b"GKA1" + struct.pack("<HH", ARCHIVE_VERSION, 0)
+RECORD_MAGIC = b"GR"
+# magic, 棋盘大小, 胜者, 标志位, 保留, 步数, 开始时间, 结束时间, 元数据长度, CRC32
+RECORD_HEADER = struct.Struct("<2sBBBBHddII")
+# 记录偏移, 记录长度, 步数, 胜者, 棋盘大小
+INDEX_ENTRY = struct.Struct("<QIHBB")
+
+FLAG_META_COMPRESSED = 1
+FLAG_INCOMPLETE = 2  # 判负、中止等未下完的对局
+
+# 元数据中不保存的 AI 配置字段
+_SECRET_CONFIG_FIELDS = ("key",)
+
+
+def encode_moves(moves: list[dict]) -> bytes:
+    data = bytearray()
+    for move in moves:
+        data.append(move["x"] | ((move["player"] - 1) << 7))
+        data.append(move["y"])
+    return bytes(data)
+
+
+def decode_moves(data) -> list[dict]:
+    return [
+        {"x": data[i] & 0x7F, "y": data[i + 1], "player": (data[i] >> 7) + 1}
+        for i in range(0, len(data), 2)
+    ]
+
+
+def encode_game(moves: list[dict], board_size: int, winner: int, started_at: float | None,
+                finished_at: float | None, meta: dict, complete: bool = True) -> bytes:
+    """把一局棋编码为一条记录"""
+    if board_size > 0x7F:
+        raise ValueError("Board size too large for the archive format")
+    move_bytes = encode_moves(moves)
+    meta_bytes = zlib.compress(json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode())
+    flags = FLAG_META_COMPRESSED | (0 if complete else FLAG_INCOMPLETE)
+    header = RECORD_HEADER.pack(
+        RECORD_MAGIC, board_size, winner, flags, 0, len(moves),
+        started_at or 0.0, finished_at or time.time(), len(meta_bytes),
+        zlib.crc32(meta_bytes, zlib.crc32(move_bytes)),
+    )
+    return header + move_bytes + meta_bytes
+
+
+def decode_game(buffer, offset: int = 0) -> dict:
+    """从 buffer 的 offset 处解码一条记录；buffer 可以是 bytes 或 mmap"""
+    magic, size, winner, flags, _, move_count, started_at, finished_at, meta_len, crc = \
+        RECORD_HEADER.unpack_from(buffer, offset)
+    if magic != RECORD_MAGIC:
+        raise ValueError(f"Bad record magic at offset {offset}")
+    start = offset + RECORD_HEADER.size
+    move_bytes = buffer[start:start + move_count * 2]
+    meta_bytes = buffer[start + move_count * 2:start + move_count * 2 + meta_len]
+    if zlib.crc32(meta_bytes, zlib.crc32(move_bytes)) != crc:
+        raise ValueError(f"Checksum mismatch at offset {offset}")
+    if flags & FLAG_META_COMPRESSED:
+        meta_bytes = zlib.decompress(meta_bytes)
+    return {
+        "board_size": size,
+        "winner": winner,
+        "complete": not flags & FLAG_INCOMPLETE,
+        "started_at": started_at or None,
+        "finished_at": finished_at,
+        "moves": decode_moves(move_bytes),
+        "meta": json.loads(meta_bytes),
+    }
+
+
+def _record_length(buffer, offset: int) -> int:
+    magic, _, _, _, _, move_count, _, _, meta_len, _ = RECORD_HEADER.unpack_from(buffer, offset)
+    if magic != RECORD_MAGIC:
+        raise ValueError(f"Bad record magic at offset {offset}")
+    return RECORD_HEADER.size + move_count * 2 + meta_len
+
+
+class ArchiveReader:
+    """
+    以 mmap 方式只读打开归档
+
+    打开时的文件内容为快照，之后追加的对局需要重新打开才能看到。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = self._map(path)
+        self._index = self._map(path + ".idx")
+        data_size = len(self._data) if self._data is not None else 0
+        if data_size and self._data[:4] != FILE_HEADER[:4]:
+            raise ValueError(f"{path} is not a game archive")
+        index_size = len(self._index) if self._index is not None else 0
+        self._indexed = index_size // INDEX_ENTRY.size
+        # 索引落后于数据文件时扫描补全，只保存在内存中
+        self._extra: list[tuple] = []
+        end = len(FILE_HEADER)
+        if self._indexed:
+            offset, length, *_ = self._entry_from_index(self._indexed - 1)
+            end = offset + length
+        while data_size and end + RECORD_HEADER.size <= data_size:
+            try:
+                length = _record_length(self._data, end)
+            except ValueError:
+                break
+            if end + length > data_size:
+                break
+            _, size, winner, _, _, move_count, *_ = RECORD_HEADER.unpack_from(self._data, end)
+            self._extra.append((end, length, move_count, winner, size))
+            end += length
+
+    @staticmethod
+    def _map(path: str):
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    def _entry_from_index(self, number: int) -> tuple:
+        return INDEX_ENTRY.unpack_from(self._index, number * INDEX_ENTRY.size)
+
+    def __len__(self) -> int:
+        return self._indexed + len(self._extra)
+
+    def entry(self, number: int) -> dict:
+        """只读索引：{'number', 'offset', 'length', 'moves', 'winner', 'board_size'}"""
+        if not 0 <= number < len(self):
+            raise IndexError(number)
+        if number < self._indexed:
+            offset, length, move_count, winner, size = self._entry_from_index(number)
+        else:
+            offset, length, move_count, winner, size = self._extra[number - self._indexed]
+        return {"number": number, "offset": offset, "length": length,
+                "moves": move_count, "winner": winner, "board_size": size}
+
+    def read(self, number: int) -> dict:
+        """解码第 number 局"""
+        game = decode_game(self._data, self.entry(number)["offset"])
+        game["number"] = number
+        return game
+
+    def iter_moves(self, number: int):
+        """逐步产出第 number 局的 (x, y, player)，不解码元数据"""
+        start = self.entry(number)["offset"] + RECORD_HEADER.size
+        move_count = self.entry(number)["moves"]
+        data = self._data
+        for i in range(start, start + move_count * 2, 2):
+            yield data[i] & 0x7F, data[i + 1], (data[i] >> 7) + 1
+
+    def close(self) -> None:
+        for mapped in (self._data, self._index):
+            if mapped is not None:
+                mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameArchive:
+    """
+    归档写入端
+
+    submit 只在内存中排队，由后台任务批量追加到文件；多进程同时写入时用文件锁串行化。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending: list[tuple[bytes, int, int, int]] = []
+        self._task: asyncio.Task | None = None
+        self._stats = {"games_written": 0, "bytes_written": 0, "errors": 0}
+
+    def submit(self, record: bytes, move_count: int, winner: int, board_size: int) -> None:
+        self._pending.append((record, move_count, winner, board_size))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"Archive write error: {e}")
+
+    def _write(self, batch: list[tuple[bytes, int, int, int]]) -> None:
+        with open(self.path, "ab") as data, open(self.path + ".idx", "ab") as index:
+            if fcntl is not None:
+                fcntl.flock(data.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = data.seek(0, os.SEEK_END)
+                if offset == 0:
+                    data.write(FILE_HEADER)
+                    offset = len(FILE_HEADER)
+                entries = bytearray()
+                for record, move_count, winner, board_size in batch:
+                    data.write(record)
+                    entries += INDEX_ENTRY.pack(offset, len(record), move_count, winner, board_size)
+                    offset += len(record)
+                # 先写数据再写索引，中途退出时索引只会落后，读取端可以补全
+                data.flush()
+                index.write(entries)
+                index.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(data.fileno(), fcntl.LOCK_UN)
+        self._stats["games_written"] += len(batch)
+        self._stats["bytes_written"] += sum(len(record) for record, *_ in batch)
+
+    async def close(self) -> None:
+        """写入所有排队中的对局"""
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._drain()
+
+    def stats(self) -> dict:
+        return {"enabled": True, "path": self.path, **self._stats, "pending": len(self._pending)}
+
+
+def public_config(ai_config: dict | None) -> dict | None:
+    if ai_config is None:
+        return None
+    return {key: value for key, value in ai_config.items() if key not in _SECRET_CONFIG_FIELDS}
+
+
+def _create_archive() -> GameArchive | None:
+    path = os.getenv("GOMOKU_ARCHIVE_PATH")
+    return GameArchive(path) if path else None
+
+
+archive = _create_archive()
+
+
+def archive_game(moves: list[dict], board_size: int, winner: int, meta: dict,
+                 started_at: float | None = None, finished_at: float | None = None,
+                 complete: bool = True) -> bool:
+    """归档一局棋，未启用归档时返回 False"""
+    if archive is None:
+        return False
+    record = encode_game(moves, board_size, winner, started_at, finished_at, meta, complete)
+    archive.submit(record, len(moves), winner, board_size)
+    return True
+
+
+def archive_room_game(room_id: str, room: dict) -> bool:
+    """归档房间中刚结束的对局：玩家、AI 配置与日志一并写入元数据"""
+    players = room["players"]
+    meta = {
+        "source": "room",
+        "room_id": room_id,
+        "black": players[0] if players else None,
+        "white": players[1] if len(players) > 1 else None,
+        "ai_configs": {username: public_config(config) for username, config in room["ai_configs"].items()},
+        "logs": room["logs"],
+    }
+    return archive_game(room["moves"], room["board_size"], room["winner"], meta,
+                        room.get("created_at"), time.time())
+
+
+async def close_archive() -> None:
+    if archive is not None:
+        await archive.close()
+
+
+def archive_stats() -> dict:
+    return archive.stats() if archive is not None else {"enabled": False}
+
+
+def open_archive() -> ArchiveReader | None:
+    return ArchiveReader(archive.path) if archive is not None else None
+
+
+_SGF_RESULTS = {1: "B+", 2: "W+", 0: "0"}
+
+
+def to_sgf(game: dict) -> str:
+    """导出为 SGF（GM[4] 为五子棋），坐标按 列、行 的字母表示"""
+    meta = game.get("meta", {})
+    props = [f"FF[4]GM[4]SZ[{game['board_size']}]"]
+    if meta.get("black"):
+        props.append(f"PB[{_sgf_escape(str(meta['black']))}]")
+    if meta.get("white"):
+        props.append(f"PW[{_sgf_escape(str(meta['white']))}]")
+    if game["complete"]:
+        props.append(f"RE[{_SGF_RESULTS.get(game['winner'], '?')}]")
+    nodes = "".join(
+        f";{'B' if move['player'] == 1 else 'W'}[{chr(ord('a') + move['y'])}{chr(ord('a') + move['x'])}]"
+        for move in game["moves"]
+    )
+    return f"(;{''.join(props)}{nodes})\n"
+
+
+def _sgf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("]", "\\]")
+
+
+def to_psq(game: dict) -> str:
+    """导出为 Piskvork 的 PSQ 文本：坐标从 1 开始，按 列,行,用时 排列"""
+    size = game["board_size"]
+    lines = [f"Piskvorky {size}x{size}, 11:11, 0"]
+    lines += [f"{move['y'] + 1},{move['x'] + 1},0" for move in game["moves"]]
+    lines.append("-1")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,164 @@
+from typing import Iterator
+
+
+class Board:
+    """
+    位掩码棋盘：黑白双方各用一个整数保存落子位置
+
+    第 x 行第 y 列对应第 x * (size + 1) + y 位，每行末尾多留一位空位，
+    这样横向、斜向移位时不会从一行末尾串到下一行开头。
+    """
+
+    __slots__ = ("size", "stride", "masks", "stone_count", "last_move")
+
+    def __init__(self, size=15):
+        if size < 5:
+            raise ValueError("Board size must be at least 5")
+        self.size = size
+        self.stride = size + 1
+        self.masks = [0, 0, 0]  # 下标 1 为黑方，2 为白方
+        self.stone_count = 0
+        self.last_move = None
+
+    # 横向、纵向、主对角线、副对角线对应的位移量
+    def _shifts(self):
+        return (1, self.stride, self.stride + 1, self.stride - 1)
+
+    def _index(self, x, y):
+        return x * self.stride + y
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def get(self, x, y):
+        bit = 1 << self._index(x, y)
+        if self.masks[1] & bit:
+            return 1
+        if self.masks[2] & bit:
+            return 2
+        return 0
+
+    def is_empty(self, x, y):
+        return not ((self.masks[1] | self.masks[2]) >> self._index(x, y)) & 1
+
+    def place(self, x, y, player):
+        """落子并返回该子是否形成五连"""
+        if player not in (1, 2):
+            raise ValueError("Player must be 1 or 2")
+        if not self.in_bounds(x, y):
+            raise ValueError("Position out of range")
+        if not self.is_empty(x, y):
+            raise ValueError("Position already occupied")
+        self.masks[player] |= 1 << self._index(x, y)
+        self.stone_count += 1
+        self.last_move = (x, y)
+        return self.is_winning_move(x, y)
+
+    def remove(self, x, y):
+        """撤销 (x, y) 上的棋子，供搜索回溯使用"""
+        bit = 1 << self._index(x, y)
+        for player in (1, 2):
+            if self.masks[player] & bit:
+                self.masks[player] &= ~bit
+                self.stone_count -= 1
+                self.last_move = None
+                return player
+        raise ValueError("Position is empty")
+
+    def is_winning_move(self, x, y):
+        """只检查经过 (x, y) 的四条线上是否存在五连"""
+        player = self.get(x, y)
+        if player == 0:
+            return False
+        mask = self.masks[player]
+        pos = self._index(x, y)
+        for shift in self._shifts():
+            five = mask & (mask >> shift) & (mask >> 2 * shift) & (mask >> 3 * shift) & (mask >> 4 * shift)
+            if not five:
+                continue
+            # 五连的起点必须落在 (x, y) 及其反方向 4 格以内
+            for k in range(5):
+                start = pos - k * shift
+                if start >= 0 and (five >> start) & 1:
+                    return True
+        return False
+
+    def has_five(self, player):
+        mask = self.masks[player]
+        for shift in self._shifts():
+            if mask & (mask >> shift) & (mask >> 2 * shift) & (mask >> 3 * shift) & (mask >> 4 * shift):
+                return True
+        return False
+
+    def winner(self):
+        for player in (1, 2):
+            if self.has_five(player):
+                return player
+        return 0
+
+    def is_full(self):
+        return self.stone_count >= self.size * self.size
+
+    def stones(self, player) -> Iterator[tuple[int, int]]:
+        mask = self.masks[player]
+        while mask:
+            low = mask & -mask
+            x, y = divmod(low.bit_length() - 1, self.stride)
+            yield x, y
+            mask ^= low
+
+    def empty_cells(self) -> Iterator[tuple[int, int]]:
+        occupied = self.masks[1] | self.masks[2]
+        for x in range(self.size):
+            for y in range(self.size):
+                if not (occupied >> self._index(x, y)) & 1:
+                    yield x, y
+
+    def copy(self):
+        other = Board.__new__(type(self))
+        other.size = self.size
+        other.stride = self.stride
+        other.masks = list(self.masks)
+        other.stone_count = self.stone_count
+        other.last_move = self.last_move
+        return other
+
+    def to_rows(self):
+        rows = [[0] * self.size for _ in range(self.size)]
+        for player in (1, 2):
+            for x, y in self.stones(player):
+                rows[x][y] = player
+        return rows
+
+    @classmethod
+    def from_rows(cls, rows):
+        board = cls(len(rows))
+        for x, row in enumerate(rows):
+            if len(row) != board.size:
+                raise ValueError("Board must be square")
+            for y, cell in enumerate(row):
+                if cell in (1, 2):
+                    board.masks[cell] |= 1 << board._index(x, y)
+                    board.stone_count += 1
+                elif cell != 0:
+                    raise ValueError(f"Invalid cell value {cell}")
+        return board
+
+    def to_wire(self):
+        """紧凑的传输格式：'<size>:<黑方掩码十六进制>:<白方掩码十六进制>'"""
+        return f"{self.size}:{self.masks[1]:x}:{self.masks[2]:x}"
+
+    @classmethod
+    def from_wire(cls, text):
+        size, black, white = text.split(":")
+        board = cls(int(size))
+        board.masks[1] = int(black, 16)
+        board.masks[2] = int(white, 16)
+        if board.masks[1] & board.masks[2]:
+            raise ValueError("Overlapping stones in wire board")
+        row_mask = (1 << board.size) - 1
+        valid = sum(row_mask << (x * board.stride) for x in range(board.size))
+        if (board.masks[1] | board.masks[2]) & ~valid:
+            raise ValueError("Stones outside the board in wire board")
+        board.stone_count = board.masks[1].bit_count() + board.masks[2].bit_count()
+        return board
@@ -0,0 +1,126 @@
+import random
+
+from .board import Board
+
+
+BOT_STRATEGIES = ("random", "greedy", "threat")
+CANDIDATE_RADIUS = 2
+
+# 棋形评分：(连子数, 开放端数) -> 分值
+SHAPE_SCORES = {
+    (5, 0): 1_000_000, (5, 1): 1_000_000, (5, 2): 1_000_000,
+    (4, 2): 100_000,
+    (4, 1): 10_000,
+    (3, 2): 5_000,
+    (3, 1): 500,
+    (2, 2): 200,
+    (2, 1): 20,
+    (1, 2): 10,
+    (1, 1): 1,
+}
+
+
+def candidate_moves(board: Board, radius: int = CANDIDATE_RADIUS) -> list[tuple[int, int]]:
+    """已有棋子周围 radius 格内的空位；空棋盘返回天元"""
+    if board.stone_count == 0:
+        center = board.size // 2
+        return [(center, center)]
+    rows = board.to_rows()
+    seen = set()
+    for player in (1, 2):
+        for x, y in board.stones(player):
+            for nx in range(max(0, x - radius), min(board.size, x + radius + 1)):
+                row = rows[nx]
+                for ny in range(max(0, y - radius), min(board.size, y + radius + 1)):
+                    if row[ny] == 0:
+                        seen.add((nx, ny))
+    return sorted(seen) or list(board.empty_cells())
+
+
+def line_shape(rows: list[list[int]], x: int, y: int, dx: int, dy: int, player: int) -> tuple[int, int]:
+    """假设 player 落在 (x, y)，返回该方向的 (连子数, 开放端数)；rows 为 Board.to_rows() 的结果"""
+    size = len(rows)
+    count = 1
+    open_ends = 0
+    for sign in (1, -1):
+        nx, ny = x + sign * dx, y + sign * dy
+        while 0 <= nx < size and 0 <= ny < size and rows[nx][ny] == player:
+            count += 1
+            nx += sign * dx
+            ny += sign * dy
+        if 0 <= nx < size and 0 <= ny < size and rows[nx][ny] == 0:
+            open_ends += 1
+    return min(count, 5), open_ends
+
+
+def shape_score(rows: list[list[int]], x: int, y: int, player: int) -> int:
+    score = 0
+    for dx, dy in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        score += SHAPE_SCORES.get(line_shape(rows, x, y, dx, dy, player), 0)
+    return score
+
+
+def _rng(board: Board, player: int, seed: int) -> random.Random:
+    # 随机数只由种子和局面决定，同一局面总是给出同样的落子
+    return random.Random(f"{seed}:{player}:{board.to_wire()}")
+
+
+def random_move(board: Board, player: int, seed: int = 0) -> tuple[int, int]:
+    return _rng(board, player, seed).choice(candidate_moves(board))
+
+
+def greedy_move(board: Board, player: int, seed: int = 0) -> tuple[int, int]:
+    """只考虑己方：选择能连成最长线的位置"""
+    rng = _rng(board, player, seed)
+    rows = board.to_rows()
+    best_score, best_moves = -1, []
+    for x, y in candidate_moves(board):
+        score = max(line_shape(rows, x, y, dx, dy, player)[0] for dx, dy in ((0, 1), (1, 0), (1, 1), (1, -1)))
+        if score > best_score:
+            best_score, best_moves = score, [(x, y)]
+        elif score == best_score:
+            best_moves.append((x, y))
+    return rng.choice(best_moves)
+
+
+def threat_move(board: Board, player: int, seed: int = 0) -> tuple[int, int]:
+    """同时评估进攻与防守棋形：先成五，再堵五，然后按棋形分值选点"""
+    rng = _rng(board, player, seed)
+    opponent = 3 - player
+    rows = board.to_rows()
+    best_score, best_moves = -1, []
+    for x, y in candidate_moves(board):
+        score = shape_score(rows, x, y, player) + shape_score(rows, x, y, opponent) * 0.9
+        if score > best_score:
+            best_score, best_moves = score, [(x, y)]
+        elif score == best_score:
+            best_moves.append((x, y))
+    return rng.choice(best_moves)
+
+
+_STRATEGIES = {
+    "random": random_move,
+    "greedy": greedy_move,
+    "threat": threat_move,
+}
+
+
+def choose_bot_move(board: Board, player: int, strategy: str = "threat", seed: int = 0) -> tuple[int, int]:
+    if strategy not in _STRATEGIES:
+        raise ValueError(f"Unknown bot strategy: {strategy}")
+    return _STRATEGIES[strategy](board, player, seed)
+
+
+def nearest_empty(board: Board, x: int | None = None, y: int | None = None) -> tuple[int, int] | None:
+    """离 (x, y) 最近的空位（按切比雪夫距离逐圈向外查找），坐标缺省或越界时从天元开始"""
+    center = board.size // 2
+    if x is None or y is None:
+        x, y = center, center
+    x = min(max(x, 0), board.size - 1)
+    y = min(max(y, 0), board.size - 1)
+    for radius in range(board.size):
+        for nx in range(x - radius, x + radius + 1):
+            for ny in range(y - radius, y + radius + 1):
+                if max(abs(nx - x), abs(ny - y)) == radius and board.in_bounds(nx, ny) and board.is_empty(nx, ny):
+                    return nx, ny
+    return None
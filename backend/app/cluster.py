@@ -0,0 +1,314 @@
+"""
+房间锁与多进程模式
+
+room_lock 为每个房间提供互斥区，修改房间状态的流程（确认落子、自动对局、清理）都在其中执行。
+
+设置 GOMOKU_CLUSTER=1（同时需要 GOMOKU_STORE=sqlite）后，多个 uvicorn worker 共享同一个
+SQLite 数据库：
+- room_lock 额外在 room_locks 表中获取带租期的跨进程锁，进入时从数据库刷新房间，
+  退出时同步写回，保证各进程在锁内看到的是最新状态；
+- 每个进程发布的事件写入 room_events 表，其他进程轮询后转发给本进程的 SSE/WebSocket 订阅者；
+- ClusterMiddleware 为带 room_id 的写请求自动加锁，GET 房间时先刷新；写请求结束后只同步写回
+  本请求修改过的房间与会话，其余修改仍由后台批量写入。
+
+会话与赛事仍是进程内状态：用户名可在任意进程自动登记，赛事需在同一进程中查询。
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from .events import current_seq, deliver
+from .shared import rooms, store, apply_stored_room
+from .store import read_room, track_writes
+
+
+CLUSTER_ENABLED = os.getenv("GOMOKU_CLUSTER") == "1"
+CLUSTER_LOCK_TTL_SECONDS = 30
+CLUSTER_LOCK_RETRY_SECONDS = 0.01
+CLUSTER_POLL_INTERVAL_SECONDS = 0.05
+CLUSTER_POLL_BATCH_SIZE = 500
+CLUSTER_EVENT_RETENTION_SECONDS = 600
+# GET 房间时写回最后活动时间的最小间隔，远小于房间的非活跃超时
+CLUSTER_TOUCH_INTERVAL_SECONDS = 10
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# room_id -> 本进程内的房间锁，无人持有时自动回收
+_local_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _local_lock(room_id: str) -> asyncio.Lock:
+    lock = _local_locks.get(room_id)
+    if lock is None:
+        lock = _local_locks[room_id] = asyncio.Lock()
+    return lock
+
+
+class ClusterSync:
+    """跨进程房间锁、刷新与事件转发"""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS room_locks (
+                room_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        row = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM room_events").fetchone()
+        self.last_event_id = row[0]
+        # room_id -> 本进程房间副本对应的版本号
+        self.loaded_versions: dict[str, int] = {}
+        # room_id -> 上次写回最后活动时间的时间
+        self.touched_at: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+        self.stats = {"lock_waits": 0, "refreshes": 0, "events_delivered": 0, "poll_errors": 0}
+
+    def _try_acquire(self, room_id: str) -> bool:
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT INTO room_locks VALUES (?, ?, ?) "
+            "ON CONFLICT(room_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE room_locks.expires_at < ? OR room_locks.owner = excluded.owner",
+            (room_id, WORKER_ID, now + CLUSTER_LOCK_TTL_SECONDS, now),
+        )
+        return cursor.rowcount == 1
+
+    def _release(self, room_id: str) -> None:
+        self.conn.execute("DELETE FROM room_locks WHERE room_id = ? AND owner = ?", (room_id, WORKER_ID))
+
+    async def acquire(self, room_id: str) -> None:
+        while not await asyncio.to_thread(self._try_acquire, room_id):
+            self.stats["lock_waits"] += 1
+            await asyncio.sleep(CLUSTER_LOCK_RETRY_SECONDS)
+
+    async def release(self, room_id: str) -> None:
+        await asyncio.to_thread(self._release, room_id)
+
+    def _read_changes(self, room_id: str, since: int) -> tuple[dict | None, list[tuple]]:
+        """读取房间的最新数据以及版本号大于 since 的事件"""
+        stored = read_room(self.conn, room_id)
+        events = self.conn.execute(
+            "SELECT seq, type, data, ts FROM room_events WHERE room_id = ? AND seq > ? ORDER BY seq",
+            (room_id, since),
+        ).fetchall()
+        return stored, events
+
+    async def refresh(self, room_id: str) -> None:
+        """数据库中的版本比本进程副本新时，先补发缺失的事件，再覆盖房间数据"""
+        known_seq = current_seq(room_id)
+        stored, events = await asyncio.to_thread(self._read_changes, room_id, known_seq)
+        # 已删除且本进程没有事件历史的房间无需补发
+        if stored is not None or known_seq > 0:
+            for seq, event_type, data, ts in events:
+                self._deliver(room_id, seq, event_type, data, ts)
+        if stored is None:
+            if room_id in rooms:
+                apply_stored_room(room_id, None)
+            self.loaded_versions.pop(room_id, None)
+            self.touched_at.pop(room_id, None)
+            return
+        version = stored.get("version", 0)
+        if room_id not in rooms or version > self.loaded_versions.get(room_id, -1):
+            self.stats["refreshes"] += 1
+            apply_stored_room(room_id, stored)
+            self.loaded_versions[room_id] = version
+        else:
+            room = rooms[room_id]
+            room["last_activity"] = max(room["last_activity"], stored["last_activity"])
+
+    def _deliver(self, room_id: str, seq: int, event_type: str, data: str, ts: float) -> None:
+        if deliver({"seq": seq, "type": event_type, "room_id": room_id, "data": json.loads(data), "ts": ts}):
+            self.stats["events_delivered"] += 1
+
+    async def commit(self, room_id: str) -> None:
+        """同步写回本进程对该房间的修改，释放锁之前调用；写入失败时留给后台写入重试"""
+        if await flush_writes({room_id}, set()):
+            self.loaded_versions[room_id] = current_seq(room_id)
+
+    def touch(self, room_id: str) -> None:
+        """写回房间的最后活动时间，避免其他进程误判为非活跃房间；按间隔合并，只更新一个字段"""
+        now = time.time()
+        if now - self.touched_at.get(room_id, 0) < CLUSTER_TOUCH_INTERVAL_SECONDS:
+            return
+        self.touched_at[room_id] = now
+        store.touch_room(room_id, rooms[room_id]["last_activity"])
+
+    def _poll(self) -> list[tuple]:
+        return self.conn.execute(
+            "SELECT id, room_id, seq, type, data, ts FROM room_events WHERE id > ? AND origin != ? ORDER BY id LIMIT ?",
+            (self.last_event_id, WORKER_ID, CLUSTER_POLL_BATCH_SIZE),
+        ).fetchall()
+
+    def _prune(self) -> None:
+        self.conn.execute("DELETE FROM room_events WHERE ts < ?", (time.time() - CLUSTER_EVENT_RETENTION_SECONDS,))
+
+    async def _run(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            rows = []
+            try:
+                rows = await asyncio.to_thread(self._poll)
+                changed = []
+                for event_id, room_id, seq, event_type, data, ts in rows:
+                    self.last_event_id = event_id
+                    self._deliver(room_id, seq, event_type, data, ts)
+                    if room_id not in changed:
+                        changed.append(room_id)
+                for room_id in changed:
+                    await self.refresh(room_id)
+                if time.monotonic() - last_prune > CLUSTER_EVENT_RETENTION_SECONDS / 10:
+                    await asyncio.to_thread(self._prune)
+                    last_prune = time.monotonic()
+            except Exception as e:
+                self.stats["poll_errors"] += 1
+                print(f"Cluster poll error: {e}")
+            if len(rows) < CLUSTER_POLL_BATCH_SIZE:
+                await asyncio.sleep(CLUSTER_POLL_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.conn.close()
+
+
+cluster: ClusterSync | None = None
+
+
+@asynccontextmanager
+async def room_lock(room_id: str):
+    """
+    房间互斥区
+
+    单进程时只是本进程内的 asyncio 锁；多进程模式下还会获取跨进程锁，
+    进入时刷新房间副本，退出时同步写回修改。
+    """
+    async with _local_lock(room_id):
+        if cluster is None:
+            yield
+            return
+        await cluster.acquire(room_id)
+        try:
+            await cluster.refresh(room_id)
+            yield
+            await cluster.commit(room_id)
+        finally:
+            await cluster.release(room_id)
+
+
+async def flush_writes(room_ids: set, session_ids: set) -> bool:
+    """同步写回指定房间与会话的修改，失败时只记录错误（数据已放回写入队列），返回是否成功"""
+    try:
+        await store.flush(room_ids, session_ids)
+        return True
+    except Exception as e:
+        print(f"Cluster flush error: {e}")
+        return False
+
+
+async def refresh_room(room_id: str) -> None:
+    """多进程模式下读取房间前刷新本进程副本"""
+    if cluster is not None:
+        await cluster.refresh(room_id)
+
+
+def start_cluster() -> None:
+    global cluster
+    if not CLUSTER_ENABLED:
+        return
+    if not store.persistent:
+        raise RuntimeError("GOMOKU_CLUSTER=1 requires GOMOKU_STORE=sqlite")
+    store.event_origin = WORKER_ID
+    cluster = ClusterSync(store.path)
+    cluster.start()
+
+
+async def stop_cluster() -> None:
+    global cluster
+    if cluster is not None:
+        await cluster.stop()
+        cluster = None
+
+
+def cluster_stats() -> dict:
+    if cluster is None:
+        return {"enabled": False}
+    return {"enabled": True, "worker": WORKER_ID, "last_event_id": cluster.last_event_id, **cluster.stats}
+
+
+# 这些写接口自行管理房间锁（/step 需要在等待模型时释放锁），中间件不再加锁
+_SELF_LOCKING_PATHS = {"/step", "/confirm_move"}
+
+
+class ClusterMiddleware:
+    """多进程模式下为带 room_id 的写请求加房间锁，GET /rooms/{room_id} 前刷新房间"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if cluster is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if scope["method"] == "GET":
+            parts = path.strip("/").split("/")
+            if len(parts) == 2 and parts[0] == "rooms":
+                await refresh_room(parts[1])
+                await self.app(scope, receive, send)
+                if parts[1] in rooms:
+                    cluster.touch(parts[1])
+                return
+            await self.app(scope, receive, send)
+            return
+
+        # 读取完整请求体以取得 room_id，再原样交给应用
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        room_id = None
+        try:
+            payload = json.loads(body) if body else None
+            if isinstance(payload, dict) and isinstance(payload.get("room_id"), str):
+                room_id = payload["room_id"]
+        except ValueError:
+            pass
+
+        with track_writes() as (room_ids, session_ids):
+            if room_id is not None and path not in _SELF_LOCKING_PATHS:
+                async with room_lock(room_id):
+                    await self.app(scope, replay, send)
+            else:
+                if room_id is not None:
+                    await refresh_room(room_id)
+                await self.app(scope, replay, send)
+        # 新建房间、登录等写请求也同步写回本请求的修改，其他进程随后即可看到
+        if room_ids or session_ids:
+            await flush_writes(room_ids, session_ids)
@@ -0,0 +1,308 @@
+"""
+本地搜索引擎
+
+基于 Board 的 alpha-beta（negamax）搜索，用作基准对手和模型超时时的兜底：
+- 候选点只取已有棋子周围的空位，并按 bots.shape_score 的攻防棋形分值排序、截取前若干个；
+- 叶子节点按所有长度为 5 的窗口评估：只含一方棋子的窗口按子数计分，落子时只增量更新经过该点的窗口；
+- Zobrist 哈希的置换表在同一进程的多次搜索之间共享，同一局后续落子可复用之前的结果；
+- 迭代加深（每次加深两层），每一层完成后记录最佳落子，超出时间预算时返回最后一个完整层的结果；
+- 强度等级 1-5 决定最大深度、时间预算与每层候选数。
+"""
+import random
+import time
+
+from .board import Board
+from .bots import shape_score
+
+
+# 强度等级 -> (最大深度, 时间预算毫秒, 每层候选数)
+ENGINE_LEVELS = {
+    1: (2, 30, 4),
+    2: (2, 100, 10),
+    3: (4, 400, 10),
+    4: (6, 1000, 12),
+    5: (8, 2500, 14),
+}
+DEFAULT_ENGINE_LEVEL = 3
+ENGINE_TT_MAX_ENTRIES = 200_000
+
+WIN_SCORE = 10_000_000
+# 候选点排序时，对手在同一点的棋形按此权重计入（与 threat 机器人一致）
+DEFENSE_WEIGHT = 0.9
+# 五格窗口中只有一方棋子时，按子数计分
+WINDOW_SCORES = (0, 1, 12, 150, 2_000, 100_000)
+
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+# 棋盘大小 -> (每个格子每一方的随机键, 轮到白方时的键)
+_zobrist_tables: dict[int, tuple[list[list[list[int]]], int]] = {}
+# Zobrist 哈希 -> (深度, 类型, 分值, 最佳落子)
+_transpositions: dict[int, tuple[int, int, float, tuple[int, int] | None]] = {}
+# 棋盘大小 -> 每个格子所在的五格窗口编号列表, 窗口总数
+_window_tables: dict[int, tuple[list[list[int]], int]] = {}
+_stats = {"searches": 0, "nodes": 0, "tt_hits": 0, "timeouts": 0}
+
+
+def _windows(size: int) -> tuple[list[list[int]], int]:
+    table = _window_tables.get(size)
+    if table is None:
+        cell_windows = [[] for _ in range(size * size)]
+        count = 0
+        for dx, dy in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for x in range(size):
+                for y in range(size):
+                    end_x, end_y = x + 4 * dx, y + 4 * dy
+                    if not (0 <= end_x < size and 0 <= end_y < size):
+                        continue
+                    for i in range(5):
+                        cell_windows[(x + i * dx) * size + y + i * dy].append(count)
+                    count += 1
+        table = _window_tables[size] = (cell_windows, count)
+    return table
+
+
+def _window_value(black: int, white: int) -> int:
+    """窗口对黑方的分值：只有黑子为正，只有白子为负，双方都有为 0"""
+    if white == 0:
+        return WINDOW_SCORES[black]
+    if black == 0:
+        return -WINDOW_SCORES[white]
+    return 0
+
+
+def _zobrist(size: int) -> tuple[list[list[list[int]]], int]:
+    table = _zobrist_tables.get(size)
+    if table is None:
+        rng = random.Random(f"zobrist:{size}")
+        keys = [[[0, rng.getrandbits(64), rng.getrandbits(64)] for _ in range(size)] for _ in range(size)]
+        table = _zobrist_tables[size] = (keys, rng.getrandbits(64))
+    return table
+
+
+class _Timeout(Exception):
+    pass
+
+
+class _Search:
+    """一次搜索的状态：棋盘副本、行数组（供棋形评分）与当前哈希"""
+
+    def __init__(self, board: Board, player: int, deadline: float, width: int):
+        self.board = board.copy()
+        self.rows = board.to_rows()
+        self.size = board.size
+        self.player = player
+        self.deadline = deadline
+        self.width = width
+        self.nodes = 0
+        self.keys, self.side_key = _zobrist(board.size)
+        self.hash = 0
+        for stone in (1, 2):
+            for x, y in board.stones(stone):
+                self.hash ^= self.keys[x][y][stone]
+        if player == 2:
+            self.hash ^= self.side_key
+        self.stones = list(board.stones(1)) + list(board.stones(2))
+        # 每个五格窗口中 [_, 黑子数, 白子数]，以及全部窗口对黑方的总分
+        self.cell_windows, window_count = _windows(board.size)
+        self.counts = [[0] * window_count for _ in range(3)]
+        self.score = 0
+        # 各方“四子且无对方棋子”的窗口数，即再下一手就能成五的威胁
+        self.fours = [0, 0, 0]
+        for stone in (1, 2):
+            for x, y in board.stones(stone):
+                self._add_stone(x, y, stone, 1)
+
+    def _add_stone(self, x: int, y: int, player: int, delta: int) -> None:
+        black, white = self.counts[1], self.counts[2]
+        counts = self.counts[player]
+        fours = self.fours
+        score = self.score
+        for window in self.cell_windows[x * self.size + y]:
+            b, w = black[window], white[window]
+            score -= _window_value(b, w)
+            fours[1] -= b == 4 and w == 0
+            fours[2] -= w == 4 and b == 0
+            counts[window] += delta
+            b, w = black[window], white[window]
+            score += _window_value(b, w)
+            fours[1] += b == 4 and w == 0
+            fours[2] += w == 4 and b == 0
+        self.score = score
+
+    def _place(self, x: int, y: int, player: int) -> bool:
+        win = self.board.place(x, y, player)
+        self.rows[x][y] = player
+        self.stones.append((x, y))
+        self.hash ^= self.keys[x][y][player] ^ self.side_key
+        self._add_stone(x, y, player, 1)
+        return win
+
+    def _undo(self, x: int, y: int, player: int) -> None:
+        self.board.remove(x, y)
+        self.rows[x][y] = 0
+        self.stones.pop()
+        self.hash ^= self.keys[x][y][player] ^ self.side_key
+        self._add_stone(x, y, player, -1)
+
+    def candidates(self, radius: int) -> list[tuple[int, int]]:
+        if not self.stones:
+            center = self.size // 2
+            return [(center, center)]
+        rows, size = self.rows, self.size
+        seen = set()
+        for x, y in self.stones:
+            for nx in range(max(0, x - radius), min(size, x + radius + 1)):
+                row = rows[nx]
+                for ny in range(max(0, y - radius), min(size, y + radius + 1)):
+                    if row[ny] == 0:
+                        seen.add((nx, ny))
+        return sorted(seen)
+
+    def scored_moves(self, player: int, radius: int) -> list[tuple[float, int, int, int]]:
+        """候选点的 (排序分值, 进攻分值, 防守分值, x, y)，按排序分值从高到低"""
+        opponent = 3 - player
+        scored = []
+        for x, y in self.candidates(radius):
+            attack = shape_score(self.rows, x, y, player)
+            defense = shape_score(self.rows, x, y, opponent)
+            scored.append((attack + defense * DEFENSE_WEIGHT, attack, defense, x, y))
+        scored.sort(key=lambda item: -item[0])
+        return scored
+
+    def negamax(self, depth: int, alpha: float, beta: float, player: int, ply: int) -> tuple[float, tuple[int, int] | None]:
+        self.nodes += 1
+        if time.perf_counter() > self.deadline:
+            raise _Timeout()
+
+        original_alpha = alpha
+        entry = _transpositions.get(self.hash)
+        tt_move = None
+        if entry is not None:
+            tt_depth, flag, value, tt_move = entry
+            if tt_depth >= depth and ply > 0:
+                _stats["tt_hits"] += 1
+                if flag == _EXACT:
+                    return value, tt_move
+                if flag == _LOWER:
+                    alpha = max(alpha, value)
+                elif flag == _UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value, tt_move
+
+        if depth == 0:
+            # 轮到的一方有四即可成五；对方有两处以上的四通常无法同时堵住
+            if self.fours[player]:
+                return WIN_SCORE // 2, None
+            if self.fours[3 - player] >= 2:
+                return -WIN_SCORE // 4, None
+            return (self.score if player == 1 else -self.score), None
+        scored = self.scored_moves(player, 2 if ply == 0 else 1)
+        if not scored:
+            return 0, None
+
+        moves = [(x, y) for _, _, _, x, y in scored[:self.width]]
+        if tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+
+        best_value, best_move = -float("inf"), moves[0]
+        for x, y in moves:
+            if self._place(x, y, player):
+                value = WIN_SCORE - ply
+            elif self.board.is_full():
+                value = 0
+            else:
+                try:
+                    value = -self.negamax(depth - 1, -beta, -alpha, 3 - player, ply + 1)[0]
+                except _Timeout:
+                    # 超时时逐层撤销落子，保证搜索结束后棋盘状态完整
+                    self._undo(x, y, player)
+                    raise
+            self._undo(x, y, player)
+            if value > best_value:
+                best_value, best_move = value, (x, y)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = _UPPER
+        elif best_value >= beta:
+            flag = _LOWER
+        else:
+            flag = _EXACT
+        if len(_transpositions) >= ENGINE_TT_MAX_ENTRIES:
+            _transpositions.clear()
+        _transpositions[self.hash] = (depth, flag, best_value, best_move)
+        return best_value, best_move
+
+
+def _forced_move(board: Board, player: int) -> tuple[tuple[int, int], bool] | None:
+    """一步成五，或堵住对手的一步成五；返回 (落子, 是否成五)"""
+    search_board = board.copy()
+    for stone in (player, 3 - player):
+        for x, y in sorted({
+            (nx, ny)
+            for sx, sy in board.stones(stone)
+            for nx in range(sx - 4, sx + 5)
+            for ny in range(sy - 4, sy + 5)
+            if board.in_bounds(nx, ny) and board.is_empty(nx, ny)
+        }):
+            win = search_board.place(x, y, stone)
+            search_board.remove(x, y)
+            if win:
+                return (x, y), stone == player
+    return None
+
+
+def search_move(board: Board, player: int, level: int = DEFAULT_ENGINE_LEVEL) -> dict:
+    """
+    搜索 player 的最佳落子
+
+    返回：
+        dict: {'move': (x, y), 'depth': 完成的深度, 'nodes': 搜索节点数, 'score': 分值, 'elapsed_ms': 耗时}
+    """
+    if level not in ENGINE_LEVELS:
+        raise ValueError(f"Unknown engine level: {level}")
+    if board.is_full():
+        raise ValueError("Board is full")
+    max_depth, budget_ms, width = ENGINE_LEVELS[level]
+    start = time.perf_counter()
+    _stats["searches"] += 1
+
+    forced = _forced_move(board, player)
+    if forced is not None:
+        move, wins = forced
+        return {"move": move, "depth": 0, "nodes": 0, "score": WIN_SCORE if wins else 0,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    search = _Search(board, player, start + budget_ms / 1000, width)
+    best_move, best_score, completed = None, 0, 0
+    # 只搜索偶数层：奇数层停在己方落子之后，评估会高估己方
+    for depth in range(2, max_depth + 1, 2):
+        try:
+            score, move = search.negamax(depth, -float("inf"), float("inf"), player, 0)
+        except _Timeout:
+            _stats["timeouts"] += 1
+            break
+        best_move, best_score, completed = move, score, depth
+        # 已找到必胜或必败，不必继续加深
+        if abs(score) >= WIN_SCORE - max_depth:
+            break
+    if best_move is None:
+        # 第一层都没有完成时退回到棋形分值最高的点
+        scored = search.scored_moves(player, 2)
+        best_move = (scored[0][3], scored[0][4])
+    _stats["nodes"] += search.nodes
+    return {
+        "move": best_move,
+        "depth": completed,
+        "nodes": search.nodes,
+        "score": best_score,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+def engine_stats() -> dict:
+    return {**_stats, "tt_entries": len(_transpositions)}
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import deque
+
+
+# 事件流配置
+EVENT_HISTORY_SIZE = 200       # 每个房间保留的历史事件数，用于断线续传
+SUBSCRIBER_QUEUE_LIMIT = 500   # 订阅者积压超过该数量时要求其重新同步
+
+
+class Subscription:
+    """单个订阅者的事件队列"""
+
+    __slots__ = ("queue",)
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def push(self, event: dict) -> None:
+        if self.queue.qsize() >= SUBSCRIBER_QUEUE_LIMIT:
+            # 消费过慢，丢弃积压事件，改为让订阅者重新拉取完整快照
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+            return
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float | None = None) -> dict | None:
+        """等待下一条事件，超时返回 None"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RoomEventBus:
+    __slots__ = ("seq", "history", "subscribers")
+
+    def __init__(self):
+        self.seq = 0
+        self.history: deque = deque(maxlen=EVENT_HISTORY_SIZE)
+        self.subscribers: set[Subscription] = set()
+
+
+# room_id -> RoomEventBus
+_buses: dict[str, RoomEventBus] = {}
+# 每条事件发布后同步调用的回调，例如持久化存储
+_listeners: list = []
+
+
+def _get_bus(room_id: str) -> RoomEventBus:
+    bus = _buses.get(room_id)
+    if bus is None:
+        bus = _buses[room_id] = RoomEventBus()
+    return bus
+
+
+def current_seq(room_id: str) -> int:
+    bus = _buses.get(room_id)
+    return bus.seq if bus else 0
+
+
+def add_listener(listener) -> None:
+    _listeners.append(listener)
+
+
+def restore_seq(room_id: str, seq: int) -> None:
+    """从存储恢复房间时沿用原版本号，避免客户端的旧 ETag 误命中"""
+    _get_bus(room_id).seq = seq
+
+
+def publish(room_id: str, event_type: str, data: dict | None = None) -> int:
+    """
+    发布房间事件并推送给所有订阅者
+
+    事件类型包括 move、pending_move、log、chat、ready、lock、config、
+    players、owner、match、error、room_deleted 等。返回事件序号。
+    """
+    bus = _get_bus(room_id)
+    bus.seq += 1
+    event = {
+        "seq": bus.seq,
+        "type": event_type,
+        "room_id": room_id,
+        "data": data or {},
+        "ts": time.time(),
+    }
+    bus.history.append(event)
+    for subscription in list(bus.subscribers):
+        subscription.push(event)
+    for listener in _listeners:
+        listener(event)
+    return bus.seq
+
+
+def deliver(event: dict) -> bool:
+    """
+    投递其他进程发布的事件（多进程模式）
+
+    只推送给本进程的订阅者并记入历史，不调用监听回调；已收到过的事件返回 False。
+    """
+    room_id = event["room_id"]
+    bus = _get_bus(room_id)
+    if event["seq"] <= bus.seq:
+        return False
+    bus.seq = event["seq"]
+    bus.history.append(event)
+    for subscription in list(bus.subscribers):
+        subscription.push(event)
+    if event["type"] == "room_deleted":
+        del _buses[room_id]
+    return True
+
+
+def events_since(room_id: str, since: int) -> list[dict] | None:
+    """返回序号大于 since 的事件；历史已无法完整覆盖时返回 None"""
+    bus = _buses.get(room_id)
+    seq = bus.seq if bus else 0
+    if since > seq:
+        return None
+    if since == seq:
+        return []
+    oldest = bus.history[0]["seq"] if bus.history else seq + 1
+    if since + 1 < oldest:
+        return None
+    return [event for event in bus.history if event["seq"] > since]
+
+
+def subscribe(room_id: str, since: int | None = None) -> tuple[Subscription, list[dict], bool]:
+    """
+    订阅房间事件
+
+    返回 (订阅对象, 需要补发的历史事件, 是否需要先发送完整快照)。
+    since 为客户端最后收到的序号；历史已无法覆盖时要求发送快照。
+    """
+    bus = _get_bus(room_id)
+    subscription = Subscription()
+    bus.subscribers.add(subscription)
+
+    backlog = events_since(room_id, since) if since is not None else None
+    if backlog is None:
+        return subscription, [], True
+    return subscription, backlog, False
+
+
+def unsubscribe(room_id: str, subscription: Subscription) -> None:
+    bus = _buses.get(room_id)
+    if bus is not None:
+        bus.subscribers.discard(subscription)
+
+
+def close_room_events(room_id: str) -> None:
+    """房间被删除时通知订阅者并释放事件历史"""
+    if room_id not in _buses:
+        return
+    publish(room_id, "room_deleted")
+    del _buses[room_id]
+
+
+def subscriber_count(room_id: str) -> int:
+    bus = _buses.get(room_id)
+    return len(bus.subscribers) if bus else 0
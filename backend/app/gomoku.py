@@ -1,52 +1,41 @@
-import openai
+import asyncio
 import json
-from typing import Tuple
+from .board import Board
+from .ai_clients import pooled_client
+from .rate_limit import call_endpoint
+from .bots import choose_bot_move, nearest_empty
+from .engine import search_move, DEFAULT_ENGINE_LEVEL
+from .mock_llm import mock_completion
+from .move_parser import MoveStreamParser, parse_move
+from . import position_cache
+from .prompts import build_prompt, build_conversation, DEFAULT_PROMPT_ENCODING, DEFAULT_CONVERSATION_WINDOW
 
 
 
-class GomokuBoard:
+class GomokuBoard(Board):
     def __init__(self, size=15):
-        self.size = size
-        self.board = [[0 for _ in range(size)] for _ in range(size)]
+        super().__init__(size)
         self.current_player = 1  # 1 for black, 2 for white
+        self.winner_id = 0
 
     def make_move(self, x, y):
-        if self.board[x][y] != 0:
-            raise ValueError("Position already occupied")
-        self.board[x][y] = self.current_player
-        self.current_player = 3 - self.current_player  # Switch player
+        player = self.current_player
+        if self.place(x, y, player):
+            self.winner_id = player
+        self.current_player = 3 - player  # Switch player
 
     def check_winner(self):
-        # Check rows, columns, diagonals
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.board[i][j] != 0:
-                    if self._check_line(i, j, 0, 1) or self._check_line(i, j, 1, 0) or self._check_line(i, j, 1, 1) or self._check_line(i, j, 1, -1):
-                        return self.board[i][j]
-        return 0  # No winner
-
-    def _check_line(self, x, y, dx, dy):
-        player = self.board[x][y]
-        count = 1
-        # Check in positive direction
-        nx, ny = x + dx, y + dy
-        while 0 <= nx < self.size and 0 <= ny < self.size and self.board[nx][ny] == player:
-            count += 1
-            nx += dx
-            ny += dy
-        # Check in negative direction
-        nx, ny = x - dx, y - dy
-        while 0 <= nx < self.size and 0 <= ny < self.size and self.board[nx][ny] == player:
-            count += 1
-            nx -= dx
-            ny -= dy
-        return count >= 5
+        # 胜负在落子时增量判定，这里直接返回结果
+        return self.winner_id
 
     def get_board_state(self):
-        return self.board
+        return self.to_rows()
 
-    def is_full(self):
-        return all(all(cell != 0 for cell in row) for row in self.board)
+    def copy(self):
+        other = super().copy()
+        other.current_player = self.current_player
+        other.winner_id = self.winner_id
+        return other
 
 
 def extract_json_content(text):
@@ -84,68 +73,304 @@ def extract_json_content(text):
     else:
         return []
 
-def get_prompt(board_state, player, error="", custom_prompt=""):
-    prompt = f"""
-    You are playing Gomoku on a 15x15 board. You need to choose your next move.
-
-    # Requirements:
-    1. Respond only with ```json\n{{"x": int, "y": int}}\n```
-    2. Choose an empty position (0). 
-    3. Occupied positions (1 or 2) cannot be chosen.
-    4. Do not include any explanations or additional text.
-    5. The x and y coordinates should be integers between 0 and 14.
-    
-    # Information:
-    1. The board state is: {board_state}. 
-    2. You are player {player}. 
-    3. The following positions are occupied by player 1 (black): {[(i, j) for i in range(15) for j in range(15) if board_state[i][j] == 1]}.
-    4. The following positions are occupied by player 2 (white): {[(i, j) for i in range(15) for j in range(15) if board_state[i][j] == 2]}.
+def get_prompt(board_state, player, error="", custom_prompt="", encoding=DEFAULT_PROMPT_ENCODING, moves=None):
+    """生成落子提示词，encoding 见 prompts.PROMPT_ENCODINGS；moves 为按顺序的落子记录，可选"""
+    return build_prompt(board_state, player, error, custom_prompt, encoding, moves)
+
+AI_REQUEST_TIMEOUT_SECONDS = 60
+# 流式模式在解析到落子后立即停止，可以放宽输出上限，给推理模型留出思考空间
+STREAM_MAX_TOKENS = 2048
+
+# 按提示词模式累计模型返回的 usage：single 为单条消息，conversation 为多轮对话
+_usage_totals = {
+    mode: {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    for mode in ("single", "conversation")
+}
+
+
+def _read_usage(usage) -> dict | None:
+    """读取响应中的 usage；缓存命中数兼容 OpenAI 的 prompt_tokens_details 与 DeepSeek 的 prompt_cache_hit_tokens"""
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "cached_tokens": cached or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+
+
+def _record_usage(mode: str, usage: dict | None) -> None:
+    if usage is None:
+        return
+    totals = _usage_totals[mode]
+    totals["requests"] += 1
+    for key, value in usage.items():
+        totals[key] += value
+
+
+_stream_stats = {"streams": 0, "early_exits": 0, "chars_received": 0}
+
+
+def llm_usage_stats() -> dict:
+    """各提示词模式的 token 用量与前缀缓存命中率，以及流式推理的提前结束次数"""
+    return {
+        **{
+            mode: {
+                **totals,
+                "cache_hit_ratio": round(totals["cached_tokens"] / totals["prompt_tokens"], 4) if totals["prompt_tokens"] else 0.0,
+            }
+            for mode, totals in _usage_totals.items()
+        },
+        "streaming": dict(_stream_stats),
+    }
+
+
+def _legal_checker(board_state):
+    size = len(board_state)
+    return lambda x, y: 0 <= x < size and 0 <= y < size and board_state[x][y] == 0
+
+
+async def _stream_completion(client, model, messages, timeout, board_state):
+    """
+    流式请求模型，解析到合法落子后立即关闭流
+
+    返回 (已收到的文本, usage)；提前结束时拿不到 usage。
     """
-    if error:
-        prompt += f"\n    Previous error: {error}\n"
-    if custom_prompt:
-        prompt += f"\n    Custom instructions: {custom_prompt}\n"
-    return prompt
+    _stream_stats["streams"] += 1
+    parser = MoveStreamParser(_legal_checker(board_state))
+    usage = None
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=STREAM_MAX_TOKENS,
+        timeout=timeout,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if not content:
+                continue
+            _stream_stats["chars_received"] += len(content)
+            if parser.feed(content) is not None:
+                _stream_stats["early_exits"] += 1
+                break
+    finally:
+        # 关闭底层连接，服务端随即停止生成
+        await stream.close()
+    return parser.text, usage
+
 
-def call_ai(board_state, player, api_key, model="gpt-3.5-turbo", url="", error="", custom_prompt=""):
+async def call_ai(board_state, player, api_key, model="gpt-3.5-turbo", url="", error="", custom_prompt="", timeout=AI_REQUEST_TIMEOUT_SECONDS, provider="openai", encoding=DEFAULT_PROMPT_ENCODING, moves=None, conversation=False, conversation_window=DEFAULT_CONVERSATION_WINDOW, stream=False, seed=0):
+    usage = None
     try:
-        client = openai.OpenAI(api_key=api_key, base_url=url if url else None)
-        prompt = get_prompt(board_state, player, error, custom_prompt)
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=50
-        )
-        move_str = response.choices[0].message.content
-        print(move_str)
+        # 多轮对话模式需要完整的落子记录，没有时退回单条消息
+        mode = "conversation" if conversation and moves is not None else "single"
+        if mode == "conversation":
+            messages = build_conversation(board_state, player, moves, error, custom_prompt, encoding, conversation_window)
+        else:
+            messages = [{"role": "user", "content": get_prompt(board_state, player, error, custom_prompt, encoding, moves)}]
+        if provider == "mock":
+            # 进程内模拟模型，同样经过下面的解析流程
+            move_str = await asyncio.wait_for(mock_completion(Board.from_rows(board_state), player, model, seed, error), timeout)
+        else:
+            async with pooled_client(url, api_key) as client:
+                # 客户端超时只约束单次读写，这里再限制整个请求的总耗时（含端点排队与重试）
+                if stream:
+                    move_str, raw_usage = await asyncio.wait_for(
+                        call_endpoint(url, api_key, lambda: _stream_completion(client, model, messages, timeout, board_state)),
+                        timeout,
+                    )
+                else:
+                    response = await asyncio.wait_for(
+                        call_endpoint(url, api_key, lambda: client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            max_tokens=50,
+                            timeout=timeout,
+                        )),
+                        timeout,
+                    )
+                    move_str = response.choices[0].message.content
+                    raw_usage = getattr(response, "usage", None)
+            usage = _read_usage(raw_usage)
+            _record_usage(mode, usage)
         # Try to extract JSON content
         json_data = extract_json_content(move_str)
         if json_data:
             # Assume the first item is the move data
             move_data = json_data[0] if isinstance(json_data, list) and json_data else json_data
         else:
-            # Fallback to direct JSON parse
-            move_data = json.loads(move_str)
+            # 没有 ```json 代码块时，识别推理内容之外的裸 JSON 对象
+            move = parse_move(move_str, _legal_checker(board_state))
+            move_data = {'x': move[0], 'y': move[1]} if move else json.loads(move_str)
         x, y = move_data['x'], move_data['y']
-        return {'move': (x, y), 'log': f'AI player {player} chose ({x},{y})', 'error': None}
+        return {'move': (x, y), 'log': f'AI player {player} chose ({x},{y})', 'error': None, 'usage': usage}
+    except asyncio.TimeoutError:
+        return {'move': None, 'log': f'AI player {player} timed out after {timeout}s', 'error': 'AI响应超时', 'usage': usage}
+    except Exception as e:
+        return {'move': None, 'log': f'AI player {player} error: {str(e)}', 'error': str(e), 'usage': usage}
+
+
+def call_bot(board_state, player, strategy="threat", seed=0):
+    """本地确定性机器人落子，不经过任何模型调用"""
+    try:
+        x, y = choose_bot_move(Board.from_rows(board_state), player, strategy, seed)
+        return {'move': (x, y), 'log': f'Bot player {player} ({strategy}) chose ({x},{y})', 'error': None}
     except Exception as e:
-        return {'move': None, 'log': f'AI player {player} error: {str(e)}', 'error': str(e)}
+        return {'move': None, 'log': f'Bot player {player} error: {str(e)}', 'error': str(e)}
 
 
-def simulate_battle(ai1_config, ai2_config):
-    board = GomokuBoard()
+async def call_engine(board_state, player, level=DEFAULT_ENGINE_LEVEL):
+    """本地搜索引擎落子，搜索在线程中执行，不阻塞事件循环"""
+    try:
+        result = await asyncio.to_thread(search_move, Board.from_rows(board_state), player, level)
+        x, y = result["move"]
+        log = (f'Engine player {player} (level {level}) chose ({x},{y}), '
+               f'depth {result["depth"]}, {result["nodes"]} nodes, {result["elapsed_ms"]:.0f}ms')
+        return {'move': (x, y), 'log': log, 'error': None}
+    except Exception as e:
+        return {'move': None, 'log': f'Engine player {player} error: {str(e)}', 'error': str(e)}
+
+
+async def call_ai_with_config(board_state, player, ai_config, error="", moves=None):
+    """根据 AIConfig 的 provider 选择远程模型、进程内模拟模型、本地机器人或搜索引擎；moves 为按顺序的落子记录"""
+    provider = ai_config.get("provider", "openai")
+    if provider == "bot":
+        return call_bot(board_state, player, ai_config.get("bot", "threat"), ai_config.get("seed", 0))
+    if provider == "engine":
+        return await call_engine(board_state, player, ai_config.get("engine_level", DEFAULT_ENGINE_LEVEL))
+    return await call_ai(
+        board_state,
+        player,
+        ai_config.get("key", ""),
+        ai_config.get("model", "gpt-3.5-turbo"),
+        ai_config.get("url", ""),
+        error,
+        ai_config.get("custom_prompt", ""),
+        ai_config.get("timeout", AI_REQUEST_TIMEOUT_SECONDS),
+        provider=provider,
+        encoding=ai_config.get("prompt_encoding", DEFAULT_PROMPT_ENCODING),
+        moves=moves,
+        conversation=ai_config.get("conversation", False),
+        conversation_window=ai_config.get("conversation_window", DEFAULT_CONVERSATION_WINDOW),
+        stream=ai_config.get("stream", False),
+        seed=ai_config.get("seed", 0),
+    )
+
+
+MAX_MOVE_RETRIES = 3
+# /step 与 /next_move 在一次请求内的默认重试次数，可由 AIConfig.max_retries 覆盖
+DEFAULT_STEP_RETRIES = 2
+MOVE_FALLBACKS = ("none", "nearest", "bot", "engine")
+# 兜底时引擎使用的强度等级，保证在百毫秒内返回
+FALLBACK_ENGINE_LEVEL = 2
+
+
+def fallback_move(board, player, strategy, near=None, seed=0):
+    """
+    用完重试后的兜底落子
+
+    nearest：离模型最后一次给出的坐标最近的空位（没有时从天元开始）；
+    bot：本地 threat 机器人的落子；
+    engine：低强度的本地搜索引擎。
+    """
+    if strategy == "nearest":
+        return nearest_empty(board, *(near or (None, None)))
+    if strategy == "bot":
+        return choose_bot_move(board, player, "threat", seed)
+    if strategy == "engine":
+        return search_move(board, player, FALLBACK_ENGINE_LEVEL)["move"]
+    return None
+
+
+async def request_move(board, player, ai_config, error="", max_retries=MAX_MOVE_RETRIES, moves=None):
+    """
+    调用AI直到得到合法落子或用完重试次数
+
+    参数：
+        board (Board): 当前棋盘
+        player (int): 执棋方
+        ai_config (dict): AI配置，fallback 字段决定用完重试后的兜底策略
+        error (str): 上一次的错误信息，会反馈给模型
+        max_retries (int): 首次调用之外的最大重试次数
+        moves (list): 按顺序的落子记录 [{'x', 'y', 'player'}]，用于 moves 编码的提示词
+
+    返回：
+        dict: {'move': (x, y) 或 None, 'logs': 每次尝试的日志, 'error': 最后的错误,
+               'attempts': 调用模型的次数, 'fallback': 使用的兜底策略或 None}
+    """
+    # 开局库与局面缓存只用于模型调用；带着错误反馈的重试请求不查缓存
+    use_cache = ai_config.get("position_cache", False) and ai_config.get("provider", "openai") not in ("bot", "engine")
+    if use_cache and not error:
+        cached = position_cache.lookup(board.to_rows(), player, ai_config)
+        if cached is not None:
+            (x, y), source = cached
+            log = f"AI player {player} chose ({x},{y}) from the {'opening book' if source == 'book' else 'position cache'}"
+            return {"move": (x, y), "logs": [log], "error": None, "attempts": 0, "fallback": None}
+    logs = []
+    near = None
+    total = max_retries + 1
+    for attempt in range(1, total + 1):
+        result = await call_ai_with_config(board.to_rows(), player, ai_config, error, moves)
+        # 只有真正发生重试时才标注尝试次数，首次尝试的日志与原来一致
+        prefix = f"[{attempt}/{total}] " if attempt > 1 else ""
+        if result["error"]:
+            logs.append(prefix + result["log"])
+            error = result["error"]
+            continue
+        x, y = result["move"]
+        if not isinstance(x, int) or not isinstance(y, int) or not board.in_bounds(x, y):
+            logs.append(f"{prefix}{result['log']}，但位置 ({x},{y}) 超出棋盘范围")
+            error = f"坐标 ({x},{y}) 超出范围"
+            if isinstance(x, int) and isinstance(y, int):
+                near = (x, y)
+            continue
+        if not board.is_empty(x, y):
+            logs.append(f"{prefix}{result['log']}，但位置 ({x},{y}) 已有棋子")
+            error = f"位置 ({x},{y}) 已被占用"
+            near = (x, y)
+            continue
+        logs.append(prefix + result["log"])
+        if use_cache:
+            position_cache.store(board.to_rows(), player, ai_config, (x, y))
+        return {"move": (x, y), "logs": logs, "error": None, "attempts": attempt, "fallback": None}
+
+    strategy = ai_config.get("fallback", "none")
+    # 兜底可能需要搜索，放到线程中执行；传入副本避免与事件循环共享棋盘
+    move = await asyncio.to_thread(fallback_move, board.copy(), player, strategy, near, ai_config.get("seed", 0))
+    if move is not None:
+        x, y = move
+        logs.append(f"AI player {player} 用完 {total} 次尝试，按 {strategy} 策略兜底落子 ({x},{y})")
+        return {"move": move, "logs": logs, "error": None, "attempts": total, "fallback": strategy}
+    return {"move": None, "logs": logs, "error": error, "attempts": total, "fallback": None}
+
+
+async def simulate_battle(ai1_config, ai2_config, size=15, max_retries=MAX_MOVE_RETRIES):
+    board = GomokuBoard(size)
     moves = []
+    history = []
     while True:
         current_player = board.current_player
         ai_config = ai1_config if current_player == 1 else ai2_config
-        try:
-            x, y = call_ai(board.get_board_state(), current_player, ai_config['key'], ai_config.get('model', 'gpt-3.5-turbo'), ai_config.get('url', ''))
-            board.make_move(x, y)
-            moves.append((x, y, current_player))
-            winner = board.check_winner()
-            if winner != 0:
-                return {"winner": winner, "moves": moves}
-            if board.is_full():
-                return {"winner": 0, "moves": moves}  # Draw
-        except Exception as e:
-            return {"error": str(e), "moves": moves}
\ No newline at end of file
+        result = await request_move(board, current_player, ai_config, max_retries=max_retries, moves=history)
+        if result["move"] is None:
+            return {"error": result["error"], "loser": current_player, "moves": moves}
+        x, y = result["move"]
+        board.make_move(x, y)
+        moves.append((x, y, current_player))
+        history.append({"x": x, "y": y, "player": current_player})
+        winner = board.check_winner()
+        if winner != 0:
+            return {"winner": winner, "moves": moves}
+        if board.is_full():
+            return {"winner": 0, "moves": moves}  # Draw
@@ -0,0 +1,86 @@
+"""
+写接口的幂等键
+
+客户端在请求头 Idempotency-Key 中携带同一个键重试时，直接返回首次请求的结果；
+首次请求仍在处理时，重复请求等待同一个结果，不会再次执行。幂等范围包含调用方身份，
+同一个键搭配不同的请求体视为误用，返回 422。
+缓存为进程内存，多进程模式下仅对落在同一 worker 的重试生效。
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+
+IDEMPOTENCY_TTL_SECONDS = 600
+IDEMPOTENCY_MAX_KEYS = 10000
+IDEMPOTENCY_MAX_KEY_LENGTH = 128
+
+# (接口, room_id, 用户名, 幂等键) -> (过期时间, 请求体哈希, 结果 future)
+_entries: "OrderedDict[tuple, tuple[float, str, asyncio.Future]]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "conflicts": 0}
+
+
+def request_fingerprint(payload: dict) -> str:
+    """请求体的哈希，用于识别同一个幂等键被用于不同的请求"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _prune(now: float) -> None:
+    while _entries:
+        key, (expires_at, _, future) = next(iter(_entries.items()))
+        # 仍在处理中的请求不淘汰
+        if not future.done() or (expires_at > now and len(_entries) <= IDEMPOTENCY_MAX_KEYS):
+            break
+        del _entries[key]
+
+
+async def run_idempotent(scope: tuple, key: str | None, func, fingerprint: str = "",
+                         cacheable=lambda result: True):
+    """
+    以 scope + key 为幂等范围执行 func()
+
+    scope 应包含调用方身份，避免其他用户凭同一个键取得结果；fingerprint 为请求体哈希，
+    同一个键搭配不同的请求体时抛出 422。key 为空时直接执行；cacheable(result) 为 False 的结果
+    （例如请求被取消）不缓存，之后的重试会重新执行。func 抛出异常时同样不缓存。
+    """
+    if not key:
+        return await func()
+    key = key[:IDEMPOTENCY_MAX_KEY_LENGTH]
+    now = time.time()
+    _prune(now)
+    entry_key = (*scope, key)
+    entry = _entries.get(entry_key)
+    if entry is not None and entry[0] > now:
+        if entry[1] != fingerprint:
+            _stats["conflicts"] += 1
+            raise HTTPException(status_code=422, detail="Idempotency-Key 已用于不同的请求")
+        _stats["hits"] += 1
+        _entries.move_to_end(entry_key)
+        return await asyncio.shield(entry[2])
+
+    _stats["misses"] += 1
+    future = asyncio.get_running_loop().create_future()
+    _entries[entry_key] = (now + IDEMPOTENCY_TTL_SECONDS, fingerprint, future)
+    try:
+        result = await func()
+    except BaseException as e:
+        _entries.pop(entry_key, None)
+        if isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+            # 没有重复请求在等待时避免 "exception was never retrieved" 警告
+            future.exception()
+        raise
+    future.set_result(result)
+    if not cacheable(result):
+        _entries.pop(entry_key, None)
+    return result
+
+
+def idempotency_stats() -> dict:
+    return {**_stats, "keys": len(_entries)}
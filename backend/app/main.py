@@ -1,8 +1,54 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import auth_router, rooms_router, game_router, messages_router
+from .routes import auth_router, rooms_router, game_router, messages_router, events_router, tournament_router, archive_router
+from .ai_clients import close_all_clients, client_cache_stats
+from .gomoku import llm_usage_stats
+from .engine import engine_stats
+from .archive import close_archive, archive_stats
+from .position_cache import seed_opening_book, position_cache_stats
+from .rate_limit import rate_limit_stats
+from .match_runner import stop_all_matches
+from .tournament import stop_all_tournaments
+from .reaper import start_reaper, stop_reaper, reaper_stats
+from .shared import store, restore_state
+from .cluster import ClusterMiddleware, start_cluster, stop_cluster, cluster_stats
+from .idempotency import idempotency_stats
+from .routes.game import inference_stats
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 从持久化存储恢复房间与会话
+    restore_state()
+    await store.start()
+    # 开局库：内置开局、GOMOKU_OPENING_BOOK 与归档中的历史对局，在后台线程中统计，
+    # 完成前查询只是未命中开局库，不阻塞启动
+    seed_task = asyncio.create_task(asyncio.to_thread(seed_opening_book))
+    # GOMOKU_CLUSTER=1 时与其他 worker 共享房间状态
+    start_cluster()
+    # 后台清理过期房间与会话
+    start_reaper()
+    yield
+    seed_task.cancel()
+    await stop_reaper()
+    await stop_all_matches()
+    await stop_all_tournaments()
+    await stop_cluster()
+    # 写入排队中的归档对局
+    await close_archive()
+    # 写回尚未落盘的状态
+    await store.close()
+    # 关闭复用的AI客户端连接池
+    await close_all_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# 多进程模式下为房间写请求加跨进程锁，未启用时直接透传
+app.add_middleware(ClusterMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,6 +56,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 前端按 ETag 发送 If-None-Match
+    expose_headers=["ETag"],
 )
 
 # 注册路由
@@ -17,7 +65,31 @@ app.include_router(auth_router)
 app.include_router(rooms_router)
 app.include_router(game_router)
 app.include_router(messages_router)
+app.include_router(events_router)
+app.include_router(tournament_router)
+app.include_router(archive_router)
+
+# 设置 GOMOKU_ENABLE_MOCK_LLM=1 时在 /mock/v1 提供模拟模型服务，便于单机压测
+if os.getenv("GOMOKU_ENABLE_MOCK_LLM") == "1":
+    from .mock_llm import app as mock_llm_app
+    app.mount("/mock", mock_llm_app)
 
 @app.get("/")
 async def read_root():
-    return {"Hello": "World"}
\ No newline at end of file
+    return {"Hello": "World"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "reaper": reaper_stats(),
+        "store": store.stats(),
+        "cluster": cluster_stats(),
+        "inference": {**inference_stats, "idempotency": idempotency_stats()},
+        "ai_clients": client_cache_stats(),
+        "endpoints": rate_limit_stats(),
+        "llm_usage": llm_usage_stats(),
+        "engine": engine_stats(),
+        "archive": archive_stats(),
+        "position_cache": position_cache_stats(),
+    }
\ No newline at end of file
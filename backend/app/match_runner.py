@@ -0,0 +1,170 @@
+import asyncio
+
+from .gomoku import request_move
+from .archive import archive_room_game
+from .events import publish
+from .shared import rooms, update_room_activity, append_room_log, set_room_error
+from .cluster import room_lock
+
+
+# 自动对局配置
+MATCH_MOVE_RETRIES = 3     # 每步非法落子或出错时的重试次数
+MATCH_ERROR_BUDGET = 20    # 整局累计允许的失败尝试次数
+
+# room_id -> 正在运行的自动对局任务
+_runners: dict[str, asyncio.Task] = {}
+
+
+def commit_move(room_id: str, x: int, y: int) -> None:
+    """在房间棋盘上落子，更新胜负与轮次并推送 move 事件"""
+    room = rooms[room_id]
+    player = room["current_player"]
+    is_win = room["board"].place(x, y, player)
+    room["moves"].append({"x": x, "y": y, "player": player})
+
+    if is_win:
+        room["winner"] = player
+    elif room["board"].is_full():
+        room["winner"] = 0  # 平局
+    else:
+        room["current_player"] = 3 - player
+
+    room["pending_move"] = None
+    room["can_confirm"] = False
+    if is_win or room["board"].is_full():
+        archive_room_game(room_id, room)
+    publish(room_id, "move", {
+        "x": x,
+        "y": y,
+        "player": player,
+        "current_player": room["current_player"],
+        "winner": room["winner"],
+        "move_count": len(room["moves"]),
+    })
+
+
+def is_game_over(room: dict) -> bool:
+    return room["winner"] != 0 or room["board"].is_full()
+
+
+def is_match_running(room_id: str) -> bool:
+    task = _runners.get(room_id)
+    return task is not None and not task.done()
+
+
+def all_players_ready(room: dict) -> bool:
+    players = room.get("players", [])
+    return len(players) == 2 and all(room["ready_status"].get(player, False) for player in players)
+
+
+def start_match(room_id: str) -> bool:
+    """为房间启动后台自动对局，已在运行时返回 False"""
+    if room_id not in rooms or is_match_running(room_id):
+        return False
+    _set_match_status(room_id, "running")
+    _runners[room_id] = asyncio.ensure_future(_run_match(room_id))
+    return True
+
+
+def maybe_start_match(room_id: str) -> bool:
+    """开启自动对局且双方整备完毕时启动对局"""
+    room = rooms.get(room_id)
+    if not room or not room.get("auto_play") or is_game_over(room):
+        return False
+    if not all_players_ready(room):
+        return False
+    return start_match(room_id)
+
+
+def stop_match(room_id: str) -> bool:
+    task = _runners.pop(room_id, None)
+    if task is None or task.done():
+        return False
+    task.cancel()
+    room = rooms.get(room_id)
+    if room and room.get("match_status") == "running":
+        _set_match_status(room_id, "stopped")
+    return True
+
+
+async def stop_all_matches() -> None:
+    tasks = list(_runners.values())
+    _runners.clear()
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _set_match_status(room_id: str, status: str) -> None:
+    room = rooms[room_id]
+    room["match_status"] = status
+    publish(room_id, "match", {"auto_play": room.get("auto_play", False), "match_status": status})
+
+
+def _finish(room_id: str, status: str, log: str | None = None) -> None:
+    if room_id not in rooms:
+        return
+    if log:
+        append_room_log(room_id, log)
+    _set_match_status(room_id, status)
+    update_room_activity(room_id)
+
+
+async def _run_match(room_id: str) -> None:
+    error_budget = MATCH_ERROR_BUDGET
+    try:
+        while True:
+            room = rooms.get(room_id)
+            if room is None:
+                return
+            if len(room["players"]) != 2:
+                _finish(room_id, "stopped", "玩家离开，自动对局已停止")
+                return
+            if is_game_over(room):
+                _finish(room_id, "finished")
+                return
+
+            player = room["current_player"]
+            username = room["players"][player - 1]
+            ai_config = room["ai_configs"].get(username)
+            if ai_config is None:
+                _finish(room_id, "aborted", f"{username} 未设置AI配置，自动对局中止")
+                return
+
+            result = await request_move(
+                room["board"],
+                player,
+                ai_config,
+                error=room["error"] or "",
+                max_retries=max(0, min(MATCH_MOVE_RETRIES, error_budget)),
+                moves=room["moves"],
+            )
+            async with room_lock(room_id):
+                # 等待模型期间房间可能已被删除、重置，或在其他进程中停止了对局
+                if rooms.get(room_id) is not room or room["match_status"] != "running":
+                    return
+                if room["current_player"] != player or is_game_over(room):
+                    continue
+                for log in result["logs"]:
+                    append_room_log(room_id, log)
+                error_budget -= len(result["logs"]) - (1 if result["move"] else 0)
+
+                if result["move"] is None:
+                    set_room_error(room_id, result["error"])
+                    _finish(room_id, "aborted", f"{username} 未能给出有效落子，自动对局中止")
+                    return
+
+                x, y = result["move"]
+                if not room["board"].is_empty(x, y):
+                    continue
+                set_room_error(room_id, None)
+                commit_move(room_id, x, y)
+                update_room_activity(room_id)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        _finish(room_id, "aborted", f"自动对局异常: {e}")
+    finally:
+        if _runners.get(room_id) is asyncio.current_task():
+            del _runners[room_id]
@@ -0,0 +1,287 @@
+"""
+本地模拟的 OpenAI 兼容模型服务，用于离线压测
+
+可单独运行：python -m app.mock_llm --port 8001 --latency-ms 200 --error-rate 0.05，
+然后把 AIConfig.url 设为 http://127.0.0.1:8001/v1；也可以在 AIConfig 中选择
+provider="mock"，在进程内直接使用同一套模拟逻辑。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .board import Board
+from .bots import choose_bot_move, BOT_STRATEGIES
+from .prompts import parse_prompt, parse_conversation
+
+
+@dataclass
+class MockSettings:
+    latency_ms: float = 200
+    jitter_ms: float = 50
+    error_rate: float = 0.0       # 返回 5xx/429 的概率
+    malformed_rate: float = 0.0   # 返回无法解析或非法落子的概率
+    strategy: str = "threat"
+    seed: int = 0
+    preamble_words: int = 0       # 答案前 <think> 推理内容的词数，答案后还会附一段说明
+    stream_chunk_ms: float = 0    # 流式输出时相邻两段之间的间隔
+    retry_after_ms: float = 0     # 返回 429 时附带的 retry-after-ms 响应头，0 为不附带
+
+    @classmethod
+    def from_env(cls) -> "MockSettings":
+        return cls(
+            latency_ms=float(os.getenv("MOCK_LLM_LATENCY_MS", cls.latency_ms)),
+            jitter_ms=float(os.getenv("MOCK_LLM_JITTER_MS", cls.jitter_ms)),
+            error_rate=float(os.getenv("MOCK_LLM_ERROR_RATE", cls.error_rate)),
+            malformed_rate=float(os.getenv("MOCK_LLM_MALFORMED_RATE", cls.malformed_rate)),
+            strategy=os.getenv("MOCK_LLM_STRATEGY", cls.strategy),
+            seed=int(os.getenv("MOCK_LLM_SEED", cls.seed)),
+            preamble_words=int(os.getenv("MOCK_LLM_PREAMBLE_WORDS", cls.preamble_words)),
+            stream_chunk_ms=float(os.getenv("MOCK_LLM_STREAM_CHUNK_MS", cls.stream_chunk_ms)),
+            retry_after_ms=float(os.getenv("MOCK_LLM_RETRY_AFTER_MS", cls.retry_after_ms)),
+        )
+
+
+settings = MockSettings.from_env()
+
+
+class MockLLMError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def configure(**overrides) -> None:
+    """修改模拟参数"""
+    for key, value in overrides.items():
+        if not hasattr(settings, key):
+            raise ValueError(f"Unknown mock setting: {key}")
+        setattr(settings, key, value)
+
+
+def _rng(board: Board, player: int, seed: int, salt: str) -> random.Random:
+    """
+    每次请求独立的随机数：只取决于种子、局面和 salt（重试时带上的错误信息），
+    同一局在相同种子下可以复现，并发的对局之间互不影响
+    """
+    return random.Random(f"mock:{seed}:{player}:{board.to_wire()}:{salt}")
+
+
+def strategy_for_model(model: str) -> str:
+    """模型名形如 mock-random / mock-greedy / mock-threat 时使用对应策略"""
+    suffix = model.rsplit("-", 1)[-1] if model else ""
+    return suffix if suffix in BOT_STRATEGIES else settings.strategy
+
+
+def _malformed_output(board: Board, rng: random.Random) -> str:
+    occupied = next(board.stones(1), None) or next(board.stones(2), None)
+    choices = [
+        "I think the best move is somewhere in the center.",
+        '```json\n{"x": 7, "y": \n```',
+        f'```json\n{{"x": {board.size + 3}, "y": 0}}\n```',
+    ]
+    if occupied:
+        choices.append(f'```json\n{{"x": {occupied[0]}, "y": {occupied[1]}}}\n```')
+    return rng.choice(choices)
+
+
+async def mock_completion(board: Board, player: int, model: str = "", seed: int | None = None, salt: str = "") -> str:
+    """
+    按配置的延迟、错误率和畸形输出率生成一次模型回复
+
+    seed 缺省时使用 settings.seed；salt 用于区分同一局面上的重试。
+    """
+    seed = settings.seed if seed is None else seed
+    rng = _rng(board, player, seed, salt)
+    delay = max(0.0, settings.latency_ms + rng.uniform(-settings.jitter_ms, settings.jitter_ms)) / 1000
+    if delay:
+        await asyncio.sleep(delay)
+    roll = rng.random()
+    if roll < settings.error_rate:
+        status_code = rng.choice((429, 500, 503))
+        raise MockLLMError(status_code, f"Mock LLM error {status_code}")
+    if roll < settings.error_rate + settings.malformed_rate:
+        return _malformed_output(board, rng)
+    x, y = choose_bot_move(board, player, strategy_for_model(model), seed)
+    answer = f'```json\n{{"x": {x}, "y": {y}}}\n```'
+    if settings.preamble_words:
+        return _verbose_output(board, player, answer)
+    return answer
+
+
+def _verbose_output(board: Board, player: int, answer: str) -> str:
+    """模拟推理模型：先输出 <think> 推理（其中会提到已有棋子的坐标），答案之后还有说明文字"""
+    opponent = next(board.stones(3 - player), None)
+    thoughts = ["Let", "me", "analyze", "the", "position", "carefully."]
+    if opponent:
+        thoughts += ["The", "opponent", "holds", f'{{"x": {opponent[0]}, "y": {opponent[1]}}}.']
+    while len(thoughts) < settings.preamble_words:
+        thoughts += ["Considering", "threats", "and", "open", "lines."]
+    explanation = " ".join(["This", "move", "extends", "my", "line", "and", "blocks", "the", "opponent."] * 5)
+    return f"<think>{' '.join(thoughts)}</think>\n{answer}\n{explanation}"
+
+
+# 流式输出的累计分段数，用于观察客户端提前结束的效果
+_stream_totals = {"pieces_sent": 0}
+
+# 模拟服务商的前缀缓存：(模型, 系统提示词) -> 上一次请求的消息内容
+PREFIX_CACHE_SIZE = 1024
+_prefix_cache: "OrderedDict[tuple[str, str], list[str]]" = OrderedDict()
+
+
+def _cached_prefix_tokens(model: str, messages: list[dict]) -> int:
+    """与同一对话上一次请求逐条相同的前缀消息视为缓存命中"""
+    contents = [str(message.get("content", "")) for message in messages]
+    if not contents or messages[0].get("role") != "system":
+        return 0
+    key = (model, contents[0])
+    previous = _prefix_cache.pop(key, [])
+    _prefix_cache[key] = contents
+    while len(_prefix_cache) > PREFIX_CACHE_SIZE:
+        _prefix_cache.popitem(last=False)
+    cached = 0
+    # 最后一条是新消息，不计入
+    for old, new in zip(previous, contents[:-1]):
+        if old != new:
+            break
+        cached += len(new) // 4
+    return cached
+
+
+app = FastAPI(title="Mock LLM")
+
+
+@app.get("/stats")
+async def stats():
+    return dict(_stream_totals)
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {
+        "object": "list",
+        "data": [{"id": f"mock-{strategy}", "object": "model", "owned_by": "mock"} for strategy in BOT_STRATEGIES],
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "")
+    messages = body.get("messages", [])
+    prompt = next((message["content"] for message in reversed(messages) if message.get("role") == "user"), "")
+    try:
+        if messages and messages[0].get("role") == "system":
+            board, player = parse_conversation(messages)
+        else:
+            board, player = parse_prompt(prompt)
+        # 提示词中带有重试时的错误信息，同一局面的重试会得到不同的结果
+        content = await mock_completion(board, player, model, salt=prompt)
+    except MockLLMError as e:
+        headers = {}
+        if e.status_code == 429 and settings.retry_after_ms:
+            headers["retry-after-ms"] = str(int(settings.retry_after_ms))
+        return JSONResponse({"error": {"message": str(e), "type": "mock_error"}}, status_code=e.status_code, headers=headers)
+    except ValueError as e:
+        return JSONResponse({"error": {"message": str(e), "type": "invalid_request_error"}}, status_code=400)
+
+    prompt_tokens = sum(len(str(message.get("content", ""))) // 4 for message in messages)
+    completion_tokens = len(content) // 4
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": _cached_prefix_tokens(model, messages)},
+    }
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(
+            _stream_chunks(completion_id, model, content, usage if include_usage else None),
+            media_type="text/event-stream",
+        )
+    if settings.stream_chunk_ms:
+        # 非流式请求同样要等全部内容生成完
+        await asyncio.sleep(len(_STREAM_PIECE_PATTERN.findall(content)) * settings.stream_chunk_ms / 1000)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
+
+
+_STREAM_PIECE_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+async def _stream_chunks(completion_id: str, model: str, content: str, usage: dict | None):
+    """按 OpenAI 流式格式逐词输出；客户端断开后停止生成"""
+    created = int(time.time())
+
+    def event(delta: dict, finish_reason=None, chunk_usage=None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+        }
+        if chunk_usage is not None:
+            chunk["usage"] = chunk_usage
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    yield event({"role": "assistant", "content": ""})
+    for piece in _STREAM_PIECE_PATTERN.findall(content):
+        if settings.stream_chunk_ms:
+            await asyncio.sleep(settings.stream_chunk_ms / 1000)
+        _stream_totals["pieces_sent"] += 1
+        yield event({"content": piece})
+    yield event({}, "stop")
+    if usage is not None:
+        yield event(None, chunk_usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM for Gomoku load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=settings.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=settings.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate)
+    parser.add_argument("--malformed-rate", type=float, default=settings.malformed_rate)
+    parser.add_argument("--strategy", choices=BOT_STRATEGIES, default=settings.strategy)
+    parser.add_argument("--seed", type=int, default=settings.seed)
+    parser.add_argument("--preamble-words", type=int, default=settings.preamble_words)
+    parser.add_argument("--stream-chunk-ms", type=float, default=settings.stream_chunk_ms)
+    parser.add_argument("--retry-after-ms", type=float, default=settings.retry_after_ms)
+    args = parser.parse_args()
+    configure(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+        strategy=args.strategy,
+        seed=args.seed,
+        preamble_words=args.preamble_words,
+        stream_chunk_ms=args.stream_chunk_ms,
+        retry_after_ms=args.retry_after_ms,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -12,4 +12,7 @@ from .schemas import (
     SetAIConfigRequest,
     LockConfigRequest,
     SetOwnerColorRequest,
+    SetAutoPlayRequest,
+    TournamentEntry,
+    CreateTournamentRequest,
 )
\ No newline at end of file
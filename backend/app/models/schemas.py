@@ -1,12 +1,31 @@
-from typing import Literal
+from typing import Literal, Optional
 from pydantic import BaseModel, Field
 
 
 class AIConfig(BaseModel):
     url: str = ""
-    key: str
+    key: str = ""
     model: str = "gpt-3.5-turbo"
     custom_prompt: str = Field(default="", max_length=200)
+    timeout: float = Field(default=60, gt=0, le=300)
+    # openai: 远程模型；mock: 进程内模拟模型；bot: 本地确定性机器人；engine: 本地搜索引擎
+    provider: Literal['openai', 'mock', 'bot', 'engine'] = 'openai'
+    bot: Literal['random', 'greedy', 'threat'] = 'threat'
+    engine_level: int = Field(default=3, ge=1, le=5)
+    seed: int = 0
+    # 提示词中的棋盘编码：full 为原始格式，grid / moves / sparse 更紧凑
+    prompt_encoding: Literal['full', 'grid', 'moves', 'sparse'] = 'full'
+    # 多轮对话模式：固定系统提示词 + 逐步追加的落子消息，最多保留 conversation_window 步
+    conversation: bool = False
+    conversation_window: int = Field(default=40, ge=2, le=400)
+    # 流式推理：边接收边解析，得到合法落子后立即结束请求
+    stream: bool = False
+    # /step 与 /next_move 在一次请求内的重试次数，用完后按 fallback 兜底：
+    # none 直接返回错误，nearest 取最近的空位，bot 使用本地机器人落子，engine 使用低强度搜索引擎
+    max_retries: int = Field(default=2, ge=0, le=5)
+    fallback: Literal['none', 'nearest', 'bot', 'engine'] = 'none'
+    # 开局库与局面缓存：相同局面（含对称）复用之前的合法落子，不再请求模型
+    position_cache: bool = False
 
 
 class NextMoveRequest(BaseModel):
@@ -24,6 +43,7 @@ class UpdateUsernameRequest(BaseModel):
 
 class CreateRoomRequest(BaseModel):
     username: str
+    board_size: int = Field(default=15, ge=5, le=25)
 
 
 class JoinRoomRequest(BaseModel):
@@ -74,4 +94,27 @@ class LockConfigRequest(BaseModel):
 class SetOwnerColorRequest(BaseModel):
     room_id: str
     username: str
-    color: Literal['black', 'white']
\ No newline at end of file
+    color: Literal['black', 'white']
+
+
+class SetAutoPlayRequest(BaseModel):
+    room_id: str
+    username: str
+    enabled: bool
+
+
+
+class TournamentEntry(BaseModel):
+    name: str = Field(min_length=1, max_length=50)
+    ai_config: AIConfig
+
+
+class CreateTournamentRequest(BaseModel):
+    entries: list[TournamentEntry] = Field(min_length=2, max_length=64)
+    format: Literal['round_robin', 'swiss'] = 'round_robin'
+    rounds: Optional[int] = Field(default=None, ge=1, le=20)
+    games_per_pair: int = Field(default=2, ge=1, le=10)
+    board_size: int = Field(default=15, ge=5, le=25)
+    max_concurrent_games: int = Field(default=4, ge=1, le=64)
+    max_per_endpoint: int = Field(default=2, ge=1, le=32)
+    max_retries: int = Field(default=3, ge=0, le=10)
@@ -0,0 +1,99 @@
+"""
+模型回复中落子坐标的增量解析
+
+流式推理时每收到一段文本就调用 MoveStreamParser.feed，一旦出现合法（在棋盘内且为空位）的
+{"x": .., "y": ..} 对象立即返回，调用方随即关闭流，不再等待模型输出剩余内容。
+
+- 不要求 ```json 代码块，裸 JSON 或夹在说明文字中的对象都可以识别；
+- <think>...</think> 中的推理内容不参与解析，推理中提到的坐标不会被误当作落子；
+- 推理之外出现的非法坐标（已有棋子或越界）会被跳过，若到结束都没有合法坐标，
+  finish 返回最后一个候选，由调用方按原有流程报告错误。
+"""
+import re
+
+
+_THINK_START = "<think>"
+_THINK_END = "</think>"
+
+# 键可带引号也可不带，x、y 顺序任意
+_MOVE_PATTERN = re.compile(
+    r"""\{\s*["']?(?P<k1>[xy])["']?\s*:\s*(?P<v1>-?\d+)\s*,\s*["']?(?P<k2>[xy])["']?\s*:\s*(?P<v2>-?\d+)\s*\}"""
+)
+
+
+def _candidate(match: re.Match) -> tuple[int, int] | None:
+    if match.group("k1") == match.group("k2"):
+        return None
+    values = {match.group("k1"): int(match.group("v1")), match.group("k2"): int(match.group("v2"))}
+    return values["x"], values["y"]
+
+
+class MoveStreamParser:
+    """
+    增量解析器
+
+    参数：
+        is_legal: (x, y) -> bool，判断坐标能否落子；为 None 时第一个候选即为结果
+    """
+
+    def __init__(self, is_legal=None):
+        self.is_legal = is_legal
+        self.text = ""
+        self.move: tuple[int, int] | None = None
+        self.last_candidate: tuple[int, int] | None = None
+        self._scan_from = 0
+        self._in_think = False
+
+    def feed(self, chunk: str) -> tuple[int, int] | None:
+        """追加一段文本，得到合法落子时返回 (x, y)，否则返回 None"""
+        if self.move is not None:
+            return self.move
+        self.text += chunk
+        text = self.text
+        while True:
+            if self._in_think:
+                end = text.find(_THINK_END, self._scan_from)
+                if end == -1:
+                    # 结束标记可能被截断在两段之间，保留末尾几个字符下次再找
+                    self._scan_from = max(self._scan_from, len(text) - len(_THINK_END))
+                    return None
+                self._in_think = False
+                self._scan_from = end + len(_THINK_END)
+                continue
+            start = text.find(_THINK_START, self._scan_from)
+            region_end = start if start != -1 else len(text)
+            for match in _MOVE_PATTERN.finditer(text, self._scan_from, region_end):
+                move = _candidate(match)
+                if move is None:
+                    continue
+                self.last_candidate = move
+                if self.is_legal is None or self.is_legal(*move):
+                    self.move = move
+                    return move
+            if start == -1:
+                # 最后一个未闭合的 { 可能是尚未收全的对象，从那里继续
+                # <think> 也可能被截断，末尾几个字符同样保留
+                brace = text.rfind("{", self._scan_from)
+                resume = brace if brace != -1 and text.find("}", brace) == -1 else len(text)
+                self._scan_from = max(self._scan_from, min(resume, len(text) - len(_THINK_START) + 1))
+                return None
+            self._in_think = True
+            self._scan_from = start + len(_THINK_START)
+
+    def finish(self) -> tuple[int, int] | None:
+        """流结束后调用：返回合法落子，没有时返回最后一个候选坐标"""
+        if self.move is not None:
+            return self.move
+        if self._in_think:
+            # 推理块没有闭合（例如被 max_tokens 截断），按普通文本再解析一次
+            parser = MoveStreamParser(self.is_legal)
+            parser.feed(self.text.replace(_THINK_START, ""))
+            return parser.finish()
+        return self.last_candidate
+
+
+def parse_move(text: str, is_legal=None) -> tuple[int, int] | None:
+    """一次性解析完整回复"""
+    parser = MoveStreamParser(is_legal)
+    parser.feed(text)
+    return parser.finish()
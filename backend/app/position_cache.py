@@ -0,0 +1,245 @@
+"""
+局面缓存与开局库
+
+AI 对战中开局阶段的局面反复出现，启用 AIConfig.position_cache 后相同局面直接复用之前的落子，
+不再请求模型。适合批量评测这类更看重吞吐而不是复现性的场景。
+
+- 局面先按棋盘的 8 种旋转、翻转取规范形式，对称的局面共用同一条缓存，落子坐标存为规范坐标，
+  命中时再变换回当前棋盘；
+- 缓存键为 (棋盘大小, 规范局面哈希, 执棋方, 模型地址, 模型名, 提示词哈希)，只缓存通过合法性检查的落子；
+- 按 LRU 淘汰，超过 TTL 的条目在读取时丢弃；
+- 开局库与模型无关，优先于缓存查询：内置空棋盘下天元、天元后斜向应对两步，
+  可通过 GOMOKU_OPENING_BOOK 指定 JSON 文件补充，也可用归档中的对局统计胜方的常用应对。
+
+缓存只在进程内共享，容量与 TTL 由 GOMOKU_POSITION_CACHE_SIZE、GOMOKU_POSITION_CACHE_TTL（秒，0 为不过期）设置。
+"""
+import hashlib
+import json
+import os
+import time
+from array import array
+from collections import Counter, OrderedDict
+from itertools import islice
+
+from .archive import open_archive
+
+
+POSITION_CACHE_SIZE = int(os.getenv("GOMOKU_POSITION_CACHE_SIZE", "10000"))
+POSITION_CACHE_TTL_SECONDS = float(os.getenv("GOMOKU_POSITION_CACHE_TTL", "3600"))
+# 从归档对局统计开局库时只看前若干步
+OPENING_BOOK_PLIES = 8
+# 同一局面的应对至少在这么多局胜局中出现才会加入开局库
+OPENING_BOOK_MIN_GAMES = 2
+# 只统计归档中最近的若干局，启动时间与内存不随归档增长
+OPENING_BOOK_ARCHIVE_GAMES = int(os.getenv("GOMOKU_OPENING_BOOK_GAMES", "5000"))
+
+# 8 种对称变换：4 种旋转及其沿主对角线的翻转
+_TRANSFORMS = (
+    lambda x, y, n: (x, y),
+    lambda x, y, n: (y, n - 1 - x),
+    lambda x, y, n: (n - 1 - x, n - 1 - y),
+    lambda x, y, n: (n - 1 - y, x),
+    lambda x, y, n: (y, x),
+    lambda x, y, n: (n - 1 - x, y),
+    lambda x, y, n: (n - 1 - y, n - 1 - x),
+    lambda x, y, n: (x, n - 1 - y),
+)
+# 每种变换的逆变换编号
+_INVERSE = tuple(
+    next(j for j, inverse in enumerate(_TRANSFORMS) if inverse(*transform(1, 2, 7), 7) == (1, 2))
+    for transform in _TRANSFORMS
+)
+
+# 键 -> (规范坐标, 写入时间)
+_cache: OrderedDict[tuple, tuple[tuple[int, int], float]] = OrderedDict()
+# (棋盘大小, 规范局面哈希) -> 规范坐标
+_book: dict[tuple[int, bytes], tuple[int, int]] = {}
+_stats = {"hits": 0, "misses": 0, "book_hits": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+
+def _stones_from_rows(board_state: list[list[int]]) -> list[tuple[int, int, int]]:
+    return [(x, y, cell) for x, row in enumerate(board_state) for y, cell in enumerate(row) if cell]
+
+
+def canonical_position(stones: list[tuple[int, int, int]], size: int) -> tuple[bytes, int]:
+    """
+    局面的规范哈希
+
+    参数：
+        stones: [(x, y, 棋子)]
+        size: 棋盘大小
+
+    返回：
+        (哈希, 变换编号)：把当前局面变换为规范形式所用的变换
+    """
+    best, best_transform = None, 0
+    for index, transform in enumerate(_TRANSFORMS):
+        codes = []
+        for x, y, stone in stones:
+            tx, ty = transform(x, y, size)
+            codes.append((tx * size + ty) * 2 + stone - 1)
+        codes.sort()
+        if best is None or codes < best:
+            best, best_transform = codes, index
+    digest = hashlib.blake2b(array("H", best).tobytes(), digest_size=16).digest()
+    return digest, best_transform
+
+
+def to_canonical(x: int, y: int, size: int, transform: int) -> tuple[int, int]:
+    return _TRANSFORMS[transform](x, y, size)
+
+
+def from_canonical(x: int, y: int, size: int, transform: int) -> tuple[int, int]:
+    return _TRANSFORMS[_INVERSE[transform]](x, y, size)
+
+
+def prompt_hash(ai_config: dict) -> str:
+    """影响提示词的配置（局面之外）"""
+    parts = (
+        ai_config.get("custom_prompt", ""),
+        ai_config.get("prompt_encoding", ""),
+        str(ai_config.get("conversation", False)),
+    )
+    return hashlib.blake2b("\x00".join(parts).encode(), digest_size=8).hexdigest()
+
+
+def _cache_key(size: int, digest: bytes, player: int, ai_config: dict) -> tuple:
+    return (size, digest, player, ai_config.get("url", ""), ai_config.get("model", ""), prompt_hash(ai_config))
+
+
+def lookup(board_state: list[list[int]], player: int, ai_config: dict) -> tuple[tuple[int, int], str] | None:
+    """
+    查询开局库与缓存
+
+    返回：
+        ((x, y), 来源) 或 None，来源为 book 或 cache
+    """
+    size = len(board_state)
+    digest, transform = canonical_position(_stones_from_rows(board_state), size)
+    move = _book.get((size, digest))
+    if move is not None:
+        x, y = from_canonical(*move, size, transform)
+        if board_state[x][y] == 0:
+            _stats["book_hits"] += 1
+            return (x, y), "book"
+
+    key = _cache_key(size, digest, player, ai_config)
+    entry = _cache.get(key)
+    if entry is not None and POSITION_CACHE_TTL_SECONDS and time.monotonic() - entry[1] > POSITION_CACHE_TTL_SECONDS:
+        del _cache[key]
+        _stats["expired"] += 1
+        entry = None
+    if entry is None:
+        _stats["misses"] += 1
+        return None
+    _cache.move_to_end(key)
+    _stats["hits"] += 1
+    return from_canonical(*entry[0], size, transform), "cache"
+
+
+def store(board_state: list[list[int]], player: int, ai_config: dict, move: tuple[int, int]) -> None:
+    """缓存模型给出的合法落子"""
+    size = len(board_state)
+    digest, transform = canonical_position(_stones_from_rows(board_state), size)
+    key = _cache_key(size, digest, player, ai_config)
+    _cache[key] = (to_canonical(*move, size, transform), time.monotonic())
+    _cache.move_to_end(key)
+    _stats["stores"] += 1
+    while len(_cache) > POSITION_CACHE_SIZE:
+        _cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def add_book_move(size: int, moves: list[tuple[int, int]], reply: tuple[int, int]) -> None:
+    """把“按顺序下出 moves 之后应对 reply”加入开局库，黑方先行"""
+    stones = [(x, y, 1 if index % 2 == 0 else 2) for index, (x, y) in enumerate(moves)]
+    digest, transform = canonical_position(stones, size)
+    _book[(size, digest)] = to_canonical(*reply, size, transform)
+
+
+def seed_builtin_book(size: int) -> None:
+    """内置开局：空棋盘下天元，天元之后斜向相邻应对"""
+    center = size // 2
+    add_book_move(size, [], (center, center))
+    add_book_move(size, [(center, center)], (center - 1, center + 1))
+
+
+def load_opening_book(path: str) -> int:
+    """
+    从 JSON 文件补充开局库
+
+    文件为列表，每项为 {"size": 15, "moves": [[x, y], ...], "reply": [x, y]}，返回加入的条数
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    for entry in entries:
+        add_book_move(entry.get("size", 15), [tuple(move) for move in entry["moves"]], tuple(entry["reply"]))
+    return len(entries)
+
+
+def seed_book_from_games(games, plies: int = OPENING_BOOK_PLIES, min_games: int = OPENING_BOOK_MIN_GAMES) -> int:
+    """
+    用已结束的对局统计开局库：取胜方在前 plies 步中对每个局面最常用的应对
+
+    参数：
+        games: 可迭代的 (落子记录, 棋盘大小, 胜者)，落子记录为 [{'x', 'y', 'player'}]
+
+    返回：
+        int: 加入开局库的局面数
+    """
+    replies: dict[tuple[int, bytes], Counter] = {}
+    for moves, size, winner in games:
+        if winner not in (1, 2):
+            continue
+        stones = []
+        for move in moves[:plies]:
+            if move["player"] == winner:
+                digest, transform = canonical_position(stones, size)
+                replies.setdefault((size, digest), Counter())[to_canonical(move["x"], move["y"], size, transform)] += 1
+            stones.append((move["x"], move["y"], move["player"]))
+    added = 0
+    for key, counter in replies.items():
+        reply, count = counter.most_common(1)[0]
+        if count >= min_games and key not in _book:
+            _book[key] = reply
+            added += 1
+    return added
+
+
+def _archived_games(reader, plies: int, limit: int = OPENING_BOOK_ARCHIVE_GAMES):
+    for number in range(max(0, len(reader) - limit), len(reader)):
+        entry = reader.entry(number)
+        moves = [{"x": x, "y": y, "player": player} for x, y, player in islice(reader.iter_moves(number), plies)]
+        yield moves, entry["board_size"], entry["winner"]
+
+
+def seed_opening_book() -> int:
+    """
+    启动时填充开局库：内置开局、GOMOKU_OPENING_BOOK 文件，以及启用归档时的历史对局
+
+    归档只读取最近 OPENING_BOOK_ARCHIVE_GAMES 局。启动时在后台线程中调用，完成前查询不会命中
+    归档统计出的开局。返回内置开局之外加入的条数。
+    """
+    for size in range(5, 26):
+        seed_builtin_book(size)
+    added = 0
+    path = os.getenv("GOMOKU_OPENING_BOOK")
+    if path:
+        added += load_opening_book(path)
+    reader = open_archive()
+    if reader is not None:
+        with reader:
+            added += seed_book_from_games(_archived_games(reader, OPENING_BOOK_PLIES))
+    return added
+
+
+def position_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"] + _stats["book_hits"]
+    return {
+        **_stats,
+        "hit_rate": round((_stats["hits"] + _stats["book_hits"]) / lookups, 4) if lookups else 0.0,
+        "entries": len(_cache),
+        "book_entries": len(_book),
+        "capacity": POSITION_CACHE_SIZE,
+        "ttl_seconds": POSITION_CACHE_TTL_SECONDS,
+    }
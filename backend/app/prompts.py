@@ -0,0 +1,339 @@
+"""
+提示词模板与棋盘编码
+
+棋盘坐标约定：board_state[x][y]，x 为行号，y 为列号。可选编码：
+- full（默认）：原始格式，二维数组加双方棋子坐标列表，与最初的提示词逐字相同，体积最大；
+- grid：带行列号的字符棋盘，. 为空位，X 为黑（1），O 为白（2）；
+- moves：按顺序的落子记录，缺少落子顺序时退化为 sparse；
+- sparse：只列出双方棋子坐标。
+
+规则说明等静态部分按 (棋盘大小, 编码) 预先渲染并缓存，每步只拼接棋盘与错误信息。
+
+多轮对话模式（build_conversation）使用整局不变的系统提示词，之后每步只追加对手的落子，
+支持前缀缓存的服务商可以复用之前的消息；超过窗口的早期落子折叠为一个开局局面。
+"""
+import ast
+import re
+from functools import lru_cache
+
+from .board import Board
+
+
+PROMPT_ENCODINGS = ("full", "grid", "moves", "sparse")
+DEFAULT_PROMPT_ENCODING = "full"
+
+_STONE_CHARS = {0: ".", 1: "X", 2: "O"}
+_CHAR_STONES = {char: stone for stone, char in _STONE_CHARS.items()}
+
+_ENCODING_HINTS = {
+    "full": "The board is given as a nested list board[x][y]: 0 is empty, 1 is player 1 (black), 2 is player 2 (white).",
+    "grid": "The board is given as a grid: rows are x, columns are y; . is empty, X is player 1 (black), O is player 2 (white).",
+    "moves": "The game is given as the list of moves so far in order, each as player:x,y. All other positions are empty.",
+    "sparse": "The board is given as the stones of each player as x,y pairs. All other positions are empty.",
+}
+
+
+@lru_cache(maxsize=None)
+def _static_section(size: int, encoding: str) -> str:
+    """提示词中不随局面变化的部分"""
+    return (
+        f"You are playing Gomoku on a {size}x{size} board. You need to choose your next move.\n"
+        "\n"
+        "# Requirements:\n"
+        '1. Respond only with ```json\n{"x": int, "y": int}\n```\n'
+        "2. Choose an empty position.\n"
+        "3. Occupied positions cannot be chosen.\n"
+        "4. Do not include any explanations or additional text.\n"
+        f"5. The x and y coordinates should be integers between 0 and {size - 1}.\n"
+        "\n"
+        "# Information:\n"
+        f"{_ENCODING_HINTS[encoding]}\n"
+    )
+
+
+@lru_cache(maxsize=None)
+def _grid_header(size: int) -> str:
+    return "  " + "".join(f"{y:>3}" for y in range(size))
+
+
+def encode_full(board_state: list[list[int]]) -> str:
+    size = len(board_state)
+    black = [(i, j) for i in range(size) for j in range(size) if board_state[i][j] == 1]
+    white = [(i, j) for i in range(size) for j in range(size) if board_state[i][j] == 2]
+    return (
+        f"The board state is: {board_state}.\n"
+        f"The following positions are occupied by player 1 (black): {black}.\n"
+        f"The following positions are occupied by player 2 (white): {white}.\n"
+    )
+
+
+def encode_grid(board_state: list[list[int]]) -> str:
+    lines = ["Board:", _grid_header(len(board_state))]
+    for x, row in enumerate(board_state):
+        lines.append(f"{x:>2}" + "".join(f"{_STONE_CHARS[cell]:>3}" for cell in row))
+    return "\n".join(lines) + "\n"
+
+
+def encode_sparse(board_state: list[list[int]]) -> str:
+    stones = {1: [], 2: []}
+    for x, row in enumerate(board_state):
+        for y, cell in enumerate(row):
+            if cell:
+                stones[cell].append(f"{x},{y}")
+    return (
+        f"Black (player 1) stones: {' '.join(stones[1]) or 'none'}\n"
+        f"White (player 2) stones: {' '.join(stones[2]) or 'none'}\n"
+    )
+
+
+def encode_moves(board_state: list[list[int]], moves: list[dict] | None) -> str:
+    if moves is None:
+        return encode_sparse(board_state)
+    history = " ".join(f"{move['player']}:{move['x']},{move['y']}" for move in moves)
+    return f"Moves: {history or 'none'}\n"
+
+
+def encode_board(board_state: list[list[int]], encoding: str = DEFAULT_PROMPT_ENCODING,
+                 moves: list[dict] | None = None) -> str:
+    if encoding == "full":
+        return encode_full(board_state)
+    if encoding == "grid":
+        return encode_grid(board_state)
+    if encoding == "moves":
+        return encode_moves(board_state, moves)
+    if encoding == "sparse":
+        return encode_sparse(board_state)
+    raise ValueError(f"Unknown prompt encoding: {encoding}")
+
+
+@lru_cache(maxsize=None)
+def _full_static_section(size: int) -> str:
+    """原始提示词中棋盘之前的部分，保留原有的缩进与行尾空格"""
+    return (
+        "\n"
+        f"    You are playing Gomoku on a {size}x{size} board. You need to choose your next move.\n"
+        "\n"
+        "    # Requirements:\n"
+        '    1. Respond only with ```json\n{"x": int, "y": int}\n```\n'
+        "    2. Choose an empty position (0). \n"
+        "    3. Occupied positions (1 or 2) cannot be chosen.\n"
+        "    4. Do not include any explanations or additional text.\n"
+        f"    5. The x and y coordinates should be integers between 0 and {size - 1}.\n"
+        "    \n"
+        "    # Information:\n"
+        "    1. The board state is: "
+    )
+
+
+def _full_prompt(board_state, player, error="", custom_prompt=""):
+    """full 编码：与最初的 get_prompt 逐字相同，已有的提示词调优不受影响"""
+    size = len(board_state)
+    black = [(i, j) for i in range(size) for j in range(size) if board_state[i][j] == 1]
+    white = [(i, j) for i in range(size) for j in range(size) if board_state[i][j] == 2]
+    prompt = (
+        _full_static_section(size)
+        + f"{board_state}. \n"
+        f"    2. You are player {player}. \n"
+        f"    3. The following positions are occupied by player 1 (black): {black}.\n"
+        f"    4. The following positions are occupied by player 2 (white): {white}.\n"
+        "    "
+    )
+    if error:
+        prompt += f"\n    Previous error: {error}\n"
+    if custom_prompt:
+        prompt += f"\n    Custom instructions: {custom_prompt}\n"
+    return prompt
+
+
+def build_prompt(board_state, player, error="", custom_prompt="", encoding=DEFAULT_PROMPT_ENCODING, moves=None):
+    """拼接缓存的静态部分与当前局面"""
+    if encoding == "full":
+        return _full_prompt(board_state, player, error, custom_prompt)
+    prompt = (
+        _static_section(len(board_state), encoding)
+        + encode_board(board_state, encoding, moves)
+        + f"You are player {player}.\n"
+    )
+    if error:
+        prompt += f"\nPrevious error: {error}\n"
+    if custom_prompt:
+        prompt += f"\nCustom instructions: {custom_prompt}\n"
+    return prompt
+
+
+DEFAULT_CONVERSATION_WINDOW = 40
+
+_CONVERSATION_HINT = (
+    "This is a multi-turn game. The first message shows the position, each following message reports "
+    "the opponent's latest moves as x,y, and each of your replies is your move in the required format.\n"
+)
+_OPPONENT_MOVE = "Opponent played {x},{y}."
+_EMPTY_BOARD = "The board is empty."
+
+
+@lru_cache(maxsize=256)
+def conversation_system_prompt(size: int, player: int, encoding: str = DEFAULT_PROMPT_ENCODING,
+                               custom_prompt: str = "") -> str:
+    """多轮对话模式的系统提示词，整局不变，便于服务端缓存前缀"""
+    prompt = _static_section(size, encoding) + _CONVERSATION_HINT + f"You are player {player}.\n"
+    if custom_prompt:
+        prompt += f"\nCustom instructions: {custom_prompt}\n"
+    return prompt
+
+
+def conversation_start(total_moves: int, window: int) -> int:
+    """
+    滑动窗口的起点：之前的落子折叠进开局局面，之后的落子逐条作为消息
+
+    起点每次前移半个窗口而不是逐步前移，这样在两次前移之间消息前缀保持不变。
+    """
+    if total_moves <= window:
+        return 0
+    step = max(1, window // 2)
+    return ((total_moves - window) // step + 1) * step
+
+
+def build_conversation(board_state, player, moves, error="", custom_prompt="",
+                       encoding=DEFAULT_PROMPT_ENCODING, window=DEFAULT_CONVERSATION_WINDOW) -> list[dict]:
+    """
+    由落子记录确定性地生成对话消息
+
+    同一局中每次调用生成的消息只在末尾追加，之前的消息逐字相同；错误信息只附在最后一条消息上。
+    """
+    size = len(board_state)
+    start = conversation_start(len(moves), window)
+    if start:
+        snapshot = Board(size)
+        for move in moves[:start]:
+            snapshot.place(move["x"], move["y"], move["player"])
+        opening = f"Position after {start} moves:\n" + encode_board(snapshot.to_rows(), encoding, moves[:start])
+    else:
+        opening = _EMPTY_BOARD
+
+    messages = [{"role": "system", "content": conversation_system_prompt(size, player, encoding, custom_prompt)}]
+    parts = [opening.rstrip("\n")]
+    for move in moves[start:]:
+        if move["player"] != player:
+            parts.append(_OPPONENT_MOVE.format(x=move["x"], y=move["y"]))
+            continue
+        messages.append({"role": "user", "content": "\n".join(parts) or "Your move."})
+        messages.append({"role": "assistant", "content": f'```json\n{{"x": {move["x"]}, "y": {move["y"]}}}\n```'})
+        parts = []
+    if error:
+        parts.append(f"Previous error: {error}")
+    messages.append({"role": "user", "content": "\n".join(parts) or "Your move."})
+    return messages
+
+
+_SIZE_PATTERN = re.compile(r"on a (\d+)x\d+ board")
+_PLAYER_PATTERN = re.compile(r"You are player (\d)")
+_FULL_PATTERN = re.compile(r"The board state is: (\[\[.*?\]\])", re.S)
+_SPARSE_PATTERN = re.compile(r"^(Black|White) \(player [12]\) stones: (.*)$", re.M)
+_MOVES_PATTERN = re.compile(r"^Moves: (.*)$", re.M)
+
+
+def parse_prompt(prompt: str) -> tuple[Board, int]:
+    """从 build_prompt 生成的提示词中还原棋盘和执棋方，支持所有编码"""
+    size_match = _SIZE_PATTERN.search(prompt)
+    player_match = _PLAYER_PATTERN.search(prompt)
+    if not size_match or not player_match:
+        raise ValueError("Prompt does not contain a board state")
+    size = int(size_match.group(1))
+    player = int(player_match.group(1))
+
+    full_match = _FULL_PATTERN.search(prompt)
+    if full_match:
+        return Board.from_rows(ast.literal_eval(full_match.group(1))), player
+
+    board = Board(size)
+    moves_match = _MOVES_PATTERN.search(prompt)
+    if moves_match:
+        for item in moves_match.group(1).split():
+            if item == "none":
+                continue
+            stone, _, coords = item.partition(":")
+            x, y = coords.split(",")
+            board.place(int(x), int(y), int(stone))
+        return board, player
+
+    sparse_matches = _SPARSE_PATTERN.findall(prompt)
+    if sparse_matches:
+        for color, items in sparse_matches:
+            stone = 1 if color == "Black" else 2
+            for item in items.split():
+                if item != "none":
+                    x, y = item.split(",")
+                    board.place(int(x), int(y), stone)
+        return board, player
+
+    lines = prompt.splitlines()
+    if "Board:" not in lines:
+        raise ValueError("Prompt does not contain a board state")
+    start = lines.index("Board:") + 2
+    for x, line in enumerate(lines[start:start + size]):
+        for y, char in enumerate(line[2:].split()):
+            if char not in _CHAR_STONES:
+                raise ValueError(f"Unexpected board character: {char}")
+            if _CHAR_STONES[char]:
+                board.place(x, y, _CHAR_STONES[char])
+    return board, player
+
+
+_OPPONENT_PATTERN = re.compile(r"^Opponent played (\d+),(\d+)\.$", re.M)
+_REPLY_PATTERN = re.compile(r'"x":\s*(\d+),\s*"y":\s*(\d+)')
+
+
+def parse_conversation(messages: list[dict]) -> tuple[Board, int]:
+    """从 build_conversation 生成的消息中还原当前棋盘和执棋方"""
+    if len(messages) < 2 or messages[0].get("role") != "system":
+        raise ValueError("Messages are not a game conversation")
+    system = messages[0]["content"]
+    opening = messages[1]["content"]
+    if opening.startswith(_EMPTY_BOARD):
+        size_match = _SIZE_PATTERN.search(system)
+        player_match = _PLAYER_PATTERN.search(system)
+        if not size_match or not player_match:
+            raise ValueError("Prompt does not contain a board state")
+        board, player = Board(int(size_match.group(1))), int(player_match.group(1))
+    else:
+        board, player = parse_prompt(system + opening)
+    for message in messages[1:]:
+        if message["role"] == "assistant":
+            match = _REPLY_PATTERN.search(message["content"])
+            if match:
+                board.place(int(match.group(1)), int(match.group(2)), player)
+            continue
+        for x, y in _OPPONENT_PATTERN.findall(message["content"]):
+            board.place(int(x), int(y), 3 - player)
+    return board, player
+
+
+@lru_cache(maxsize=1)
+def _token_encoder():
+    """首次计数时才加载 tiktoken 词表，避免拖慢导入"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # 未安装 tiktoken 或无法下载词表
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """提示词 token 数；未安装 tiktoken 时按约 4 个字符一个 token 估算"""
+    encoder = _token_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+def measure_encodings(board_state, player=1, moves=None) -> dict:
+    """各编码下同一局面提示词的字符数与 token 数"""
+    result = {}
+    for encoding in PROMPT_ENCODINGS:
+        prompt = build_prompt(board_state, player, encoding=encoding, moves=moves)
+        result[encoding] = {"chars": len(prompt), "tokens": count_tokens(prompt)}
+    return result
+
+
+def token_counter_name() -> str:
+    return "tiktoken/cl100k_base" if _token_encoder() is not None else "approx(chars/4)"
@@ -0,0 +1,271 @@
+"""
+模型端点限流、重试与熔断
+
+同一 (url, key) 的所有请求共享一个端点状态（与 ai_clients 的连接池粒度一致）：
+- 并发上限：超出的请求排队等待；
+- 令牌桶：限制每秒发出的请求数，允许一定突发；
+- 429 与 5xx、连接错误按指数退避加随机抖动重试，响应带 Retry-After 时按其等待，
+  429 的等待对同一端点的所有请求生效；
+- 熔断：连续失败达到阈值后一段时间内直接失败，到期后放一个探测请求，成功即恢复。
+
+各项上限可通过环境变量调整，排队深度、等待时间与熔断状态见 /metrics 的 endpoints。
+"""
+import asyncio
+import hashlib
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+import openai
+
+
+ENDPOINT_MAX_CONCURRENCY = int(os.getenv("GOMOKU_ENDPOINT_CONCURRENCY", "8"))
+ENDPOINT_RATE_PER_SECOND = float(os.getenv("GOMOKU_ENDPOINT_RPS", "0"))  # 0 为不限速
+ENDPOINT_BURST = int(os.getenv("GOMOKU_ENDPOINT_BURST", "10"))
+ENDPOINT_MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20
+RETRY_AFTER_MAX_SECONDS = 60
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_OPEN_SECONDS = 30
+ENDPOINT_MAX_ENTRIES = 256
+WAIT_SAMPLE_SIZE = 512
+
+
+class EndpointUnavailable(Exception):
+    """端点处于熔断状态，请求未发出"""
+
+
+class _Endpoint:
+    __slots__ = (
+        "url", "key_hash", "semaphore", "admission", "tokens", "refilled_at", "blocked_until",
+        "waiting", "in_flight", "failures", "state", "open_until", "probing", "last_used",
+        "requests", "throttled", "server_errors", "retries", "rejected", "circuit_opens",
+        "wait_total", "wait_max", "waits",
+    )
+
+    def __init__(self, url: str, key_hash: str):
+        self.url = url
+        self.key_hash = key_hash
+        self.semaphore = asyncio.Semaphore(ENDPOINT_MAX_CONCURRENCY)
+        # 令牌桶与 429 暂停在锁内检查，排队的请求按先后顺序放行
+        self.admission = asyncio.Lock()
+        self.tokens = float(ENDPOINT_BURST)
+        self.refilled_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.in_flight = 0
+        self.failures = 0
+        self.state = "closed"  # closed / open / half_open
+        self.open_until = 0.0
+        self.probing = False
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.circuit_opens = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits: deque[float] = deque(maxlen=WAIT_SAMPLE_SIZE)
+
+    def check_circuit(self) -> None:
+        if self.state == "open":
+            if time.monotonic() < self.open_until:
+                self.rejected += 1
+                raise EndpointUnavailable(f"模型端点连续失败，{self.open_until - time.monotonic():.0f} 秒内暂停请求")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                self.rejected += 1
+                raise EndpointUnavailable("模型端点恢复探测中，暂停请求")
+            self.probing = True
+
+    async def _take_token(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            if ENDPOINT_RATE_PER_SECOND <= 0:
+                return
+            self.tokens = min(ENDPOINT_BURST, self.tokens + (now - self.refilled_at) * ENDPOINT_RATE_PER_SECOND)
+            self.refilled_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / ENDPOINT_RATE_PER_SECOND)
+
+    @asynccontextmanager
+    async def slot(self):
+        """排队等待并发名额与令牌，记录等待时间"""
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+            try:
+                async with self.admission:
+                    await self._take_token()
+            except BaseException:
+                self.semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        self.waits.append(waited)
+        self.requests += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.last_used = time.monotonic()
+            self.semaphore.release()
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = "closed"
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+            if self.state != "open":
+                self.circuit_opens += 1
+            self.state = "open"
+            self.open_until = time.monotonic() + CIRCUIT_OPEN_SECONDS
+        self.probing = False
+
+    def release_probe(self) -> None:
+        """探测请求因与端点无关的原因结束（取消、请求参数错误）时，允许下一个请求继续探测"""
+        if self.state == "half_open":
+            self.probing = False
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        samples = sorted(self.waits)
+        return {
+            "url": self.url,
+            "key": self.key_hash[:8],
+            "state": self.state,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "server_errors": self.server_errors,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "circuit_opens": self.circuit_opens,
+            "wait_mean_ms": round(self.wait_total / self.requests * 1000, 2) if self.requests else 0.0,
+            "wait_p95_ms": round(samples[int(len(samples) * 0.95)] * 1000, 2) if samples else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+# (base_url, api_key 的哈希) -> _Endpoint，按最近使用排序
+_endpoints: "OrderedDict[tuple[str, str], _Endpoint]" = OrderedDict()
+
+
+def _endpoint(url: str, api_key: str) -> _Endpoint:
+    key = (url or "", hashlib.sha256(api_key.encode()).hexdigest())
+    endpoint = _endpoints.get(key)
+    if endpoint is None:
+        endpoint = _endpoints[key] = _Endpoint(*key)
+        # 只淘汰没有请求在排队或进行中的端点
+        for stale_key, stale in list(_endpoints.items()):
+            if len(_endpoints) <= ENDPOINT_MAX_ENTRIES:
+                break
+            if stale.waiting == 0 and stale.in_flight == 0:
+                del _endpoints[stale_key]
+    else:
+        _endpoints.move_to_end(key)
+    return endpoint
+
+
+def _retry_after(error: openai.APIStatusError) -> float | None:
+    """读取 retry-after-ms 或 retry-after（秒）响应头，HTTP 日期格式忽略"""
+    headers = error.response.headers
+    for name, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return min(RETRY_AFTER_MAX_SECONDS, max(0.0, float(value) / scale))
+        except ValueError:
+            continue
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待：指数退避的全抖动"""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+async def call_endpoint(url: str, api_key: str, request):
+    """
+    在端点的限流与熔断下执行一次模型请求，429/5xx 与连接错误时重试
+
+    参数：
+        url, api_key: 端点，与 pooled_client 相同
+        request: 无参数的协程函数，每次尝试调用一次
+
+    异常：
+        EndpointUnavailable: 端点处于熔断状态
+        其余异常在用完重试次数或不可重试时原样抛出
+    """
+    endpoint = _endpoint(url, api_key)
+    for attempt in range(ENDPOINT_MAX_RETRIES + 1):
+        endpoint.check_circuit()
+        delay = None
+        try:
+            async with endpoint.slot():
+                result = await request()
+        except openai.APIStatusError as e:
+            if e.status_code == 429:
+                endpoint.throttled += 1
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                # 配额耗尽对同一端点的所有请求生效
+                endpoint.block(delay)
+                endpoint.release_probe()
+            elif e.status_code >= 500:
+                endpoint.server_errors += 1
+                endpoint.record_failure()
+                delay = _retry_after(e)
+            else:
+                endpoint.release_probe()
+                raise
+            if attempt == ENDPOINT_MAX_RETRIES:
+                raise
+        except openai.APIConnectionError:
+            endpoint.record_failure()
+            if attempt == ENDPOINT_MAX_RETRIES:
+                raise
+        except BaseException:
+            endpoint.release_probe()
+            raise
+        else:
+            endpoint.record_success()
+            return result
+        endpoint.retries += 1
+        # 429 的等待已在排队时生效，这里只对其他错误退避
+        if endpoint.blocked_until <= time.monotonic():
+            await asyncio.sleep(delay if delay is not None else backoff_delay(attempt))
+
+
+def rate_limit_stats() -> dict:
+    return {
+        "max_concurrency": ENDPOINT_MAX_CONCURRENCY,
+        "rate_per_second": ENDPOINT_RATE_PER_SECOND,
+        "burst": ENDPOINT_BURST,
+        "queue_depth": sum(endpoint.waiting for endpoint in _endpoints.values()),
+        "endpoints": [endpoint.stats() for endpoint in _endpoints.values()],
+    }
@@ -0,0 +1,83 @@
+"""
+后台过期清理任务
+
+房间与会话各自按过期时间放在最小堆中，清理任务定期只弹出已到期的条目，
+每批最多检查 REAPER_BATCH_SIZE 个，批次之间让出事件循环，不再在请求路径上遍历全部状态。
+"""
+import asyncio
+import time
+
+from .shared import cleanup_inactive_users, expiry_queue_sizes
+from .routes.rooms import cleanup_inactive_rooms
+
+
+REAPER_INTERVAL_SECONDS = 5
+REAPER_BATCH_SIZE = 500
+
+_task: asyncio.Task | None = None
+_stats = {
+    "runs": 0,
+    "batches": 0,
+    "rooms_removed": 0,
+    "sessions_removed": 0,
+    "usernames_removed": 0,
+    "last_run_at": None,
+    "last_run_ms": 0.0,
+    "last_run_removed": 0,
+}
+
+
+async def reap_expired(batch_size: int = REAPER_BATCH_SIZE) -> dict:
+    """分批清理所有已到期的房间和会话，返回本轮清理数量"""
+    start = time.perf_counter()
+    removed = {"rooms_removed": 0, "sessions_removed": 0, "usernames_removed": 0}
+    while True:
+        # 先清理房间，释放的玩家用户名可在同一轮随会话一起回收
+        room_count = await cleanup_inactive_rooms(batch_size)
+        session_result = cleanup_inactive_users(batch_size)
+        removed["rooms_removed"] += room_count
+        removed["sessions_removed"] += session_result["sessions_removed"]
+        removed["usernames_removed"] += session_result["usernames_removed"]
+        _stats["batches"] += 1
+        if room_count < batch_size and session_result["sessions_removed"] < batch_size:
+            break
+        await asyncio.sleep(0)
+
+    for key, value in removed.items():
+        _stats[key] += value
+    _stats["runs"] += 1
+    _stats["last_run_at"] = time.time()
+    _stats["last_run_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    _stats["last_run_removed"] = sum(removed.values())
+    return removed
+
+
+async def _run(interval: float, batch_size: int) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reap_expired(batch_size)
+        except Exception as e:
+            print(f"Reaper error: {e}")
+
+
+def start_reaper(interval: float = REAPER_INTERVAL_SECONDS, batch_size: int = REAPER_BATCH_SIZE) -> None:
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.ensure_future(_run(interval, batch_size))
+
+
+async def stop_reaper() -> None:
+    global _task
+    task, _task = _task, None
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def reaper_stats() -> dict:
+    return {
+        **_stats,
+        "running": _task is not None and not _task.done(),
+        "queued": expiry_queue_sizes(),
+    }
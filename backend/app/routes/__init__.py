@@ -1,4 +1,7 @@
 from .auth import router as auth_router
 from .rooms import router as rooms_router
 from .game import router as game_router
-from .messages import router as messages_router
\ No newline at end of file
+from .messages import router as messages_router
+from .events import router as events_router
+from .tournament import router as tournament_router
+from .archive import router as archive_router
\ No newline at end of file
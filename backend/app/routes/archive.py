@@ -0,0 +1,50 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..archive import archive_stats, open_archive, to_psq, to_sgf
+
+router = APIRouter(prefix="/archive", tags=["archive"])
+
+ARCHIVE_PAGE_LIMIT = 200
+
+
+@router.get("")
+async def get_archive():
+    """归档状态与已归档的对局数"""
+    reader = open_archive()
+    if reader is None:
+        return {"success": False, "message": "未启用对局归档（GOMOKU_ARCHIVE_PATH）"}
+    with reader:
+        return {"success": True, "games": len(reader), "archive": archive_stats()}
+
+
+@router.get("/games")
+async def list_archived_games(offset: int = 0, limit: int = 50):
+    """按索引分页列出归档对局，只读索引文件"""
+    reader = open_archive()
+    if reader is None:
+        return {"success": False, "message": "未启用对局归档（GOMOKU_ARCHIVE_PATH）"}
+    offset = max(0, offset)
+    limit = min(max(1, limit), ARCHIVE_PAGE_LIMIT)
+    with reader:
+        total = len(reader)
+        games = [reader.entry(number) for number in range(offset, min(total, offset + limit))]
+    return {"success": True, "total": total, "games": games}
+
+
+@router.get("/games/{number}")
+async def get_archived_game(number: int, format: str = "json"):
+    """读取一局归档对局，format 为 json、sgf 或 psq"""
+    if format not in ("json", "sgf", "psq"):
+        return {"success": False, "message": "不支持的导出格式"}
+    reader = open_archive()
+    if reader is None:
+        return {"success": False, "message": "未启用对局归档（GOMOKU_ARCHIVE_PATH）"}
+    with reader:
+        if not 0 <= number < len(reader):
+            return {"success": False, "message": "归档对局不存在"}
+        game = reader.read(number)
+    if format == "sgf":
+        return PlainTextResponse(to_sgf(game), media_type="application/x-go-sgf")
+    if format == "psq":
+        return PlainTextResponse(to_psq(game))
+    return {"success": True, "game": game}
@@ -32,7 +32,6 @@ def is_valid_username(username: str):
 
 @router.post("/login")
 async def login():
-    cleanup_inactive_users()
     session_id = str(uuid.uuid4())
     username = generate_unique_username()
     register_session(session_id, username)
@@ -41,14 +40,12 @@ async def login():
 
 @router.get("/suggest_username")
 async def suggest_username():
-    cleanup_inactive_users()
     username = generate_unique_username(reserve=False)
     return {"username": username}
 
 
 @router.post("/update_username")
 async def update_username(request: UpdateUsernameRequest):
-    cleanup_inactive_users()
     old_username = request.old_username
     new_username = request.new_username
     if not is_valid_username(new_username):
@@ -0,0 +1,116 @@
+import asyncio
+import json
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from ..shared import rooms, serialize_room
+from ..events import subscribe, unsubscribe, current_seq
+
+router = APIRouter(prefix="/rooms", tags=["events"])
+
+KEEPALIVE_SECONDS = 15
+
+
+def snapshot_event(room_id: str) -> dict:
+    """完整房间快照，客户端首次连接或无法续传时使用"""
+    version = current_seq(room_id)
+    room = serialize_room(rooms[room_id])
+    room["version"] = version
+    return {
+        "seq": version,
+        "type": "snapshot",
+        "room_id": room_id,
+        "data": room,
+    }
+
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+@router.get("/{room_id}/events")
+async def room_events(room_id: str, request: Request, since: int | None = None):
+    """Server-Sent Events 房间事件流，支持 since 参数或 Last-Event-ID 续传"""
+    if room_id not in rooms:
+        return {"success": False, "message": "房间不存在"}
+    last_event_id = request.headers.get("last-event-id")
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    subscription, backlog, needs_snapshot = subscribe(room_id, since)
+
+    async def stream():
+        try:
+            if needs_snapshot:
+                yield format_sse(snapshot_event(room_id))
+            for event in backlog:
+                yield format_sse(event)
+            while not await request.is_disconnected():
+                event = await subscription.get(KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["type"] == "resync":
+                    if room_id not in rooms:
+                        break
+                    event = snapshot_event(room_id)
+                yield format_sse(event)
+                if event["type"] == "room_deleted":
+                    break
+        finally:
+            unsubscribe(room_id, subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/{room_id}/ws")
+async def room_websocket(websocket: WebSocket, room_id: str, since: int | None = None):
+    """WebSocket 房间事件流，since 为客户端最后收到的事件序号"""
+    await websocket.accept()
+    if room_id not in rooms:
+        await websocket.send_json({"type": "error", "data": {"message": "房间不存在"}})
+        await websocket.close()
+        return
+
+    subscription, backlog, needs_snapshot = subscribe(room_id, since)
+
+    async def receive_until_closed():
+        # 客户端消息仅用于保活，收到断开即结束
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    receiver = asyncio.ensure_future(receive_until_closed())
+    try:
+        if needs_snapshot:
+            await websocket.send_json(snapshot_event(room_id))
+        for event in backlog:
+            await websocket.send_json(event)
+        while True:
+            getter = asyncio.ensure_future(subscription.get(KEEPALIVE_SECONDS))
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                break
+            event = getter.result()
+            if event is None:
+                await websocket.send_json({"type": "ping", "seq": current_seq(room_id)})
+                continue
+            if event["type"] == "resync":
+                if room_id not in rooms:
+                    break
+                event = snapshot_event(room_id)
+            await websocket.send_json(event)
+            if event["type"] == "room_deleted":
+                await websocket.close()
+                break
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+        unsubscribe(room_id, subscription)
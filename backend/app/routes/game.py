@@ -1,45 +1,64 @@
-from fastapi import APIRouter
-from ..models import SetAIConfigRequest, LockConfigRequest, SetReadyRequest, StepRequest, NextMoveRequest
-from ..shared import rooms
-from ..gomoku import call_ai
+import asyncio
+from fastapi import APIRouter, Header, Request
+from ..models import SetAIConfigRequest, LockConfigRequest, SetReadyRequest, StepRequest, NextMoveRequest, SetAutoPlayRequest
+from ..shared import rooms, append_room_log, set_room_error, mask_ai_config
+from ..events import publish
+from ..gomoku import request_move, DEFAULT_STEP_RETRIES
+from ..board import Board
+from ..match_runner import commit_move, is_match_running, maybe_start_match, stop_match
+from ..cluster import room_lock
+from ..idempotency import run_idempotent, request_fingerprint
 from .rooms import update_room_activity
 
 router = APIRouter()
 
+DISCONNECT_POLL_SECONDS = 0.5
 
-def check_winner(board):
-    size = 15
-    for i in range(size):
-        for j in range(size):
-            if board[i][j] != 0:
-                player = board[i][j]
-                if (
-                    check_line(board, i, j, 0, 1, player) or
-                    check_line(board, i, j, 1, 0, player) or
-                    check_line(board, i, j, 1, 1, player) or
-                    check_line(board, i, j, 1, -1, player)
-                ):
-                    return player
-    return 0
-
-
-def check_line(board, x, y, dx, dy, player):
-    count = 1
-    nx, ny = x + dx, y + dy
-    while 0 <= nx < 15 and 0 <= ny < 15 and board[nx][ny] == player:
-        count += 1
-        nx += dx
-        ny += dy
-    nx, ny = x - dx, y - dy
-    while 0 <= nx < 15 and 0 <= ny < 15 and board[nx][ny] == player:
-        count += 1
-        nx -= dx
-        ny -= dy
-    return count >= 5
-
-
-def is_board_full(board):
-    return all(all(cell != 0 for cell in row) for row in board)
+
+async def wait_unless_disconnected(http_request: Request, task: asyncio.Future) -> bool:
+    """等待任务完成，客户端提前断开时返回 False（不取消任务）"""
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return True
+        if await http_request.is_disconnected():
+            return False
+
+
+async def run_unless_disconnected(http_request: Request, coro):
+    """执行AI请求，若客户端提前断开则取消推理并返回 None"""
+    task = asyncio.ensure_future(coro)
+    try:
+        if await wait_unless_disconnected(http_request, task):
+            return task.result()
+        return None
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+class _StepFlight:
+    """同一房间同一回合正在进行的推理，重复的 /step 请求共享其结果"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+# (room_id, 已落子数, 执棋方) -> 正在进行的推理
+_step_flights: dict[tuple, _StepFlight] = {}
+inference_stats = {"calls": 0, "deduplicated": 0, "cancelled": 0}
+
+
+def _forget_flight(key: tuple, flight: _StepFlight) -> None:
+    if _step_flights.get(key) is flight:
+        del _step_flights[key]
+
+
+def _is_cancelled_response(response: dict) -> bool:
+    return response.get("message") == "请求已取消"
 
 
 @router.post("/set_ai_config")
@@ -68,6 +87,11 @@ async def set_ai_config(request: SetAIConfigRequest):
     
     room["ai_configs"][username] = request.ai_config.dict()
     update_room_activity(room_id)
+    publish(room_id, "config", {
+        "username": username,
+        "ai_config": mask_ai_config(room["ai_configs"][username]),
+        "config_changes_left": room["config_changes_left"].get(username),
+    })
     return {"success": True}
 
 
@@ -99,6 +123,11 @@ async def lock_config(request: LockConfigRequest):
         room["config_locked"][username] = False
     
     update_room_activity(room_id)
+    publish(room_id, "lock", {
+        "username": username,
+        "locked": room["config_locked"][username],
+        "config_changes_left": room["config_changes_left"].get(username),
+    })
     return {"success": True}
 
 
@@ -130,11 +159,53 @@ async def set_ready(request: SetReadyRequest):
         room["config_changes_left"][username] = 0
     
     update_room_activity(room_id)
+    publish(room_id, "ready", {
+        "username": username,
+        "ready": room["ready_status"][username],
+        "config_changes_left": room["config_changes_left"][username],
+    })
+    maybe_start_match(room_id)
     return {"success": True}
 
 
+@router.post("/set_auto_play")
+async def set_auto_play(request: SetAutoPlayRequest):
+    """开启后，双方整备完毕即由服务器自动完成整局对战"""
+    room_id = request.room_id
+    username = request.username
+    if room_id not in rooms:
+        return {"success": False, "message": "房间不存在"}
+    room = rooms[room_id]
+    if room.get("owner") != username:
+        return {"success": False, "message": "仅房主可以设置自动对局"}
+
+    room["auto_play"] = request.enabled
+    if request.enabled:
+        started = maybe_start_match(room_id)
+    else:
+        started = False
+        stop_match(room_id)
+    update_room_activity(room_id)
+    publish(room_id, "match", {"auto_play": room["auto_play"], "match_status": room["match_status"]})
+    return {"success": True, "started": started, "match_status": room["match_status"]}
+
+
 @router.post("/step")
-async def step(request: StepRequest):
+async def step(
+    request: StepRequest,
+    http_request: Request,
+    idempotency_key: str | None = Header(default=None),
+):
+    return await run_idempotent(
+        ("step", request.room_id, request.username),
+        idempotency_key,
+        lambda: _step(request, http_request),
+        fingerprint=request_fingerprint(request.dict()),
+        cacheable=lambda response: not _is_cancelled_response(response),
+    )
+
+
+async def _step(request: StepRequest, http_request: Request) -> dict:
     room_id = request.room_id
     username = request.username
     if room_id not in rooms:
@@ -144,12 +215,14 @@ async def step(request: StepRequest):
         return {"success": False, "message": "房间玩家不足"}
     if username not in room["players"]:
         return {"success": False, "message": "不在房间中"}
+    if is_match_running(room_id) or room["match_status"] == "running":
+        return {"success": False, "message": "自动对局进行中"}
     # 确定当前玩家
     current_player_index = room["current_player"] - 1
     current_username = room["players"][current_player_index]
     if username != current_username:
         return {"success": False, "message": "不是你的回合"}
-    if room["winner"] != 0 or is_board_full(room["board"]):
+    if room["winner"] != 0 or room["board"].is_full():
         return {"success": False, "message": "游戏已结束"}
     if username not in room["ai_configs"]:
         return {"success": False, "message": "未设置AI配置"}
@@ -164,115 +237,148 @@ async def step(request: StepRequest):
             if not room["ready_status"].get(player, False):
                 return {"success": False, "message": "双方都需要先点击'整备完毕'才能开始对战"}
     
-    ai_config = room["ai_configs"][username]
-    # 调用AI
-    result = call_ai(room["board"], room["current_player"], ai_config["key"], ai_config.get("model", "gpt-3.5-turbo"), ai_config.get("url", ""), room["error"] or "", ai_config.get("custom_prompt", ""))
-    
-    if result["error"]:
-        room["logs"].append(result["log"])
-        room["error"] = result["error"]
-        update_room_activity(room_id)
-        return {"success": False, "message": result["error"]}
-    elif result["move"]:
-        x, y = result["move"]
-        # 检查坐标是否在棋盘范围内
-        if not (0 <= x < 15 and 0 <= y < 15):
-            room["logs"].append(f"{result['log']}，但位置 ({x},{y}) 超出棋盘范围")
-            room["error"] = "坐标超出范围"
-            update_room_activity(room_id)
-            return {"success": False, "message": "坐标超出范围"}
-        elif room["board"][x][y] != 0:
-            room["logs"].append(f"{result['log']}，但位置 ({x},{y}) 已有棋子")
-            room["error"] = "位置已被占用"
-            update_room_activity(room_id)
-            return {"success": False, "message": "位置已被占用"}
-        else:
-            room["logs"].append(result["log"])
-            room["pending_move"] = {"x": x, "y": y}
-            room["can_confirm"] = True
-            room["error"] = None
-            update_room_activity(room_id)
-            return {"success": True, "pending_move": room["pending_move"]}
+    # 同一回合只发起一次推理，并发的重复请求等待同一结果
+    flight_key = (room_id, len(room["moves"]), room["current_player"])
+    flight = _step_flights.get(flight_key)
+    if flight is None:
+        inference_stats["calls"] += 1
+        flight = _StepFlight(asyncio.ensure_future(_run_step(room_id, room, current_player_index)))
+        _step_flights[flight_key] = flight
+        flight.task.add_done_callback(lambda _: _forget_flight(flight_key, flight))
     else:
-        room["logs"].append("AI未返回有效落子")
+        inference_stats["deduplicated"] += 1
+
+    flight.waiters += 1
+    try:
+        finished = await wait_unless_disconnected(http_request, flight.task)
+    finally:
+        flight.waiters -= 1
+    if finished:
+        return flight.task.result()
+
+    # 所有等待者都已断开时才取消推理
+    if flight.waiters == 0 and not flight.task.done():
+        inference_stats["cancelled"] += 1
+        flight.task.cancel()
+        _forget_flight(flight_key, flight)
+        async with room_lock(room_id):
+            if rooms.get(room_id) is room:
+                return _apply_step_result(room_id, None)
+    return {"success": False, "message": "请求已取消"}
+
+
+async def _run_step(room_id: str, room: dict, current_player_index: int) -> dict:
+    ai_config = room["ai_configs"][room["players"][current_player_index]]
+    # 调用AI，非法落子或出错时在本次请求内带着错误信息重试
+    result = await request_move(
+        room["board"],
+        room["current_player"],
+        ai_config,
+        room["error"] or "",
+        max_retries=ai_config.get("max_retries", DEFAULT_STEP_RETRIES),
+        moves=room["moves"],
+    )
+    async with room_lock(room_id):
+        # 等待模型期间房间可能已被删除，或对局已在别处推进
+        if rooms.get(room_id) is not room:
+            return {"success": False, "message": "房间不存在"}
+        if room["current_player"] - 1 != current_player_index or room["winner"] != 0:
+            return {"success": False, "message": "不是你的回合"}
+        return _apply_step_result(room_id, result)
+
+
+def _apply_step_result(room_id: str, result: dict | None) -> dict:
+    """在房间锁内记录 request_move 的结果（每次尝试一条日志），合法落子写入待确认状态"""
+    room = rooms[room_id]
+    board = room["board"]
+    if result is None:
+        append_room_log(room_id, "客户端已断开，AI请求已取消")
+        update_room_activity(room_id)
+        return {"success": False, "message": "请求已取消"}
+
+    for log in result["logs"]:
+        append_room_log(room_id, log)
+    if result["move"] is None:
+        message = result["error"] or "AI未返回有效落子"
+        set_room_error(room_id, message)
         update_room_activity(room_id)
-        return {"success": False, "message": "AI未返回有效落子"}
+        return {"success": False, "message": message, "attempts": result["attempts"]}
+
+    x, y = result["move"]
+    # 推理期间棋盘不会变化，这里仅作防御性检查
+    if not board.in_bounds(x, y) or not board.is_empty(x, y):
+        set_room_error(room_id, "位置已被占用")
+        update_room_activity(room_id)
+        return {"success": False, "message": "位置已被占用", "attempts": result["attempts"]}
+    room["pending_move"] = {"x": x, "y": y}
+    room["can_confirm"] = True
+    set_room_error(room_id, None)
+    update_room_activity(room_id)
+    publish(room_id, "pending_move", {"pending_move": room["pending_move"], "can_confirm": True})
+    return {
+        "success": True,
+        "pending_move": room["pending_move"],
+        "attempts": result["attempts"],
+        "fallback": result["fallback"],
+    }
 
 
 # 确认落子接口
 @router.post("/confirm_move")
-async def confirm_move(request: StepRequest):
+async def confirm_move(request: StepRequest, idempotency_key: str | None = Header(default=None)):
+    return await run_idempotent(
+        ("confirm_move", request.room_id, request.username),
+        idempotency_key,
+        lambda: _confirm_move(request),
+        fingerprint=request_fingerprint(request.dict()),
+    )
+
+
+async def _confirm_move(request: StepRequest) -> dict:
     room_id = request.room_id
     username = request.username
-    if room_id not in rooms:
-        return {"success": False, "message": "房间不存在"}
-    room = rooms[room_id]
-    if username not in room["players"]:
-        return {"success": False, "message": "不在房间中"}
-    if not room["can_confirm"] or not room["pending_move"]:
-        return {"success": False, "message": "无待确认落子"}
-    
-    x, y = room["pending_move"]["x"], room["pending_move"]["y"]
-    room["board"][x][y] = room["current_player"]
-    room["moves"].append({"x": x, "y": y, "player": room["current_player"]})
-    
-    winner = check_winner(room["board"])
-    if winner != 0:
-        room["winner"] = winner
-    elif len(room["moves"]) >= 225:
-        room["winner"] = 0  # 平局
-    else:
-        room["current_player"] = 3 - room["current_player"]
-    
-    room["pending_move"] = None
-    room["can_confirm"] = False
-    update_room_activity(room_id)
-    return {"success": True}
+    async with room_lock(room_id):
+        if room_id not in rooms:
+            return {"success": False, "message": "房间不存在"}
+        room = rooms[room_id]
+        if username not in room["players"]:
+            return {"success": False, "message": "不在房间中"}
+        if not room["can_confirm"] or not room["pending_move"]:
+            return {"success": False, "message": "无待确认落子"}
+
+        commit_move(room_id, room["pending_move"]["x"], room["pending_move"]["y"])
+        update_room_activity(room_id)
+        return {"success": True}
 
 
 @router.post("/next_move")
-async def next_move(request: NextMoveRequest):
+async def next_move(request: NextMoveRequest, http_request: Request):
     """
     单机AI对战接口 - 用于Battle页面
     """
-    ai_config = {
-        "key": request.ai_config.key,
-        "model": request.ai_config.model,
-        "url": request.ai_config.url,
-        "custom_prompt": request.ai_config.custom_prompt
-    }
-    
-    # 调用AI获取下一步
-    result = call_ai(
-        board_state=request.board,
-        player=request.current_player,
-        api_key=ai_config["key"],
-        model=ai_config["model"],
-        url=ai_config["url"],
-        error=request.error,
-        custom_prompt=ai_config["custom_prompt"]
-    )
-    
-    # 检查AI返回的坐标是否有效
-    if result.get("move"):
-        x, y = result["move"]
-        # 检查坐标是否在棋盘范围内
-        if not (0 <= x < 15 and 0 <= y < 15):
-            return {
-                "move": None,
-                "log": f"AI返回了无效坐标 ({x},{y})，超出棋盘范围",
-                "error": "坐标超出范围"
-            }
-        # 检查位置是否已被占用
-        if request.board[x][y] != 0:
-            return {
-                "move": None,
-                "log": f"AI返回了无效坐标 ({x},{y})，位置已被占用",
-                "error": "位置已被占用"
-            }
+    ai_config = request.ai_config.dict()
     
+    try:
+        board = Board.from_rows(request.board)
+    except ValueError as e:
+        return {"move": None, "log": f"棋盘数据无效: {e}", "error": "棋盘数据无效"}
+
+    # 调用AI获取下一步，非法落子或出错时在本次请求内重试
+    result = await run_unless_disconnected(http_request, request_move(
+        board,
+        request.current_player,
+        ai_config,
+        request.error,
+        max_retries=ai_config.get("max_retries", DEFAULT_STEP_RETRIES),
+    ))
+    if result is None:
+        return {"move": None, "log": "客户端已断开，AI请求已取消", "error": "请求已取消"}
+
     return {
-        "move": result.get("move"),
-        "log": result.get("log", "AI正在思考..."),
-        "error": result.get("error")
-    }
\ No newline at end of file
+        "move": result["move"],
+        "log": "\n".join(result["logs"]) or "AI正在思考...",
+        "error": result["error"],
+        "logs": result["logs"],
+        "attempts": result["attempts"],
+        "fallback": result["fallback"],
+    }
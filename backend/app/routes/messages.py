@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from ..models import SendMessageRequest
 from ..shared import rooms
+from ..events import publish
 from .rooms import update_room_activity
 import uuid
 
@@ -19,15 +20,17 @@ async def send_message(request: SendMessageRequest):
         return {"success": False, "message": "不在房间中"}
     
     # 添加消息到房间消息列表
-    room["messages"].append({
+    chat = {
         "username": username,
         "message": message,
         "timestamp": str(uuid.uuid4())  # 简单的时间戳
-    })
+    }
+    room["messages"].append(chat)
     
     # 只保留最近的10条消息
     if len(room["messages"]) > 10:
         room["messages"] = room["messages"][-10:]
     
     update_room_activity(room_id)
+    publish(room_id, "chat", chat)
     return {"success": True}
\ No newline at end of file
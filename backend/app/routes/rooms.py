@@ -1,4 +1,4 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, Response
 from ..models import (
     CreateRoomRequest,
     JoinRoomRequest,
@@ -6,19 +6,42 @@ from ..models import (
     DeleteRoomRequest,
     SetOwnerColorRequest,
 )
-from ..shared import used_usernames, rooms, ensure_username_registered
+from ..shared import (
+    used_usernames,
+    rooms,
+    ensure_username_registered,
+    update_room_activity,
+    serialize_room,
+    room_delta,
+    bind_room_player,
+    unbind_room_player,
+    get_room_id_by_username,
+    add_room,
+    discard_room,
+    pop_expired_rooms,
+    confirm_room_expired,
+    lobby_page,
+    is_room_in_progress,
+)
+from ..board import Board
+from ..match_runner import stop_match
+from ..events import publish, close_room_events, current_seq
+from ..cluster import room_lock, refresh_room
+from ..analysis import ANALYSIS_AVAILABLE, analyze_games, summarize_analysis
+import asyncio
 import uuid
 import time
 
 router = APIRouter(prefix="/rooms", tags=["rooms"])
 
 
-def init_room():
+def init_room(board_size: int = 15):
     return {
         "players": [],
         "owner": None,
         "owner_preferred_color": "black",
-        "board": [[0 for _ in range(15)] for _ in range(15)],
+        "board": Board(board_size),
+        "board_size": board_size,
         "current_player": 1,
         "ai_configs": {},
         "moves": [],
@@ -34,15 +57,11 @@ def init_room():
         "created_at": time.time(),  # 房间创建时间戳
         "last_activity": time.time(),  # 最后活动时间戳
         "max_players": 2,
+        "auto_play": False,  # 双方整备完毕后由服务器自动对局
+        "match_status": "idle",  # idle / running / finished / stopped / aborted
     }
 
 
-def update_room_activity(room_id: str):
-    """更新房间最后活动时间"""
-    if room_id in rooms:
-        rooms[room_id]["last_activity"] = time.time()
-
-
 def apply_owner_color(room: dict) -> None:
     owner = room.get("owner")
     if not owner or owner not in room.get("players", []):
@@ -62,48 +81,68 @@ def apply_owner_color(room: dict) -> None:
         room["current_player"] = 1
 
 
-def get_room_id_by_username(username: str) -> str | None:
-    for room_id, room in rooms.items():
-        if username in room.get("players", []):
-            return room_id
-    return None
-
-
-def cleanup_inactive_rooms():
-    """清理非活跃房间"""
-    current_time = time.time()
-    inactive_timeout = 3600  # 1小时无活动
-    empty_timeout = 300      # 5分钟空房间
-    
-    rooms_to_delete = []
-    
-    for room_id, room in rooms.items():
-        # 空房间清理
-        if len(room["players"]) == 0:
-            if current_time - room["created_at"] > empty_timeout:
-                rooms_to_delete.append(room_id)
-        # 非活跃房间清理（有玩家但长时间无活动）
-        elif current_time - room["last_activity"] > inactive_timeout:
-            rooms_to_delete.append(room_id)
-    
-    for room_id in rooms_to_delete:
-        del rooms[room_id]
-    
-    return len(rooms_to_delete)
+def publish_players(room_id: str, event_type: str = "players") -> None:
+    room = rooms[room_id]
+    publish(room_id, event_type, {
+        "players": room["players"],
+        "owner": room.get("owner"),
+        "owner_preferred_color": room.get("owner_preferred_color"),
+        "current_player": room["current_player"],
+    })
+
+
+def remove_room(room_id: str) -> None:
+    """删除房间及其索引，并通知订阅者"""
+    discard_room(room_id)
+    close_room_events(room_id)
+
+
+async def cleanup_inactive_rooms(limit: int | None = None) -> int:
+    """清理非活跃房间：空房间5分钟、有玩家但1小时无活动"""
+    deleted_count = 0
+    for room_id in pop_expired_rooms(limit):
+        async with room_lock(room_id):
+            # 多进程模式下加锁时会刷新房间，期间可能已有新的活动
+            if not confirm_room_expired(room_id):
+                continue
+            stop_match(room_id)
+            remove_room(room_id)
+            deleted_count += 1
+    return deleted_count
 
 
 @router.post("/cleanup")
 async def cleanup_rooms():
     """手动触发房间清理"""
-    deleted_count = cleanup_inactive_rooms()
+    deleted_count = await cleanup_inactive_rooms()
     return {"success": True, "deleted_rooms": deleted_count}
 
 
+LOBBY_PAGE_SIZE = 50
+LOBBY_MAX_PAGE_SIZE = 200
+
+
 @router.get("")
-async def list_rooms():
-    cleanup_inactive_rooms()
+async def list_rooms(
+    limit: int = LOBBY_PAGE_SIZE,
+    cursor: str | None = None,
+    open_seats: bool | None = None,
+    owner: str | None = None,
+    in_progress: bool | None = None,
+    username: str | None = None,
+):
+    """
+    大厅房间列表，按创建时间倒序分页
+
+    next_cursor 不为空时传回 cursor 获取下一页；传入 username 时额外返回其所在房间。
+    """
+    limit = max(1, min(limit, LOBBY_MAX_PAGE_SIZE))
+    try:
+        page, next_cursor = lobby_page(limit, cursor, open_seats=open_seats, owner=owner, in_progress=in_progress)
+    except ValueError:
+        return {"success": False, "message": "无效的分页参数"}
     room_list = []
-    for room_id, room in rooms.items():
+    for room_id, room in page:
         room_list.append({
             "room_id": room_id,
             "players": room["players"],
@@ -112,9 +151,13 @@ async def list_rooms():
             "created_at": room.get("created_at"),
             "last_activity": room.get("last_activity"),
             "owner": room.get("owner"),
+            "board_size": room.get("board_size"),
+            "in_progress": is_room_in_progress(room),
         })
-    room_list.sort(key=lambda item: item["created_at"], reverse=True)
-    return {"success": True, "rooms": room_list}
+    result = {"success": True, "rooms": room_list, "next_cursor": next_cursor, "total": len(rooms)}
+    if username:
+        result["current_room_id"] = get_room_id_by_username(username)
+    return result
 
 
 @router.post("/create")
@@ -133,16 +176,15 @@ async def create_room(request: CreateRoomRequest):
             "already_in_room": True,
             "message": "已存在的房间，正在为您跳转"
         }
-    
-    # 创建房间前先清理非活跃房间
-    cleanup_inactive_rooms()
-    
+
     room_id = str(uuid.uuid4())
-    rooms[room_id] = init_room()
+    add_room(room_id, init_room(request.board_size))
     rooms[room_id]["players"].append(username)
+    bind_room_player(username, room_id)
     rooms[room_id]["owner"] = username
     apply_owner_color(rooms[room_id])
     update_room_activity(room_id)
+    publish_players(room_id)
     return {"success": True, "room_id": room_id}
 
 
@@ -168,17 +210,66 @@ async def join_room(request: JoinRoomRequest):
         return {"success": False, "message": "房间已满"}
 
     room["players"].append(username)
+    bind_room_player(username, room_id)
     apply_owner_color(room)
     update_room_activity(room_id)
+    publish_players(room_id)
     return {"success": True, "room_id": room_id}
 
 
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
 @router.get("/{room_id}")
-async def get_room(room_id: str):
+async def get_room(
+    room_id: str,
+    response: Response,
+    since: int | None = None,
+    if_none_match: str | None = Header(default=None),
+):
+    """
+    获取房间状态
+
+    每次房间变化都会使版本号递增；传入 since 时只返回该版本之后变化的字段
+    和新追加的落子、日志、消息，并支持 If-None-Match 返回 304。
+    """
     if room_id not in rooms:
         return {"success": False, "message": "房间不存在"}
     update_room_activity(room_id)
-    return {"success": True, "room": rooms[room_id]}
+    version = current_seq(room_id)
+    etag = f'"{version}"'
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    if since is not None:
+        delta = room_delta(room_id, since)
+        if delta is not None:
+            return {"success": True, "version": version, "delta": True, **delta}
+
+    room = serialize_room(rooms[room_id])
+    room["version"] = version
+    return {"success": True, "version": version, "delta": False, "room": room}
+
+
+@router.get("/{room_id}/analysis")
+async def analyze_room(room_id: str):
+    """逐步分析房间棋谱：每步后的棋形统计，以及放任对手必胜、错过一步成五的失误"""
+    if not ANALYSIS_AVAILABLE:
+        return {"success": False, "message": "服务器未安装 numpy，无法分析棋谱"}
+    await refresh_room(room_id)
+    if room_id not in rooms:
+        return {"success": False, "message": "房间不存在"}
+    room = rooms[room_id]
+    moves = list(room["moves"])
+    analysis = (await asyncio.to_thread(analyze_games, [(moves, room["board_size"])]))[0]
+    return {"success": True, "moves": analysis, "summary": summarize_analysis(analysis)}
 
 
 @router.post("/leave")
@@ -192,17 +283,22 @@ async def leave_room(request: LeaveRoomRequest):
     if username not in room["players"]:
         return {"success": False, "message": "不在房间中"}
     room["players"].remove(username)
+    unbind_room_player(username, room_id)
+    stop_match(room_id)
     if username in room["ai_configs"]:
         del room["ai_configs"][username]
     update_room_activity(room_id)
     if len(room["players"]) == 0:
-        del rooms[room_id]
+        remove_room(room_id)
         return {"success": True}
 
     if room.get("owner") == username:
         room["owner"] = room["players"][0]
         room["owner_preferred_color"] = "black"
         apply_owner_color(room)
+        publish_players(room_id, "owner")
+    else:
+        publish_players(room_id)
     return {"success": True}
 
 
@@ -216,7 +312,8 @@ async def delete_room(request: DeleteRoomRequest):
     ensure_username_registered(username)
     if room.get("owner") != username:
         return {"success": False, "message": "仅房主可以解散房间"}
-    del rooms[room_id]
+    stop_match(room_id)
+    remove_room(room_id)
     return {"success": True}
 
 
@@ -240,4 +337,5 @@ async def set_owner_color(request: SetOwnerColorRequest):
     room["owner_preferred_color"] = request.color
     apply_owner_color(room)
     update_room_activity(room_id)
+    publish_players(room_id)
     return {"success": True}
\ No newline at end of file
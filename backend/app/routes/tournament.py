@@ -0,0 +1,59 @@
+from fastapi import APIRouter
+from ..models import CreateTournamentRequest
+from ..tournament import (
+    tournaments,
+    create_tournament as create_tournament_state,
+    start_tournament,
+    cancel_tournament as cancel_tournament_task,
+    tournament_summary,
+)
+
+router = APIRouter(prefix="/tournaments", tags=["tournaments"])
+
+
+@router.post("")
+async def create_tournament(request: CreateTournamentRequest):
+    """创建并立即开始一场AI赛事"""
+    names = [entry.name for entry in request.entries]
+    if len(set(names)) != len(names):
+        return {"success": False, "message": "参赛名称不能重复"}
+    entries = [{"name": entry.name, "ai_config": entry.ai_config.dict()} for entry in request.entries]
+    tournament_id = create_tournament_state(
+        entries,
+        format=request.format,
+        rounds=request.rounds,
+        games_per_pair=request.games_per_pair,
+        board_size=request.board_size,
+        max_concurrent_games=request.max_concurrent_games,
+        max_per_endpoint=request.max_per_endpoint,
+        max_retries=request.max_retries,
+    )
+    start_tournament(tournament_id)
+    return {"success": True, "tournament_id": tournament_id}
+
+
+@router.get("")
+async def list_tournaments():
+    items = []
+    for tournament in tournaments.values():
+        summary = tournament_summary(tournament)
+        summary.pop("games")
+        items.append(summary)
+    items.sort(key=lambda item: item["created_at"], reverse=True)
+    return {"success": True, "tournaments": items}
+
+
+@router.get("/{tournament_id}")
+async def get_tournament(tournament_id: str):
+    if tournament_id not in tournaments:
+        return {"success": False, "message": "赛事不存在"}
+    return {"success": True, "tournament": tournament_summary(tournaments[tournament_id])}
+
+
+@router.post("/{tournament_id}/cancel")
+async def cancel_tournament(tournament_id: str):
+    if tournament_id not in tournaments:
+        return {"success": False, "message": "赛事不存在"}
+    if not cancel_tournament_task(tournament_id):
+        return {"success": False, "message": "赛事未在进行中"}
+    return {"success": True}
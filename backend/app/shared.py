@@ -1,5 +1,10 @@
+import bisect
+import heapq
 import time
 import uuid
+from .board import Board
+from .events import publish, events_since, add_listener, restore_seq
+from .store import create_store
 
 
 # 全局存储
@@ -8,77 +13,410 @@ used_usernames = set()
 user_sessions = {}
 rooms = {}  # room_id -> room_data
 
+# 索引：username -> {session_id}，username -> room_id
+username_sessions = {}
+username_rooms = {}
+# 过期堆：(过期时间, id)，续期时不更新堆，弹出时再按实际过期时间重新入堆
+_session_expiry = []
+_room_expiry = []
+# 大厅索引：按 (创建时间, room_id) 升序排列
+_lobby_order = []
+
 # 会话清理配置
 SESSION_TIMEOUT_SECONDS = 3600  # 1小时无活动清理
 SESSION_MAX_LIFETIME_SECONDS = 86400  # 24小时最长存活
 
+# 持久化存储，热数据仍以上面的字典为准，变更异步写回
+store = create_store(rooms, user_sessions)
+
+# 房间清理配置
+ROOM_INACTIVE_TIMEOUT_SECONDS = 3600  # 1小时无活动
+ROOM_EMPTY_TIMEOUT_SECONDS = 300  # 5分钟空房间
+
+
+# 各类房间事件会改动的字段，用于生成增量快照
+EVENT_FIELDS = {
+	"move": ("board_wire", "current_player", "winner", "pending_move", "can_confirm"),
+	"pending_move": ("pending_move", "can_confirm"),
+	"ready": ("ready_status", "config_changes_left"),
+	"lock": ("config_locked", "config_changes_left"),
+	"config": ("ai_configs", "config_changes_left"),
+	"players": ("players", "owner", "owner_preferred_color", "current_player", "ai_configs", "ready_status", "config_locked"),
+	"owner": ("players", "owner", "owner_preferred_color", "current_player", "ai_configs", "ready_status", "config_locked"),
+	"match": ("auto_play", "match_status"),
+	"error": ("error",),
+}
+
+
+def mask_ai_config(config: dict) -> dict:
+	return {**config, "key": "******" if config.get("key") else ""}
+
+
+def _masked_ai_configs(room: dict) -> dict:
+	return {username: mask_ai_config(config) for username, config in room["ai_configs"].items()}
+
+
+def serialize_room(room: dict) -> dict:
+	"""将房间数据转换为可JSON序列化的结构，棋盘同时给出二维数组和紧凑格式，并隐藏API密钥"""
+	data = dict(room)
+	board = room["board"]
+	data["board"] = board.to_rows()
+	data["board_wire"] = board.to_wire()
+	data["ai_configs"] = _masked_ai_configs(room)
+	return data
+
+
+def room_delta(room_id: str, since: int) -> dict | None:
+	"""
+	生成自版本 since 以来的增量数据
+
+	changed 为发生变化字段的最新值，appended 为新追加的落子、日志和消息。
+	事件历史无法覆盖 since 时返回 None，调用方应返回完整快照。
+	"""
+	events = events_since(room_id, since)
+	if events is None:
+		return None
+
+	room = rooms[room_id]
+	changed_fields = set()
+	appended = {"moves": [], "logs": [], "messages": []}
+	for event in events:
+		event_type = event["type"]
+		changed_fields.update(EVENT_FIELDS.get(event_type, ()))
+		if event_type == "move":
+			data = event["data"]
+			appended["moves"].append({"x": data["x"], "y": data["y"], "player": data["player"]})
+		elif event_type == "log":
+			appended["logs"].append(event["data"]["log"])
+		elif event_type == "chat":
+			appended["messages"].append(event["data"])
+
+	changed = {}
+	for field in changed_fields:
+		if field == "board_wire":
+			changed[field] = room["board"].to_wire()
+		elif field == "ai_configs":
+			changed[field] = _masked_ai_configs(room)
+		else:
+			changed[field] = room.get(field)
+	return {"changed": changed, "appended": appended}
+
+
+def _room_deadline(room: dict) -> float:
+	if not room["players"]:
+		return room["created_at"] + ROOM_EMPTY_TIMEOUT_SECONDS
+	return room["last_activity"] + ROOM_INACTIVE_TIMEOUT_SECONDS
+
+
+def _index_room(room_id: str, room: dict) -> None:
+	rooms[room_id] = room
+	bisect.insort(_lobby_order, (room["created_at"], room_id))
+	deadline = min(room["created_at"] + ROOM_EMPTY_TIMEOUT_SECONDS, _room_deadline(room))
+	heapq.heappush(_room_expiry, (deadline, room_id))
+	for player in room["players"]:
+		bind_room_player(player, room_id)
+
+
+def add_room(room_id: str, room: dict) -> None:
+	"""登记新房间，同时加入大厅索引和过期堆"""
+	_index_room(room_id, room)
+	store.save_room(room_id)
+
+
+def _unindex_room(room_id: str) -> dict:
+	room = rooms.pop(room_id)
+	key = (room["created_at"], room_id)
+	index = bisect.bisect_left(_lobby_order, key)
+	if index < len(_lobby_order) and _lobby_order[index] == key:
+		del _lobby_order[index]
+	for player in room["players"]:
+		unbind_room_player(player, room_id)
+	return room
+
+
+def discard_room(room_id: str) -> dict:
+	"""移除房间及其大厅索引、玩家索引；过期堆中的条目在弹出时跳过"""
+	room = _unindex_room(room_id)
+	store.save_room(room_id)
+	return room
+
+
+def _build_room(stored: dict) -> dict:
+	"""由存储中的房间数据重建棋盘"""
+	board = Board(stored["board_size"])
+	for move in stored["moves"]:
+		board.place(move["x"], move["y"], move["player"])
+	stored["board"] = board
+	stored.pop("version", None)
+	return stored
+
+
+def apply_stored_room(room_id: str, stored: dict | None) -> None:
+	"""
+	用存储中的最新数据覆盖本进程的房间副本（多进程模式）
+
+	已有房间原地更新，保持字典对象不变；stored 为 None 表示房间已被其他进程删除。
+	不会标记写回。
+	"""
+	room = rooms.get(room_id)
+	if stored is None:
+		if room is not None:
+			_unindex_room(room_id)
+		return
+	stored = _build_room(stored)
+	if room is None:
+		_index_room(room_id, stored)
+		used_usernames.update(stored["players"])
+		return
+	for player in room["players"]:
+		unbind_room_player(player, room_id)
+	# API 密钥不写入存储，沿用本进程内存中的密钥
+	keys = {username: config.get("key", "") for username, config in room["ai_configs"].items()}
+	room.clear()
+	room.update(stored)
+	for username, config in room["ai_configs"].items():
+		if not config.get("key") and keys.get(username):
+			config["key"] = keys[username]
+	for player in room["players"]:
+		bind_room_player(player, room_id)
+	used_usernames.update(room["players"])
+
+
+def _on_room_event(event: dict) -> None:
+	# 房间的每次变化都会发布事件，据此标记需要写回的房间
+	room_id = event["room_id"]
+	if event["type"] == "move":
+		data = event["data"]
+		store.append_move(room_id, data["move_count"] - 1, data)
+	store.save_room(room_id)
+	store.record_event(event)
+
+
+add_listener(_on_room_event)
+
+
+def is_room_in_progress(room: dict) -> bool:
+	return room.get("match_status") == "running" or (bool(room["moves"]) and not room["winner"])
+
+
+def _encode_cursor(key: tuple) -> str:
+	return f"{key[0]!r}:{key[1]}"
+
 
-def _upgrade_session_structure(session_id: str, value):
-	"""确保旧结构的session数据升级为带时间戳的字典格式"""
-	if isinstance(value, dict):
-		return value
+def _decode_cursor(cursor: str) -> tuple:
+	created_at, _, room_id = cursor.partition(":")
+	return float(created_at), room_id
 
+
+def lobby_page(
+	limit: int,
+	cursor: str | None = None,
+	open_seats: bool | None = None,
+	owner: str | None = None,
+	in_progress: bool | None = None,
+) -> tuple[list[tuple[str, dict]], str | None]:
+	"""
+	按创建时间倒序分页返回房间
+
+	cursor 为上一页返回的 next_cursor，可按是否有空位、房主、是否对局中过滤。
+	无效的 cursor 抛出 ValueError。
+	"""
+	def matches(room: dict) -> bool:
+		if owner is not None and room.get("owner") != owner:
+			return False
+		if open_seats is not None and (len(room["players"]) < room.get("max_players", 2)) != open_seats:
+			return False
+		if in_progress is not None and is_room_in_progress(room) != in_progress:
+			return False
+		return True
+
+	if owner is not None:
+		# 房主一定在自己的房间内，直接通过玩家索引定位
+		room_id = username_rooms.get(owner)
+		room = rooms.get(room_id) if room_id else None
+		if room is None or not matches(room):
+			return [], None
+		if cursor is not None and (room["created_at"], room_id) >= _decode_cursor(cursor):
+			return [], None
+		return [(room_id, room)], None
+
+	end = bisect.bisect_left(_lobby_order, _decode_cursor(cursor)) if cursor else len(_lobby_order)
+	page = []
+	index = end - 1
+	while index >= 0 and len(page) < limit:
+		room_id = _lobby_order[index][1]
+		room = rooms[room_id]
+		if matches(room):
+			page.append((room_id, room))
+		index -= 1
+	next_cursor = None
+	if len(page) == limit and index >= 0:
+		last_id, last_room = page[-1]
+		next_cursor = _encode_cursor((last_room["created_at"], last_id))
+	return page, next_cursor
+
+
+def pop_expired_rooms(limit: int | None = None) -> list[str]:
+	"""
+	弹出已到期的房间ID，最多检查 limit 个堆顶条目
+
+	期间有过活动的房间按新的过期时间重新入堆，调用方负责删除返回的房间。
+	"""
 	now = time.time()
-	upgraded = {
-		"username": value,
-		"created_at": now,
-		"last_activity": now,
-	}
-	user_sessions[session_id] = upgraded
-	return upgraded
+	expired = []
+	checked = 0
+	while _room_expiry and _room_expiry[0][0] < now and (limit is None or checked < limit):
+		checked += 1
+		_, room_id = heapq.heappop(_room_expiry)
+		room = rooms.get(room_id)
+		if room is None:
+			continue
+		deadline = _room_deadline(room)
+		if deadline >= now:
+			heapq.heappush(_room_expiry, (deadline, room_id))
+			continue
+		expired.append(room_id)
+	return expired
+
+
+def confirm_room_expired(room_id: str) -> bool:
+	"""再次确认房间已过期（例如刷新或加锁之后），未过期时按新的过期时间重新入堆"""
+	room = rooms.get(room_id)
+	if room is None:
+		return False
+	deadline = _room_deadline(room)
+	if deadline < time.time():
+		return True
+	heapq.heappush(_room_expiry, (deadline, room_id))
+	return False
+
+
+def expiry_queue_sizes() -> dict:
+	return {"sessions": len(_session_expiry), "rooms": len(_room_expiry)}
+
+
+def update_room_activity(room_id: str) -> None:
+	"""更新房间最后活动时间"""
+	if room_id in rooms:
+		rooms[room_id]["last_activity"] = time.time()
+
+
+def append_room_log(room_id: str, text: str) -> None:
+	"""追加房间日志并推送 log 事件"""
+	rooms[room_id]["logs"].append(text)
+	publish(room_id, "log", {"log": text})
+
+
+def set_room_error(room_id: str, error: str | None) -> None:
+	"""更新房间错误状态，有变化时推送 error 事件"""
+	room = rooms[room_id]
+	if room["error"] == error:
+		return
+	room["error"] = error
+	publish(room_id, "error", {"error": error})
+
+
+def _session_deadline(session: dict) -> float:
+	return min(
+		session["last_activity"] + SESSION_TIMEOUT_SECONDS,
+		session["created_at"] + SESSION_MAX_LIFETIME_SECONDS,
+	)
+
+
+def _remove_session(session_id: str) -> dict | None:
+	session = user_sessions.pop(session_id, None)
+	if session is None:
+		return None
+	sessions = username_sessions.get(session["username"])
+	if sessions is not None:
+		sessions.discard(session_id)
+		if not sessions:
+			del username_sessions[session["username"]]
+	store.save_session(session_id)
+	return session
+
+
+def _index_session(session_id: str, session: dict) -> None:
+	user_sessions[session_id] = session
+	username_sessions.setdefault(session["username"], set()).add(session_id)
+	heapq.heappush(_session_expiry, (_session_deadline(session), session_id))
 
 
 def register_session(session_id: str, username: str) -> None:
 	now = time.time()
-	user_sessions[session_id] = {
+	_remove_session(session_id)
+	session = {
 		"username": username,
 		"created_at": now,
 		"last_activity": now,
 	}
+	_index_session(session_id, session)
+	store.save_session(session_id)
 
 
-def touch_sessions_by_username(username: str) -> None:
+def touch_sessions_by_username(username: str) -> bool:
+	"""刷新该用户名所有会话的活动时间，返回是否存在会话"""
+	session_ids = username_sessions.get(username)
+	if not session_ids:
+		return False
 	now = time.time()
-	for session_id, session in list(user_sessions.items()):
-		session = _upgrade_session_structure(session_id, session)
-		if session["username"] == username:
-			session["last_activity"] = now
+	for session_id in session_ids:
+		user_sessions[session_id]["last_activity"] = now
+		store.save_session(session_id)
+	return True
 
 
 def update_sessions_username(old_username: str, new_username: str) -> None:
+	session_ids = username_sessions.pop(old_username, None)
+	if not session_ids:
+		return
 	now = time.time()
-	for session_id, session in list(user_sessions.items()):
-		session = _upgrade_session_structure(session_id, session)
-		if session["username"] == old_username:
-			session["username"] = new_username
-			session["last_activity"] = now
+	for session_id in session_ids:
+		session = user_sessions[session_id]
+		session["username"] = new_username
+		session["last_activity"] = now
+		store.save_session(session_id)
+	username_sessions.setdefault(new_username, set()).update(session_ids)
+
+
+def bind_room_player(username: str, room_id: str) -> None:
+	"""记录玩家所在房间，需与 room["players"] 保持一致"""
+	username_rooms[username] = room_id
+
+
+def unbind_room_player(username: str, room_id: str) -> None:
+	if username_rooms.get(username) == room_id:
+		del username_rooms[username]
+
+
+def get_room_id_by_username(username: str) -> str | None:
+	return username_rooms.get(username)
 
 
 def _is_username_active(username: str) -> bool:
-	# 检查是否仍有其他会话使用该用户名
-	for session in user_sessions.values():
-		if isinstance(session, dict) and session.get("username") == username:
-			return True
-	# 检查是否仍在任何房间内
-	for room in rooms.values():
-		if username in room.get("players", []):
-			return True
-	return False
+	# 仍有其他会话使用该用户名，或仍在某个房间内
+	return bool(username_sessions.get(username)) or username in username_rooms
 
 
-def cleanup_inactive_users() -> dict:
-	"""清理由于长期无活动或超时的会话及对应用户名"""
+def cleanup_inactive_users(limit: int | None = None) -> dict:
+	"""清理由于长期无活动或超时的会话及对应用户名，只处理堆顶已到期的会话，最多检查 limit 个"""
 	now = time.time()
 	removed_sessions = []
+	checked = 0
 
-	for session_id, session in list(user_sessions.items()):
-		session = _upgrade_session_structure(session_id, session)
-		last_activity = session.get("last_activity", session.get("created_at", now))
-		created_at = session.get("created_at", now)
-
-		if (now - last_activity) > SESSION_TIMEOUT_SECONDS or (now - created_at) > SESSION_MAX_LIFETIME_SECONDS:
-			removed_sessions.append((session_id, session["username"]))
-			del user_sessions[session_id]
+	while _session_expiry and _session_expiry[0][0] < now and (limit is None or checked < limit):
+		checked += 1
+		_, session_id = heapq.heappop(_session_expiry)
+		session = user_sessions.get(session_id)
+		if session is None:
+			continue
+		deadline = _session_deadline(session)
+		if deadline >= now:
+			# 期间有过活动，按新的过期时间重新入堆
+			heapq.heappush(_session_expiry, (deadline, session_id))
+			continue
+		_remove_session(session_id)
+		removed_sessions.append((session_id, session["username"]))
 
 	removed_usernames = set()
 	for _, username in removed_sessions:
@@ -99,17 +437,28 @@ def ensure_username_registered(username: str) -> None:
 	if not username:
 		return
 
-	now = time.time()
-	found_session = False
-	for session_id, session in list(user_sessions.items()):
-		session = _upgrade_session_structure(session_id, session)
-		if session["username"] == username:
-			session["last_activity"] = now
-			found_session = True
+	found_session = touch_sessions_by_username(username)
 
 	if username not in used_usernames:
 		used_usernames.add(username)
 
 	if not found_session:
 		session_id = str(uuid.uuid4())
-		register_session(session_id, username)
\ No newline at end of file
+		register_session(session_id, username)
+
+
+def restore_state() -> None:
+	"""启动时从存储中恢复房间和会话，并重建各项索引"""
+	stored_rooms, stored_sessions = store.load()
+	for session_id, session in stored_sessions.items():
+		_index_session(session_id, session)
+		used_usernames.add(session["username"])
+
+	for room_id, room in sorted(stored_rooms.items(), key=lambda item: item[1]["created_at"]):
+		restore_seq(room_id, room.get("version", 0))
+		room = _build_room(room)
+		if room.get("match_status") == "running":
+			# 自动对局任务不会随重启恢复
+			room["match_status"] = "stopped"
+		_index_room(room_id, room)
+		used_usernames.update(room["players"])
@@ -0,0 +1,423 @@
+"""
+房间与会话的持久化存储
+
+热数据始终保存在 shared.py 的内存字典中，存储层只负责异步写回与启动时恢复：
+- MemoryStore：默认实现，不做持久化；
+- SQLiteStore：WAL 模式，变更只标记为脏数据，由后台任务按批次合并写入，
+  落子写入只追加的 moves 表，因此请求路径上不产生任何磁盘 IO。
+
+通过环境变量 GOMOKU_STORE=sqlite 启用，数据库路径由 GOMOKU_SQLITE_PATH 指定。
+AI 配置中的 API 密钥不会写入数据库：重启后需要重新设置，多进程模式下各进程只持有在本进程设置的密钥。
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .archive import public_config
+from .events import current_seq
+
+
+STORE_FLUSH_INTERVAL_SECONDS = 0.2
+STORE_FLUSH_BATCH_SIZE = 1000
+STORE_RETRY_MAX_SECONDS = 10  # 写入失败后退避的上限
+STORE_CLOSE_ATTEMPTS = 3      # 关闭时连续写入失败这么多次后放弃
+
+# 不写入 rooms 表的字段：棋盘由 moves 表重建
+_ROOM_EXCLUDED_FIELDS = ("board", "moves")
+
+# 当前请求修改过的 (房间 ID, 会话 ID)，由 track_writes 设置
+_tracked_writes: ContextVar[tuple[set, set] | None] = ContextVar("tracked_writes", default=None)
+
+
+@contextmanager
+def track_writes():
+    """记录上下文内修改过的房间与会话，返回 (房间 ID 集合, 会话 ID 集合)，用于只写回本请求的修改"""
+    written = (set(), set())
+    token = _tracked_writes.set(written)
+    try:
+        yield written
+    finally:
+        _tracked_writes.reset(token)
+
+
+def _track(room_id: str | None = None, session_id: str | None = None) -> None:
+    written = _tracked_writes.get()
+    if written is None:
+        return
+    if room_id is not None:
+        written[0].add(room_id)
+    if session_id is not None:
+        written[1].add(session_id)
+
+
+class MemoryStore:
+    """默认存储：状态只保存在进程内存中"""
+
+    persistent = False
+
+    def __init__(self, rooms: dict, sessions: dict):
+        self.rooms = rooms
+        self.sessions = sessions
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def load(self) -> tuple[dict, dict]:
+        """返回 (room_id -> 房间数据及落子列表, session_id -> 会话)"""
+        return {}, {}
+
+    def save_room(self, room_id: str) -> None:
+        pass
+
+    def touch_room(self, room_id: str, last_activity: float) -> None:
+        pass
+
+    def append_move(self, room_id: str, index: int, move: dict) -> None:
+        pass
+
+    def save_session(self, session_id: str) -> None:
+        pass
+
+    def record_event(self, event: dict) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "memory"}
+
+
+class SQLiteStore(MemoryStore):
+    """
+    SQLite 写回存储
+
+    save_room / save_session 只记录 ID，写入时读取内存中的最新状态，同一批次内的多次修改
+    只写一次；内存中已不存在的房间或会话在写入时删除。moves 表只追加，房间删除后仍保留棋谱。
+    """
+
+    persistent = True
+
+    def __init__(self, rooms: dict, sessions: dict, path: str,
+                 flush_interval: float = STORE_FLUSH_INTERVAL_SECONDS,
+                 batch_size: int = STORE_FLUSH_BATCH_SIZE):
+        super().__init__(rooms, sessions)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._dirty_rooms: set[str] = set()
+        self._dirty_sessions: set[str] = set()
+        self._pending_moves: list[tuple] = []
+        # 多进程模式下同时写入事件表，供其他进程转发给各自的订阅者
+        self.event_origin: str | None = None
+        self._pending_events: list[tuple] = []
+        # room_id -> 最后活动时间，只更新 rooms 表 JSON 中的 last_activity，不重写整行
+        self._pending_touches: dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self._failures = 0
+        self._conn = self._connect()
+        self._stats = {"flushes": 0, "rooms_written": 0, "sessions_written": 0, "moves_written": 0,
+                       "last_flush_ms": 0.0, "errors": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rooms (
+                room_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS moves (
+                room_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                player INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (room_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_activity REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS room_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                room_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                ts REAL NOT NULL,
+                origin TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS room_events_room_seq ON room_events (room_id, seq);
+        """)
+        return conn
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        # 关闭前写入剩余数据，数据库持续不可写时放弃并保留错误计数
+        failures = 0
+        try:
+            while self.has_pending():
+                try:
+                    await self.flush()
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    failures += 1
+                    print(f"Store flush error: {e}")
+                    if failures >= STORE_CLOSE_ATTEMPTS:
+                        break
+                    await asyncio.sleep(self._retry_delay(failures))
+        finally:
+            self._conn.close()
+
+    def has_pending(self) -> bool:
+        return bool(self._dirty_rooms or self._dirty_sessions or self._pending_moves or self._pending_events
+                    or self._pending_touches)
+
+    def load(self) -> tuple[dict, dict]:
+        rooms = {}
+        for room_id, data in self._conn.execute("SELECT room_id, data FROM rooms"):
+            room = json.loads(data)
+            room["moves"] = []
+            rooms[room_id] = room
+            if any(config.get("key") for config in room.get("ai_configs", {}).values()):
+                # 旧版本写入了密钥，下次刷新时重写该行去掉密钥
+                self._dirty_rooms.add(room_id)
+        if self._dirty_rooms:
+            self._schedule()
+        for room_id, x, y, player in self._conn.execute(
+                "SELECT room_id, x, y, player FROM moves ORDER BY room_id, idx"):
+            if room_id in rooms:
+                rooms[room_id]["moves"].append(_move_row(x, y, player))
+        sessions = {
+            session_id: {"username": username, "created_at": created_at, "last_activity": last_activity}
+            for session_id, username, created_at, last_activity in self._conn.execute(
+                "SELECT session_id, username, created_at, last_activity FROM sessions")
+        }
+        return rooms, sessions
+
+    def save_room(self, room_id: str) -> None:
+        self._dirty_rooms.add(room_id)
+        _track(room_id=room_id)
+        self._schedule()
+
+    def touch_room(self, room_id: str, last_activity: float) -> None:
+        self._pending_touches[room_id] = max(last_activity, self._pending_touches.get(room_id, 0))
+        self._schedule()
+
+    def append_move(self, room_id: str, index: int, move: dict) -> None:
+        self._pending_moves.append((room_id, index, move["x"], move["y"], move["player"], time.time()))
+        _track(room_id=room_id)
+        self._schedule()
+
+    def save_session(self, session_id: str) -> None:
+        self._dirty_sessions.add(session_id)
+        _track(session_id=session_id)
+        self._schedule()
+
+    def record_event(self, event: dict) -> None:
+        if self.event_origin is None:
+            return
+        _track(room_id=event["room_id"])
+        self._pending_events.append((
+            event["room_id"], event["seq"], event["type"],
+            json.dumps(event["data"], ensure_ascii=False), event["ts"], self.event_origin,
+        ))
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # 等待一个刷新间隔，把这段时间内的修改合并为一次写入
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                self._failures = 0
+            except Exception as e:
+                # 这一批已放回队列，退避后重试
+                self._stats["errors"] += 1
+                self._failures += 1
+                print(f"Store flush error: {e}")
+                await asyncio.sleep(self._retry_delay(self._failures))
+            if self.has_pending():
+                self._wakeup.set()
+
+    def _retry_delay(self, failures: int) -> float:
+        return min(STORE_RETRY_MAX_SECONDS, self.flush_interval * 2 ** failures)
+
+    def _take_batch(self, room_ids: set | None = None,
+                    session_ids: set | None = None) -> tuple[list, list, list, list, list, list, list]:
+        """
+        在事件循环线程中取出一批脏数据并序列化，避免写入线程读取正在修改的字典
+
+        传入 room_ids / session_ids 时只取这些房间、会话的数据（不受批次大小限制），其余留给后台写入。
+        """
+        if room_ids is None and session_ids is None:
+            moves = self._pending_moves[:self.batch_size]
+            del self._pending_moves[:self.batch_size]
+            events = self._pending_events[:self.batch_size]
+            del self._pending_events[:self.batch_size]
+            room_ids = [self._dirty_rooms.pop() for _ in range(min(len(self._dirty_rooms), self.batch_size))]
+            session_ids = [self._dirty_sessions.pop() for _ in range(min(len(self._dirty_sessions), self.batch_size))]
+            touch_ids = list(self._pending_touches)[:self.batch_size]
+        else:
+            room_ids, session_ids = room_ids or set(), session_ids or set()
+            moves = [row for row in self._pending_moves if row[0] in room_ids]
+            self._pending_moves = [row for row in self._pending_moves if row[0] not in room_ids]
+            events = [row for row in self._pending_events if row[0] in room_ids]
+            self._pending_events = [row for row in self._pending_events if row[0] not in room_ids]
+            touch_ids = [room_id for room_id in room_ids if room_id in self._pending_touches]
+            room_ids = [room_id for room_id in room_ids if room_id in self._dirty_rooms]
+            session_ids = [session_id for session_id in session_ids if session_id in self._dirty_sessions]
+            self._dirty_rooms.difference_update(room_ids)
+            self._dirty_sessions.difference_update(session_ids)
+        touches = [(self._pending_touches.pop(room_id), room_id) for room_id in touch_ids]
+
+        room_rows, deleted_rooms = [], []
+        now = time.time()
+        for room_id in room_ids:
+            room = self.rooms.get(room_id)
+            if room is None:
+                deleted_rooms.append((room_id,))
+                continue
+            data = {key: value for key, value in room.items() if key not in _ROOM_EXCLUDED_FIELDS}
+            # API 密钥只保存在进程内存中，不写入数据库
+            data["ai_configs"] = {username: public_config(config) for username, config in room["ai_configs"].items()}
+            data["version"] = current_seq(room_id)
+            room_rows.append((room_id, json.dumps(data, ensure_ascii=False), now))
+
+        session_rows, deleted_sessions = [], []
+        for session_id in session_ids:
+            session = self.sessions.get(session_id)
+            if session is None:
+                deleted_sessions.append((session_id,))
+                continue
+            session_rows.append((session_id, session["username"], session["created_at"], session["last_activity"]))
+        return moves, room_rows, deleted_rooms, session_rows, deleted_sessions, events, touches
+
+    def _write(self, moves: list, room_rows: list, deleted_rooms: list,
+               session_rows: list, deleted_sessions: list, events: list, touches: list) -> None:
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO moves VALUES (?, ?, ?, ?, ?, ?)", moves)
+            conn.executemany(
+                "INSERT INTO rooms VALUES (?, ?, ?) "
+                "ON CONFLICT(room_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                room_rows,
+            )
+            conn.executemany("DELETE FROM rooms WHERE room_id = ?", deleted_rooms)
+            conn.executemany(
+                "UPDATE rooms SET data = json_set(data, '$.last_activity', "
+                "MAX(COALESCE(json_extract(data, '$.last_activity'), 0), ?1)) WHERE room_id = ?2",
+                touches,
+            )
+            conn.executemany(
+                "INSERT INTO sessions VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET username = excluded.username, "
+                "last_activity = excluded.last_activity",
+                session_rows,
+            )
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?", deleted_sessions)
+            conn.executemany(
+                "INSERT INTO room_events (room_id, seq, type, data, ts, origin) VALUES (?, ?, ?, ?, ?, ?)",
+                events,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def flush(self, room_ids: set | None = None, session_ids: set | None = None) -> None:
+        """写入一批数据；指定 room_ids / session_ids 时只写入这些房间与会话的修改"""
+        async with self._flush_lock:
+            batch = self._take_batch(room_ids, session_ids)
+            if not any(batch):
+                return
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, *batch)
+            except Exception:
+                # 事务已回滚，把这一批放回队列，落子是恢复棋盘的唯一来源，不能丢弃
+                self._requeue(*batch)
+                raise
+            moves, room_rows, deleted_rooms, session_rows, deleted_sessions, events, touches = batch
+            self._stats["flushes"] += 1
+            self._stats["moves_written"] += len(moves)
+            self._stats["rooms_written"] += len(room_rows) + len(deleted_rooms)
+            self._stats["sessions_written"] += len(session_rows) + len(deleted_sessions)
+            self._stats["last_flush_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    def _requeue(self, moves: list, room_rows: list, deleted_rooms: list,
+                 session_rows: list, deleted_sessions: list, events: list, touches: list) -> None:
+        """写入失败时放回队列：落子与事件放在最前保持顺序，房间与会话重新标记为脏数据，下次写入时读取最新状态"""
+        self._pending_moves[:0] = moves
+        self._pending_events[:0] = events
+        self._dirty_rooms.update(row[0] for row in room_rows + deleted_rooms)
+        self._dirty_sessions.update(row[0] for row in session_rows + deleted_sessions)
+        for last_activity, room_id in touches:
+            self._pending_touches[room_id] = max(last_activity, self._pending_touches.get(room_id, 0))
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            **self._stats,
+            "pending": {
+                "rooms": len(self._dirty_rooms),
+                "sessions": len(self._dirty_sessions),
+                "moves": len(self._pending_moves),
+                "events": len(self._pending_events),
+                "touches": len(self._pending_touches),
+            },
+        }
+
+
+def _move_row(x: int, y: int, player: int) -> dict:
+    return {"x": x, "y": y, "player": player}
+
+
+def read_room(conn: sqlite3.Connection, room_id: str) -> dict | None:
+    """读取单个房间数据及其落子，房间不存在时返回 None"""
+    row = conn.execute("SELECT data FROM rooms WHERE room_id = ?", (room_id,)).fetchone()
+    if row is None:
+        return None
+    room = json.loads(row[0])
+    room["moves"] = [
+        _move_row(x, y, player)
+        for x, y, player in conn.execute("SELECT x, y, player FROM moves WHERE room_id = ? ORDER BY idx", (room_id,))
+    ]
+    return room
+
+
+def create_store(rooms: dict, sessions: dict) -> MemoryStore:
+    backend = os.getenv("GOMOKU_STORE", "memory")
+    if backend == "sqlite":
+        return SQLiteStore(rooms, sessions, os.getenv("GOMOKU_SQLITE_PATH", "gomoku.db"))
+    if backend != "memory":
+        raise ValueError(f"Unknown store backend: {backend}")
+    return MemoryStore(rooms, sessions)
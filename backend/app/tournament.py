@@ -0,0 +1,395 @@
+import asyncio
+import math
+import time
+import uuid
+from itertools import combinations
+
+from .gomoku import GomokuBoard, request_move, MAX_MOVE_RETRIES
+from .archive import archive_game, public_config
+
+
+# 赛事配置
+ELO_INITIAL = 1500
+ELO_K_FACTOR = 32
+BRADLEY_TERRY_ITERATIONS = 200
+BRADLEY_TERRY_TOLERANCE = 1e-6  # 强度的最大相对变化小于此值时停止迭代
+TOURNAMENT_RETENTION_SECONDS = 24 * 3600  # 结束后保留的时长
+TOURNAMENT_MAX_FINISHED = 100             # 最多保留的已结束赛事数
+
+# tournament_id -> 赛事数据
+tournaments: dict[str, dict] = {}
+# tournament_id -> 正在运行的赛事任务
+_tasks: dict[str, asyncio.Task] = {}
+# tournament_id -> ((已结束对局数, 轮空数), 积分榜)，有新对局结束前复用
+_standings_cache: dict[str, tuple[tuple[int, int], list[dict]]] = {}
+
+
+def round_robin_pairings(count: int, games_per_pair: int = 2) -> list[tuple[int, int]]:
+    """循环赛配对，返回 (黑方, 白方) 下标列表；同一对选手轮流执黑"""
+    pairings = []
+    for i, j in combinations(range(count), 2):
+        for game in range(games_per_pair):
+            pairings.append((i, j) if game % 2 == 0 else (j, i))
+    return pairings
+
+
+def swiss_pairings(standings: list[dict], played: set[frozenset]) -> tuple[list[tuple[int, int]], int | None]:
+    """
+    瑞士制配对：按积分和等级分排序后依次与最近的未交手对手配对
+
+    返回 (配对列表, 轮空选手下标)。
+    """
+    order = sorted(range(len(standings)), key=lambda i: (-standings[i]["points"], -standings[i]["elo"], i))
+    bye = None
+    if len(order) % 2 == 1:
+        # 积分最低且尚未轮空的选手轮空
+        for index in reversed(order):
+            if not standings[index]["byes"]:
+                bye = index
+                break
+        if bye is None:
+            bye = order[-1]
+        order.remove(bye)
+
+    pairings = []
+    unpaired = list(order)
+    while unpaired:
+        first = unpaired.pop(0)
+        partner = next((other for other in unpaired if frozenset((first, other)) not in played), unpaired[0])
+        unpaired.remove(partner)
+        # 执黑次数较少的一方执黑
+        if standings[first]["blacks"] <= standings[partner]["blacks"]:
+            pairings.append((first, partner))
+        else:
+            pairings.append((partner, first))
+    return pairings, bye
+
+
+def expected_score(rating_a: float, rating_b: float) -> float:
+    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+
+def compute_elo(count: int, games: list[dict]) -> list[float]:
+    """按对局完成顺序逐局更新 Elo 等级分"""
+    ratings = [float(ELO_INITIAL)] * count
+    finished = sorted((game for game in games if game["score"] is not None), key=lambda game: game["finished_at"] or 0)
+    for game in finished:
+        black, white = game["black"], game["white"]
+        expected = expected_score(ratings[black], ratings[white])
+        delta = ELO_K_FACTOR * (game["score"] - expected)
+        ratings[black] += delta
+        ratings[white] -= delta
+    return ratings
+
+
+def compute_bradley_terry(count: int, games: list[dict]) -> list[float]:
+    """
+    用 MM 迭代估计 Bradley-Terry 强度，平局记为各胜半局
+
+    结果换算为与 Elo 相同刻度的分数，平均值为 ELO_INITIAL。
+    """
+    if count == 0:
+        return []
+    wins = [0.0] * count
+    # 每名选手对各对手的对局数，迭代时只遍历自己的对手
+    opponents: list[dict[int, int]] = [{} for _ in range(count)]
+    for game in games:
+        if game["score"] is None:
+            continue
+        black, white = game["black"], game["white"]
+        wins[black] += game["score"]
+        wins[white] += 1 - game["score"]
+        opponents[black][white] = opponents[black].get(white, 0) + 1
+        opponents[white][black] = opponents[white].get(black, 0) + 1
+    pairs = [list(opponents[i].items()) for i in range(count)]
+
+    # 加入一局与虚拟平均对手的平局作为先验，避免全胜或全负时发散
+    strengths = [1.0] * count
+    for _ in range(BRADLEY_TERRY_ITERATIONS):
+        updated = []
+        for i in range(count):
+            strength = strengths[i]
+            denominator = 1 / (strength + 1)
+            for j, n in pairs[i]:
+                denominator += n / (strength + strengths[j])
+            updated.append((wins[i] + 0.5) / denominator)
+        scale = math.exp(sum(math.log(value) for value in updated) / count)
+        updated = [value / scale for value in updated]
+        converged = max(abs(new - old) / old for new, old in zip(updated, strengths)) < BRADLEY_TERRY_TOLERANCE
+        strengths = updated
+        if converged:
+            break
+    return [ELO_INITIAL + 400 * math.log10(value) for value in strengths]
+
+
+def _standings(tournament: dict) -> list[dict]:
+    """积分榜，按已结束对局数与轮空数缓存，有新对局结束时才重新计算"""
+    key = (sum(1 for game in tournament["games"] if game["status"] == "finished"), len(tournament["byes"]))
+    cached = _standings_cache.get(tournament["id"])
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    table = _compute_standings(tournament)
+    _standings_cache[tournament["id"]] = (key, table)
+    return table
+
+
+def _compute_standings(tournament: dict) -> list[dict]:
+    count = len(tournament["entries"])
+    table = [
+        {"name": entry["name"], "wins": 0, "losses": 0, "draws": 0, "forfeits": 0, "points": 0.0, "blacks": 0, "byes": 0}
+        for entry in tournament["entries"]
+    ]
+    for index in tournament["byes"]:
+        table[index]["byes"] += 1
+        table[index]["points"] += 1
+    finished = [game for game in tournament["games"] if game["status"] == "finished"]
+    for game in finished:
+        black, white = table[game["black"]], table[game["white"]]
+        black["blacks"] += 1
+        if game["score"] == 1:
+            black["wins"] += 1
+            white["losses"] += 1
+            black["points"] += 1
+        elif game["score"] == 0:
+            white["wins"] += 1
+            black["losses"] += 1
+            white["points"] += 1
+        elif game["score"] == 0.5:
+            black["draws"] += 1
+            white["draws"] += 1
+            black["points"] += 0.5
+            white["points"] += 0.5
+        if game["forfeit"] is not None:
+            table[game["forfeit"]]["forfeits"] += 1
+    elo = compute_elo(count, finished)
+    bradley_terry = compute_bradley_terry(count, finished)
+    for index, row in enumerate(table):
+        row["elo"] = round(elo[index], 1)
+        row["bradley_terry"] = round(bradley_terry[index], 1)
+    return table
+
+
+def create_tournament(entries: list[dict], format: str = "round_robin", rounds: int | None = None,
+                      games_per_pair: int = 2, board_size: int = 15, max_concurrent_games: int = 4,
+                      max_per_endpoint: int = 2, max_retries: int = MAX_MOVE_RETRIES) -> str:
+    prune_tournaments()
+    tournament_id = str(uuid.uuid4())
+    if format == "swiss" and rounds is None:
+        rounds = max(1, math.ceil(math.log2(len(entries))))
+    tournaments[tournament_id] = {
+        "id": tournament_id,
+        "format": format,
+        "rounds": rounds,
+        "games_per_pair": games_per_pair,
+        "board_size": board_size,
+        "max_concurrent_games": max_concurrent_games,
+        "max_per_endpoint": max_per_endpoint,
+        "max_retries": max_retries,
+        "entries": entries,
+        "games": [],
+        "byes": [],
+        "current_round": 0,
+        "status": "pending",  # pending / running / finished / cancelled / failed
+        "error": None,
+        "created_at": time.time(),
+        "finished_at": None,
+    }
+    return tournament_id
+
+
+def prune_tournaments(now: float | None = None) -> int:
+    """删除超过保留时长的已结束赛事，并只保留最近的 TOURNAMENT_MAX_FINISHED 个，返回删除数"""
+    now = now or time.time()
+    finished = sorted(
+        (tournament for tournament_id, tournament in tournaments.items()
+         if tournament_id not in _tasks and tournament["finished_at"] is not None),
+        key=lambda tournament: tournament["finished_at"],
+    )
+    expired = [tournament for tournament in finished if now - tournament["finished_at"] > TOURNAMENT_RETENTION_SECONDS]
+    overflow = finished[len(expired):len(finished) - TOURNAMENT_MAX_FINISHED]
+    for tournament in expired + overflow:
+        del tournaments[tournament["id"]]
+        _standings_cache.pop(tournament["id"], None)
+    return len(expired) + len(overflow)
+
+
+def start_tournament(tournament_id: str) -> None:
+    tournament = tournaments[tournament_id]
+    tournament["status"] = "running"
+    _tasks[tournament_id] = asyncio.ensure_future(_run_tournament(tournament_id))
+
+
+def cancel_tournament(tournament_id: str) -> bool:
+    task = _tasks.pop(tournament_id, None)
+    if task is None or task.done():
+        return False
+    task.cancel()
+    _cancel_games(tournaments[tournament_id])
+    return True
+
+
+def _cancel_games(tournament: dict) -> None:
+    tournament["status"] = "cancelled"
+    _cancel_pending_games(tournament)
+
+
+def _cancel_pending_games(tournament: dict) -> None:
+    for game in tournament["games"]:
+        if game["status"] in ("scheduled", "running"):
+            game["status"] = "cancelled"
+
+
+async def stop_all_tournaments() -> None:
+    tasks = list(_tasks.values())
+    _tasks.clear()
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def tournament_summary(tournament: dict) -> dict:
+    """赛事进度与积分榜，不包含API密钥"""
+    games = tournament["games"]
+    return {
+        "id": tournament["id"],
+        "format": tournament["format"],
+        "status": tournament["status"],
+        "error": tournament["error"],
+        "rounds": tournament["rounds"],
+        "current_round": tournament["current_round"],
+        "board_size": tournament["board_size"],
+        "entries": [{"name": entry["name"], "model": entry["ai_config"].get("model")} for entry in tournament["entries"]],
+        "progress": {
+            "total": len(games),
+            "finished": sum(1 for game in games if game["status"] == "finished"),
+            "running": sum(1 for game in games if game["status"] == "running"),
+        },
+        "standings": _standings(tournament),
+        "games": games,
+        "created_at": tournament["created_at"],
+        "finished_at": tournament["finished_at"],
+    }
+
+
+class _Limits:
+    """全局并发对局数与单个模型端点并发请求数限制"""
+
+    def __init__(self, max_games: int, max_per_endpoint: int):
+        self.games = asyncio.Semaphore(max_games)
+        self.max_per_endpoint = max_per_endpoint
+        self.endpoints: dict[str, asyncio.Semaphore] = {}
+
+    def endpoint(self, url: str) -> asyncio.Semaphore:
+        semaphore = self.endpoints.get(url)
+        if semaphore is None:
+            semaphore = self.endpoints[url] = asyncio.Semaphore(self.max_per_endpoint)
+        return semaphore
+
+
+async def _play_game(tournament: dict, game: dict, limits: _Limits) -> None:
+    entries = tournament["entries"]
+    configs = {1: entries[game["black"]]["ai_config"], 2: entries[game["white"]]["ai_config"]}
+    async with limits.games:
+        game["status"] = "running"
+        game["started_at"] = time.time()
+        board = GomokuBoard(tournament["board_size"])
+        history = []
+        while True:
+            player = board.current_player
+            config = configs[player]
+            async with limits.endpoint(config.get("url", "")):
+                result = await request_move(board, player, config, max_retries=tournament["max_retries"], moves=history)
+            if result["move"] is None:
+                # 用完重试次数仍无合法落子，判负
+                game["forfeit"] = game["black"] if player == 1 else game["white"]
+                game["score"] = 0 if player == 1 else 1
+                game["error"] = result["error"]
+                break
+            x, y = result["move"]
+            board.make_move(x, y)
+            game["moves"].append([x, y])
+            history.append({"x": x, "y": y, "player": player})
+            winner = board.check_winner()
+            if winner != 0:
+                game["score"] = 1 if winner == 1 else 0
+                break
+            if board.is_full():
+                game["score"] = 0.5
+                break
+        game["status"] = "finished"
+        game["finished_at"] = time.time()
+        archive_game(history, tournament["board_size"], _winner(game), {
+            "source": "tournament",
+            "tournament_id": tournament["id"],
+            "round": game["round"],
+            "black": entries[game["black"]]["name"],
+            "white": entries[game["white"]]["name"],
+            "ai_configs": {"black": public_config(configs[1]), "white": public_config(configs[2])},
+            "forfeit": game["forfeit"],
+            "error": game["error"],
+        }, game["started_at"], game["finished_at"], complete=game["forfeit"] is None)
+
+
+def _winner(game: dict) -> int:
+    """黑方得分 -> 胜者（1 黑、2 白、0 平）"""
+    return {1: 1, 0: 2}.get(game["score"], 0)
+
+
+def _new_game(round_number: int, black: int, white: int) -> dict:
+    return {
+        "round": round_number,
+        "black": black,
+        "white": white,
+        "status": "scheduled",  # scheduled / running / finished / cancelled
+        "score": None,  # 黑方得分：1 胜、0.5 平、0 负
+        "forfeit": None,
+        "error": None,
+        "moves": [],
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+async def _run_round(tournament: dict, games: list[dict], limits: _Limits) -> None:
+    """同时进行一轮对局；任一对局出错或本轮被取消时取消其余对局并等待其结束"""
+    tournament["games"].extend(games)
+    tasks = [asyncio.ensure_future(_play_game(tournament, game, limits)) for game in games]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _run_tournament(tournament_id: str) -> None:
+    tournament = tournaments[tournament_id]
+    limits = _Limits(tournament["max_concurrent_games"], tournament["max_per_endpoint"])
+    try:
+        if tournament["format"] == "swiss":
+            played: set[frozenset] = set()
+            for round_number in range(1, tournament["rounds"] + 1):
+                tournament["current_round"] = round_number
+                pairings, bye = swiss_pairings(_standings(tournament), played)
+                if bye is not None:
+                    tournament["byes"].append(bye)
+                played.update(frozenset(pair) for pair in pairings)
+                await _run_round(tournament, [_new_game(round_number, black, white) for black, white in pairings], limits)
+        else:
+            tournament["current_round"] = 1
+            pairings = round_robin_pairings(len(tournament["entries"]), tournament["games_per_pair"])
+            await _run_round(tournament, [_new_game(1, black, white) for black, white in pairings], limits)
+        tournament["status"] = "finished"
+    except asyncio.CancelledError:
+        _cancel_games(tournament)
+        raise
+    except Exception as e:
+        tournament["status"] = "failed"
+        tournament["error"] = str(e)
+        _cancel_pending_games(tournament)
+    finally:
+        tournament["finished_at"] = time.time()
+        if _tasks.get(tournament_id) is asyncio.current_task():
+            del _tasks[tournament_id]
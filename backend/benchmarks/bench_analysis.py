@@ -0,0 +1,102 @@
+"""
+棋谱批量分析吞吐
+
+用本地机器人生成若干局棋谱，比较 numpy 批量评估与逐局面 Python 循环统计同样棋形的耗时。
+需要安装 numpy。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_analysis.py --games 200 --baseline-games 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.analysis import ANALYSIS_AVAILABLE, analyze_games  # noqa: E402
+from app.board import Board  # noqa: E402
+from app.bots import choose_bot_move  # noqa: E402
+
+
+def generate_game(size: int, seed: int) -> list[dict]:
+    """greedy 执黑、random 执白，局面多样且对局较长"""
+    board = Board(size)
+    moves = []
+    player = 1
+    while True:
+        strategy = "greedy" if player == 1 else "random"
+        x, y = choose_bot_move(board, player, strategy, seed * 1000 + len(moves))
+        win = board.place(x, y, player)
+        moves.append({"x": x, "y": y, "player": player})
+        if win or board.is_full():
+            return moves
+        player = 3 - player
+
+
+def python_pattern_counts(rows: list[list[int]], player: int) -> tuple[int, int, int]:
+    """逐窗口的 Python 循环：(成五窗口, 冲四窗口, 活三窗口)"""
+    size = len(rows)
+    fives = fours = threes = 0
+    for dx, dy in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        for x in range(size):
+            for y in range(size):
+                cells = [(x + k * dx, y + k * dy) for k in range(6)]
+                if all(0 <= cx < size and 0 <= cy < size for cx, cy in cells[:5]):
+                    values = [rows[cx][cy] for cx, cy in cells[:5]]
+                    fives += values.count(player) == 5
+                    fours += values.count(player) == 4 and values.count(0) == 1
+                if all(0 <= cx < size and 0 <= cy < size for cx, cy in cells):
+                    values = [rows[cx][cy] for cx, cy in cells]
+                    inner = values[1:5]
+                    threes += values[0] == 0 and values[5] == 0 and inner.count(player) == 3 and inner.count(0) == 1
+    return fives, fours, threes
+
+
+def python_baseline(games: list[list[dict]], size: int) -> int:
+    positions = 0
+    for moves in games:
+        board = Board(size)
+        for move in moves:
+            board.place(move["x"], move["y"], move["player"])
+            rows = board.to_rows()
+            for player in (1, 2):
+                python_pattern_counts(rows, player)
+            positions += 1
+    return positions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--baseline-games", type=int, default=20, help="Python 循环只跑其中若干局，再按局面数折算")
+    parser.add_argument("--size", type=int, default=15)
+    args = parser.parse_args()
+    if not ANALYSIS_AVAILABLE:
+        sys.exit("numpy is required: pip install numpy")
+
+    games = [generate_game(args.size, seed) for seed in range(args.games)]
+    positions = sum(len(moves) for moves in games)
+
+    start = time.perf_counter()
+    results = analyze_games([(moves, args.size) for moves in games])
+    batched = time.perf_counter() - start
+
+    start = time.perf_counter()
+    baseline_positions = python_baseline(games[:args.baseline_games], args.size)
+    baseline = time.perf_counter() - start
+
+    print(json.dumps({
+        "games": len(games),
+        "positions": positions,
+        "blunders": sum(item["blunder"] for game in results for item in game),
+        "missed_wins": sum(item["missed_win"] for game in results for item in game),
+        "numpy_positions_per_s": round(positions / batched),
+        "python_positions_per_s": round(baseline_positions / baseline),
+        "speedup": round((positions / batched) / (baseline_positions / baseline), 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+搜索引擎强度与耗时
+
+各强度等级的引擎分别执黑、执白与本地 threat 机器人对弈，统计胜负与每步搜索耗时。
+引擎受时间预算影响，结果在不同机器上会略有差异。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_engine.py --levels 1 2 3 --games 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.board import Board  # noqa: E402
+from app.bots import choose_bot_move  # noqa: E402
+from app.engine import ENGINE_LEVELS, engine_stats, search_move  # noqa: E402
+
+
+def play(level: int, engine_player: int, seed: int, size: int) -> tuple[int, int, list[float]]:
+    """返回 (胜者, 总步数, 引擎每步耗时)，胜者为 0 表示平局"""
+    board = Board(size)
+    player = 1
+    timings = []
+    while True:
+        if player == engine_player:
+            result = search_move(board, player, level)
+            move = result["move"]
+            timings.append(result["elapsed_ms"])
+        else:
+            move = choose_bot_move(board, player, "threat", seed + board.stone_count)
+        if board.place(*move, player):
+            return player, board.stone_count, timings
+        if board.is_full():
+            return 0, board.stone_count, timings
+        player = 3 - player
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=sorted(ENGINE_LEVELS))
+    parser.add_argument("--games", type=int, default=5, help="每个等级执黑、执白各下的局数")
+    parser.add_argument("--size", type=int, default=15)
+    args = parser.parse_args()
+
+    report = {}
+    for level in args.levels:
+        wins = losses = draws = 0
+        timings = []
+        for seed in range(args.games):
+            for engine_player in (1, 2):
+                winner, _, game_timings = play(level, engine_player, seed, args.size)
+                timings.extend(game_timings)
+                if winner == engine_player:
+                    wins += 1
+                elif winner == 0:
+                    draws += 1
+                else:
+                    losses += 1
+        timings.sort()
+        report[level] = {
+            "wins": wins,
+            "losses": losses,
+            "draws": draws,
+            "mean_ms": round(statistics.fmean(timings), 2),
+            "p99_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 2),
+        }
+    print(json.dumps({"vs": "threat bot", "levels": report, "engine": engine_stats()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
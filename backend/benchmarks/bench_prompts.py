@@ -0,0 +1,70 @@
+"""
+提示词编码体积对比
+
+用本地机器人自我对弈生成局面，按对局进度抽样，比较各编码下提示词的字符数与 token 数。
+安装 tiktoken 时使用 cl100k_base 计数，否则按约 4 个字符一个 token 估算。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_prompts.py --size 15 --games 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.board import Board  # noqa: E402
+from app.bots import choose_bot_move  # noqa: E402
+from app.prompts import PROMPT_ENCODINGS, measure_encodings, token_counter_name  # noqa: E402
+
+
+SAMPLE_POINTS = (0, 10, 30, 60)
+
+
+def self_play_positions(size: int, seed: int) -> list[tuple[list[list[int]], int, list[dict]]]:
+    """返回对局中落子数为 SAMPLE_POINTS 时的 (棋盘, 执棋方, 落子记录)"""
+    board = Board(size)
+    moves = []
+    positions = []
+    player = 1
+    while True:
+        if len(moves) in SAMPLE_POINTS:
+            positions.append((board.to_rows(), player, list(moves)))
+        if board.winner() or board.is_full():
+            break
+        x, y = choose_bot_move(board, player, "threat", seed + len(moves))
+        board.place(x, y, player)
+        moves.append({"x": x, "y": y, "player": player})
+        player = 3 - player
+    return positions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=15)
+    parser.add_argument("--games", type=int, default=5)
+    args = parser.parse_args()
+
+    by_stones: dict[int, dict[str, list[int]]] = {}
+    for seed in range(args.games):
+        for board_state, player, moves in self_play_positions(args.size, seed):
+            sizes = measure_encodings(board_state, player, moves)
+            bucket = by_stones.setdefault(len(moves), {encoding: [] for encoding in PROMPT_ENCODINGS})
+            for encoding in PROMPT_ENCODINGS:
+                bucket[encoding].append(sizes[encoding]["tokens"])
+
+    report = {
+        "board_size": args.size,
+        "token_counter": token_counter_name(),
+        "mean_tokens_by_stones": {
+            stones: {encoding: round(statistics.fmean(values)) for encoding, values in bucket.items()}
+            for stones, bucket in sorted(by_stones.items())
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+房间与对局流程压测
+
+模拟 K 个房间 × 2 名玩家 + 若干观战者，完整走一遍
+/auth/login → /rooms/create → /rooms/join → /set_ai_config → /lock_config
+→ /set_ready → /step → /confirm_move，同时观战者轮询 GET /rooms/{room_id}。
+AI 使用本地确定性机器人（或进程内模拟模型），结果可复现。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_rooms.py --rooms 50 --spectators 2
+    python benchmarks/bench_rooms.py --base-url http://127.0.0.1:8000 --rooms 200
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Recorder:
+    """按接口记录请求耗时"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.failures: dict[str, int] = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.failures[name] += 1
+        return response
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        total = 0
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            total += len(values)
+            endpoints[name] = {
+                "count": len(values),
+                "failures": self.failures[name],
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "mean_ms": round(statistics.fmean(values) * 1000, 2),
+            }
+        return {
+            "requests": total,
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def ai_config(args, seed: int) -> dict:
+    if args.provider == "mock":
+        return {"provider": "mock", "model": f"mock-{args.bot}", "seed": seed}
+    return {"provider": "bot", "bot": args.bot, "seed": seed}
+
+
+async def play_room(client: httpx.AsyncClient, recorder: Recorder, args, index: int, stats: dict) -> None:
+    login_a = (await recorder.request(client, "login", "POST", "/auth/login")).json()
+    login_b = (await recorder.request(client, "login", "POST", "/auth/login")).json()
+    owner, guest = login_a["username"], login_b["username"]
+
+    created = (await recorder.request(client, "rooms_create", "POST", "/rooms/create", json={"username": owner})).json()
+    room_id = created["room_id"]
+    await recorder.request(client, "rooms_join", "POST", "/rooms/join", json={"room_id": room_id, "username": guest})
+
+    for offset, username in enumerate((owner, guest)):
+        body = {"room_id": room_id, "username": username}
+        await recorder.request(client, "set_ai_config", "POST", "/set_ai_config",
+                               json={**body, "ai_config": ai_config(args, args.seed + index * 2 + offset)})
+        await recorder.request(client, "lock_config", "POST", "/lock_config", json={**body, "locked": True})
+        await recorder.request(client, "set_ready", "POST", "/set_ready", json={**body, "ready": True})
+
+    room = (await recorder.request(client, "rooms_get", "GET", f"/rooms/{room_id}")).json()
+    players = room["room"]["players"]
+    version = room["version"]
+    current_player = 1
+    finished = asyncio.Event()
+
+    async def spectate():
+        known = version
+        while not finished.is_set():
+            params = {"since": known} if args.delta else None
+            response = await recorder.request(client, "rooms_poll", "GET", f"/rooms/{room_id}", params=params)
+            if response.status_code == 200:
+                known = response.json().get("version", known)
+            await asyncio.sleep(args.poll_interval)
+
+    spectators = [asyncio.ensure_future(spectate()) for _ in range(args.spectators)]
+    try:
+        for _ in range(args.max_moves):
+            body = {"room_id": room_id, "username": players[current_player - 1]}
+            stepped = (await recorder.request(client, "step", "POST", "/step", json=body)).json()
+            if not stepped["success"]:
+                stats["step_failures"] += 1
+                break
+            await recorder.request(client, "confirm_move", "POST", "/confirm_move", json=body)
+            stats["moves"] += 1
+            # 与前端一致：落子后拉取一次房间增量判断胜负
+            delta = (await recorder.request(client, "rooms_get", "GET", f"/rooms/{room_id}",
+                                            params={"since": version})).json()
+            version = delta["version"]
+            state = delta.get("changed") if delta.get("delta") else delta.get("room")
+            if state.get("winner"):
+                stats["finished_games"] += 1
+                break
+            current_player = state.get("current_player", 3 - current_player)
+    finally:
+        finished.set()
+        await asyncio.gather(*spectators)
+
+
+async def run(args) -> dict:
+    if args.base_url:
+        transport = None
+        base_url = args.base_url.rstrip("/")
+    else:
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+        if args.memory:
+            tracemalloc.start()
+
+    recorder = Recorder()
+    stats = {"moves": 0, "finished_games": 0, "step_failures": 0}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=60) as client:
+        baseline = None
+        if tracemalloc.is_tracing():
+            gc.collect()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def guarded(index: int):
+            async with semaphore:
+                await play_room(client, recorder, args, index, stats)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(guarded(index) for index in range(args.rooms)))
+        elapsed = time.perf_counter() - start
+
+        result = recorder.summary(elapsed)
+        result.update(stats)
+        result["moves_per_s"] = round(stats["moves"] / elapsed, 1) if elapsed else 0.0
+        if baseline is not None:
+            gc.collect()
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            # 房间仍保留在内存中，差值即房间、会话与事件历史的占用
+            result["memory_per_room_kb"] = round((current - baseline) / args.rooms / 1024, 2)
+    return result
+
+
+def print_report(result: dict) -> None:
+    print(f"requests={result['requests']} elapsed={result['elapsed_s']}s rps={result['rps']} "
+          f"moves={result['moves']} moves/s={result['moves_per_s']} finished_games={result['finished_games']} "
+          f"step_failures={result['step_failures']}")
+    if "memory_per_room_kb" in result:
+        print(f"memory_per_room={result['memory_per_room_kb']} KiB")
+    print(f"{'endpoint':<16}{'count':>8}{'fail':>6}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for name, row in result["endpoints"].items():
+        print(f"{name:<16}{row['count']:>8}{row['failures']:>6}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['mean_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gomoku room/move throughput benchmark")
+    parser.add_argument("--rooms", type=int, default=20, help="number of rooms (2 players each)")
+    parser.add_argument("--spectators", type=int, default=1, help="pollers per room")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="seconds between spectator polls")
+    parser.add_argument("--delta", action="store_true", help="spectators poll with ?since=<version>")
+    parser.add_argument("--max-moves", type=int, default=225)
+    parser.add_argument("--concurrency", type=int, default=50, help="rooms played at the same time")
+    parser.add_argument("--provider", choices=("bot", "mock"), default="bot")
+    parser.add_argument("--bot", choices=("random", "greedy", "threat"), default="threat")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true",
+                        help="measure memory per room with tracemalloc (in-process only, slows requests down)")
+    parser.add_argument("--base-url", default="", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--json", dest="json_path", default="", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.provider == "mock":
+        from app import mock_llm
+        # 进程内模拟模型默认不加延迟，压测的是服务端本身
+        mock_llm.configure(latency_ms=0, jitter_ms=0, seed=args.seed)
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,28 @@ interface AIConfig {
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL ?? 'http://localhost:8000'
 
+const ROOM_EVENT_TYPES = [
+  'move',
+  'pending_move',
+  'log',
+  'chat',
+  'ready',
+  'lock',
+  'config',
+  'players',
+  'owner',
+  'match',
+  'error',
+]
+
+// 每次操作生成一个幂等键，网络重试时服务端返回同一结果，不会重复调用模型或重复落子
+function idempotencyHeaders() {
+  const key = typeof crypto !== 'undefined' && 'randomUUID' in crypto
+    ? crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  return { headers: { 'Idempotency-Key': key } }
+}
+
 export interface MultiplayerRoom {
   id?: string
   players: string[]
@@ -30,7 +52,165 @@ export interface MultiplayerRoom {
   config_locked: Record<string, boolean | undefined>
   ready_status: Record<string, boolean | undefined>
   config_changes_left: Record<string, number | undefined>
+  auto_play?: boolean
+  match_status?: string
   error?: string | null
+  version?: number
+}
+
+interface RoomEvent {
+  seq: number
+  type: string
+  data: unknown
+}
+
+type ChatMessage = MultiplayerRoom['messages'][number]
+
+interface MoveEventData {
+  x: number
+  y: number
+  player: number
+  current_player: number
+  winner: number
+  move_count: number
+}
+
+interface PlayerEventData {
+  username: string
+  ready?: boolean
+  locked?: boolean
+  ai_config?: AIConfig
+  config_changes_left?: number
+}
+
+interface PlayersEventData {
+  players: string[]
+  owner?: string
+  owner_preferred_color?: 'black' | 'white'
+  current_player: number
+}
+
+interface RoomDelta {
+  changed: Partial<MultiplayerRoom> & { board_wire?: string }
+  appended: Pick<MultiplayerRoom, 'moves' | 'logs' | 'messages'>
+}
+
+// 房间事件缺失或乱序后，合并成一次延迟拉取
+const RESYNC_DELAY_MS = 300
+
+// 紧凑棋盘格式 '<size>:<黑方掩码>:<白方掩码>'，第 x 行第 y 列对应第 x * (size + 1) + y 位
+function decodeBoardWire(wire: string): number[][] {
+  const [sizeText, black, white] = wire.split(':')
+  const size = Number(sizeText)
+  const blackMask = BigInt(`0x${black}`)
+  const whiteMask = BigInt(`0x${white}`)
+  return Array.from({ length: size }, (_, x) =>
+    Array.from({ length: size }, (_, y) => {
+      const bit = 1n << BigInt(x * (size + 1) + y)
+      if (blackMask & bit) {
+        return 1
+      }
+      return whiteMask & bit ? 2 : 0
+    })
+  )
+}
+
+function mergeRoomDelta(room: MultiplayerRoom, delta: RoomDelta): MultiplayerRoom {
+  const { board_wire: boardWire, ...changed } = delta.changed
+  return {
+    ...room,
+    ...changed,
+    board: boardWire ? decodeBoardWire(boardWire) : room.board,
+    moves: [...room.moves, ...delta.appended.moves],
+    logs: [...room.logs, ...delta.appended.logs],
+    // 服务端只保留最近的10条消息
+    messages: [...room.messages, ...delta.appended.messages].slice(-10),
+  }
+}
+
+function keepPlayers<T>(record: Record<string, T> | undefined, players: string[]): Record<string, T> {
+  return Object.fromEntries(Object.entries(record ?? {}).filter(([player]) => players.includes(player)))
+}
+
+// 把房间事件的数据直接合入本地状态；无法合并时返回 null，由调用方重新拉取
+function applyRoomEvent(room: MultiplayerRoom, event: RoomEvent): MultiplayerRoom | null {
+  switch (event.type) {
+    case 'move': {
+      const data = event.data as MoveEventData
+      if (data.move_count !== room.moves.length + 1) {
+        return null
+      }
+      const { x, y, player } = data
+      const board = room.board.map((row, rowIndex) =>
+        rowIndex === x ? row.map((cell, colIndex) => (colIndex === y ? player : cell)) : row
+      )
+      return {
+        ...room,
+        board,
+        moves: [...room.moves, { x, y, player }],
+        current_player: data.current_player,
+        winner: data.winner,
+        pending_move: null,
+        can_confirm: false,
+      }
+    }
+    case 'pending_move': {
+      const data = event.data as Pick<MultiplayerRoom, 'pending_move' | 'can_confirm'>
+      return { ...room, pending_move: data.pending_move, can_confirm: data.can_confirm }
+    }
+    case 'log':
+      return { ...room, logs: [...room.logs, (event.data as { log: string }).log] }
+    case 'chat':
+      // 服务端只保留最近的10条消息
+      return { ...room, messages: [...room.messages, event.data as ChatMessage].slice(-10) }
+    case 'ready': {
+      const data = event.data as PlayerEventData
+      return {
+        ...room,
+        ready_status: { ...room.ready_status, [data.username]: data.ready },
+        config_changes_left: { ...room.config_changes_left, [data.username]: data.config_changes_left },
+      }
+    }
+    case 'lock': {
+      const data = event.data as PlayerEventData
+      return {
+        ...room,
+        config_locked: { ...room.config_locked, [data.username]: data.locked },
+        config_changes_left: { ...room.config_changes_left, [data.username]: data.config_changes_left },
+      }
+    }
+    case 'config': {
+      const data = event.data as PlayerEventData
+      return {
+        ...room,
+        ai_configs: { ...room.ai_configs, [data.username]: data.ai_config },
+        config_changes_left: { ...room.config_changes_left, [data.username]: data.config_changes_left },
+      }
+    }
+    case 'players':
+    case 'owner': {
+      // 离开房间的玩家的配置与状态在服务端已一并删除
+      const data = event.data as PlayersEventData
+      return {
+        ...room,
+        players: data.players,
+        owner: data.owner,
+        owner_preferred_color: data.owner_preferred_color,
+        current_player: data.current_player,
+        ai_configs: keepPlayers(room.ai_configs, data.players),
+        ready_status: keepPlayers(room.ready_status, data.players),
+        config_locked: keepPlayers(room.config_locked, data.players),
+      }
+    }
+    case 'match': {
+      const data = event.data as Pick<MultiplayerRoom, 'auto_play' | 'match_status'>
+      return { ...room, auto_play: data.auto_play, match_status: data.match_status }
+    }
+    case 'error':
+      return { ...room, error: (event.data as { error: string | null }).error }
+    default:
+      return null
+  }
 }
 
 export function useMultiplayerBattle() {
@@ -48,6 +228,11 @@ export function useMultiplayerBattle() {
   const [error, setError] = useState<string | null>(null)
   const [shouldPoll, setShouldPoll] = useState(true)
   const pollIntervalRef = useRef<ReturnType<typeof setInterval> | null>(null)
+  const resyncTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null)
+  // 本地状态对应的房间版本（即最后合入的事件序号），0 表示尚未同步
+  const versionRef = useRef(0)
+  // 最近一次拉取返回的 ETag，未变化时服务端返回 304
+  const etagRef = useRef<string | null>(null)
   const { username, initializing, login } = useUser()
 
   useEffect(() => {
@@ -57,6 +242,11 @@ export function useMultiplayerBattle() {
     }
   }, [roomId, navigate])
 
+  useEffect(() => {
+    versionRef.current = 0
+    etagRef.current = null
+  }, [roomId])
+
   const stopPolling = useCallback(() => {
     setShouldPoll(false)
     if (pollIntervalRef.current) {
@@ -70,9 +260,31 @@ export function useMultiplayerBattle() {
       return
     }
     try {
-      const response = await axios.get(`${API_BASE_URL}/rooms/${roomId}`)
+      // 已同步过时只请求该版本之后的增量，房间未变化时服务端返回 304
+      const since = versionRef.current || undefined
+      const response = await axios.get(`${API_BASE_URL}/rooms/${roomId}`, {
+        params: since ? { since } : undefined,
+        headers: etagRef.current ? { 'If-None-Match': etagRef.current } : undefined,
+        validateStatus: (status) => status === 304 || (status >= 200 && status < 300),
+      })
+      if (response.status === 304) {
+        return
+      }
       if (response.data.success) {
-        setRoom(response.data.room as MultiplayerRoom)
+        const version = response.data.version ?? 0
+        if (response.data.delta) {
+          // 增量只能合入请求时的版本；期间已合入其他事件时丢弃，由事件流继续更新
+          if (versionRef.current !== since) {
+            return
+          }
+          versionRef.current = version
+          setRoom((current) => (current ? mergeRoomDelta(current, response.data as RoomDelta) : current))
+        } else if (version >= versionRef.current) {
+          // 请求期间已经通过事件合入了更新的状态时丢弃这次结果
+          versionRef.current = version
+          setRoom(response.data.room as MultiplayerRoom)
+        }
+        etagRef.current = response.headers.etag ?? null
       } else {
         const messageText = response.data.message ?? '房间不可用'
         message.error(messageText)
@@ -99,6 +311,37 @@ export function useMultiplayerBattle() {
     }
   }, [roomId, navigate, shouldPoll, stopPolling])
 
+  const scheduleResync = useCallback(() => {
+    if (resyncTimerRef.current) {
+      return
+    }
+    resyncTimerRef.current = setTimeout(() => {
+      resyncTimerRef.current = null
+      fetchRoom()
+    }, RESYNC_DELAY_MS)
+  }, [fetchRoom])
+
+  const handleRoomEvent = useCallback((payload: RoomEvent) => {
+    if (payload.seq <= versionRef.current) {
+      // 已经包含在拉取到的房间状态中
+      return
+    }
+    if (versionRef.current === 0 || payload.seq !== versionRef.current + 1) {
+      // 中间缺了事件，无法增量合并
+      scheduleResync()
+      return
+    }
+    versionRef.current = payload.seq
+    setRoom((current) => {
+      const next = current ? applyRoomEvent(current, payload) : null
+      if (!next) {
+        scheduleResync()
+        return current
+      }
+      return next
+    })
+  }, [scheduleResync])
+
   useEffect(() => {
     if (initializing || !roomId || !shouldPoll) {
       return
@@ -124,19 +367,61 @@ export function useMultiplayerBattle() {
       if (!active) {
         return
       }
-      pollIntervalRef.current = setInterval(fetchRoom, 2000)
+
+      const startPolling = () => {
+        if (!pollIntervalRef.current) {
+          pollIntervalRef.current = setInterval(fetchRoom, 2000)
+        }
+      }
+
+      if (typeof EventSource === 'undefined') {
+        startPolling()
+        return
+      }
+
+      // 通过服务器推送的房间事件刷新，断线时浏览器会携带 Last-Event-ID 自动续传
+      eventSource = new EventSource(`${API_BASE_URL}/rooms/${roomId}/events`)
+      // 首次连接、续传失败或服务端要求重新同步时收到完整快照
+      eventSource.addEventListener('snapshot', (event) => {
+        const payload = JSON.parse((event as MessageEvent).data)
+        versionRef.current = payload.seq
+        setRoom(payload.data as MultiplayerRoom)
+      })
+      eventSource.addEventListener('room_deleted', () => {
+        eventSource?.close()
+        stopPolling()
+        setRoom(null)
+        message.error('房间已解散，正在返回大厅')
+        navigate('/room')
+      })
+      for (const type of ROOM_EVENT_TYPES) {
+        eventSource.addEventListener(type, (event) => {
+          handleRoomEvent(JSON.parse((event as MessageEvent).data) as RoomEvent)
+        })
+      }
+      eventSource.onerror = () => {
+        if (eventSource?.readyState === EventSource.CLOSED) {
+          startPolling()
+        }
+      }
     }
 
+    let eventSource: EventSource | null = null
     prepare()
 
     return () => {
       active = false
+      eventSource?.close()
       if (pollIntervalRef.current) {
         clearInterval(pollIntervalRef.current)
         pollIntervalRef.current = null
       }
+      if (resyncTimerRef.current) {
+        clearTimeout(resyncTimerRef.current)
+        resyncTimerRef.current = null
+      }
     }
-  }, [initializing, roomId, username, login, fetchRoom, navigate, shouldPoll])
+  }, [initializing, roomId, username, login, fetchRoom, handleRoomEvent, navigate, shouldPoll])
 
   const handleStep = async () => {
     // 前端检查：AI配置必须锁定才能执行推理
@@ -159,7 +444,7 @@ export function useMultiplayerBattle() {
       const response = await axios.post(`${API_BASE_URL}/step`, {
         room_id: roomId,
         username
-      })
+      }, idempotencyHeaders())
       if (response.data.success) {
         message.success('AI已思考完成，请确认落子')
         setError(null) // 成功时清除错误
@@ -190,7 +475,7 @@ export function useMultiplayerBattle() {
       await axios.post(`${API_BASE_URL}/confirm_move`, {
         room_id: roomId,
         username
-      })
+      }, idempotencyHeaders())
       message.success('落子确认')
       await fetchRoom()
     } catch (error) {
@@ -224,7 +509,7 @@ export function useMultiplayerBattle() {
       const stepResponse = await axios.post(`${API_BASE_URL}/step`, {
         room_id: roomId,
         username
-      })
+      }, idempotencyHeaders())
       
       if (!stepResponse.data.success) {
         // AI思考失败，不自动重试，让用户手动处理
@@ -241,7 +526,7 @@ export function useMultiplayerBattle() {
       const confirmResponse = await axios.post(`${API_BASE_URL}/confirm_move`, {
         room_id: roomId,
         username
-      })
+      }, idempotencyHeaders())
 
       if (confirmResponse.data.success) {
         message.success('AI已完成落子')
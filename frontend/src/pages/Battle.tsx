@@ -98,7 +98,12 @@ function Battle() {
       })
 
       const result = response.data
-      const logMessage = result.log ?? `AI player ${player} 正在思考`
+      // 服务端在一次请求内重试，logs 为每次尝试的日志
+      const attemptLogs: string[] = result.logs?.length ? result.logs.slice(0, -1) : []
+      const logMessage = result.logs?.length ? result.logs[result.logs.length - 1] : (result.log ?? `AI player ${player} 正在思考`)
+      if (attemptLogs.length) {
+        setLogs(prev => [...prev, ...attemptLogs])
+      }
 
       if (result.error) {
         setLogs(prev => [...prev, logMessage])
@@ -21,6 +21,8 @@ interface LobbyRoom {
   owner?: string | null
 }
 
+const LOBBY_PAGE_SIZE = 50
+
 function formatRelativeTime(timestamp: number) {
   if (!timestamp) return '未知'
   const diff = Math.max(0, Date.now() / 1000 - timestamp)
@@ -34,6 +36,9 @@ function Room() {
   const navigate = useNavigate()
   const { username, initializing, loading: userLoading, login } = useUser()
   const [rooms, setRooms] = useState<LobbyRoom[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [myRoomId, setMyRoomId] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [roomsLoading, setRoomsLoading] = useState(true)
   const [creating, setCreating] = useState(false)
   const [joiningRoomId, setJoiningRoomId] = useState<string | null>(null)
@@ -58,9 +63,14 @@ function Room() {
       setRoomsLoading(true)
     }
     try {
-      const response = await axios.get(`${API_BASE_URL}/rooms`)
+      // 定时刷新只拉取第一页，已加载的更多房间在下次刷新时折叠
+      const response = await axios.get(`${API_BASE_URL}/rooms`, {
+        params: { limit: LOBBY_PAGE_SIZE, username: username || undefined },
+      })
       if (response.data.success) {
         setRooms(response.data.rooms)
+        setNextCursor(response.data.next_cursor ?? null)
+        setMyRoomId(response.data.current_room_id ?? null)
       }
     } catch (error) {
       console.error('获取房间列表失败', error)
@@ -70,7 +80,28 @@ function Room() {
         setRoomsLoading(false)
       }
     }
-  }, [])
+  }, [username])
+
+  const loadMoreRooms = useCallback(async () => {
+    if (!nextCursor) {
+      return
+    }
+    setLoadingMore(true)
+    try {
+      const response = await axios.get(`${API_BASE_URL}/rooms`, {
+        params: { limit: LOBBY_PAGE_SIZE, cursor: nextCursor },
+      })
+      if (response.data.success) {
+        setRooms((prev) => [...prev, ...response.data.rooms])
+        setNextCursor(response.data.next_cursor ?? null)
+      }
+    } catch (error) {
+      console.error('获取房间列表失败', error)
+      message.error('获取房间列表失败')
+    } finally {
+      setLoadingMore(false)
+    }
+  }, [nextCursor])
 
   useEffect(() => {
     if (initializing) {
@@ -87,9 +118,12 @@ function Room() {
     if (!username) {
       return null
     }
+    if (myRoomId) {
+      return myRoomId
+    }
     const existing = rooms.find((room) => room.players.includes(username))
     return existing ? existing.room_id : null
-  }, [rooms, username])
+  }, [rooms, username, myRoomId])
 
   const handleCreateOrEnterRoom = useCallback(async () => {
     if (!username) {
@@ -231,6 +265,11 @@ function Room() {
               ) : (
                 <List
                   dataSource={rooms}
+                  loadMore={nextCursor ? (
+                    <div style={{ textAlign: 'center', marginTop: 12 }}>
+                      <Button onClick={loadMoreRooms} loading={loadingMore}>加载更多</Button>
+                    </div>
+                  ) : null}
                   renderItem={(room) => {
                     const isMember = username ? room.players.includes(username) : false
                     const isOwner = isMember && room.owner === username